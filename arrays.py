@@ -0,0 +1,138 @@
+'''
+Typed numeric arrays, made with the `array` and `int_array` natives, and
+indexing for everything that can be indexed.
+'''
+import array
+import errors
+from errors import ErrorType
+from vectors import PloxVec, scalar
+from maps import PloxMap, get_entry, set_entry
+from ropes import Rope
+
+
+TYPECODES = ("d", "q")
+
+# what indexing a PloxArray may raise, engines go through the slow path then
+INDEX_ERRORS = (IndexError, TypeError, OverflowError)
+
+
+class PloxArray:
+	__slots__ = ("items", "typecode")
+
+	def __init__(self, items):
+		# an array.array, or a memoryview into one for a slice
+		self.items = items
+		self.typecode = items.typecode if type(items) is array.array else items.format
+
+
+	def __len__(self):
+		return len(self.items)
+
+
+	def __str__(self):
+		return "[" + ", ".join(map(str, self.items)) + "]"
+
+
+def zeros(typecode, size):
+	if type(size) is not int or size < 0:
+		raise ValueError(f"size must be a non-negative integer, got {size}")
+	# zeroed bytes are 0 and 0.0 for both typecodes, made without a Python loop
+	items = array.array(typecode)
+	items.frombytes(bytes(items.itemsize * size))
+	return PloxArray(items)
+
+
+def expect_array(value):
+	if type(value) is not PloxArray:
+		raise TypeError(f"expected an array, got {type(value).__name__}")
+	return value
+
+
+def append(arr, value):
+	items = expect_array(arr).items
+	if type(items) is not array.array:
+		raise TypeError("can't append to a slice")
+	try:
+		items.append(value)
+	except BufferError:
+		raise ValueError("can't append to an array while slices of it exist")
+
+
+def view(arr, start, end):
+	items = expect_array(arr).items
+	buffer = items if type(items) is memoryview else memoryview(items)
+	return PloxArray(buffer[start:end])
+
+
+def copy(arr):
+	arr = expect_array(arr)
+	items = array.array(arr.typecode)
+	# frombytes() only takes unsigned byte buffers
+	items.frombytes(memoryview(arr.items).cast("B"))
+	return PloxArray(items)
+
+
+def fill(arr, value):
+	arr = expect_array(arr)
+	items = arr.items
+	items[:] = array.array(arr.typecode, [value]) * len(items)
+
+
+# the reductions take a vec too
+def total(arr):
+	if type(arr) is PloxVec:
+		return scalar(arr.data.sum())
+	return sum(expect_array(arr).items)
+
+
+def smallest(arr):
+	if type(arr) is PloxVec:
+		return scalar(arr.data.min())
+	return min(expect_array(arr).items)
+
+
+def largest(arr):
+	if type(arr) is PloxVec:
+		return scalar(arr.data.max())
+	return max(expect_array(arr).items)
+
+
+def index_check(obj, index):
+	if type(obj) is not PloxArray and type(obj) is not PloxVec and type(obj) is not str:
+		errors.runtime_error(ErrorType.PloxTypeError, f"only arrays, vecs, maps and strings can be indexed, got {type(obj).__name__}")
+	if type(index) is not int:
+		errors.runtime_error(ErrorType.PloxTypeError, f"indexes must be integers, got {type(index).__name__}")
+	if not -len(obj) <= index < len(obj):
+		errors.runtime_error(ErrorType.PloxIndexError, f"index {index} out of range for length {len(obj)}")
+
+
+def get_index(obj, index):
+	if type(obj) is PloxMap:
+		return get_entry(obj, index)
+	if type(obj) is Rope:
+		obj = obj.flatten()
+	index_check(obj, index)
+	if type(obj) is str:
+		return obj[index]
+	if type(obj) is PloxVec:
+		return scalar(obj.data[index])
+	return obj.items[index]
+
+
+def set_index(obj, index, value):
+	if type(obj) is PloxMap:
+		return set_entry(obj, index, value)
+	if type(obj) is str or type(obj) is Rope:
+		errors.runtime_error(ErrorType.PloxTypeError, "strings can't be changed")
+	index_check(obj, index)
+	if type(obj) is PloxVec:
+		if type(value) is not int and type(value) is not float:
+			errors.runtime_error(ErrorType.PloxTypeError, f"can't store {value!r} in a vec")
+		obj.data[index] = value
+		return value
+
+	try:
+		obj.items[index] = value
+	except (TypeError, OverflowError) as e:
+		errors.runtime_error(ErrorType.PloxTypeError, f"can't store {value!r} in a '{obj.typecode}' array: {e}")
+	return value
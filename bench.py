@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+'''
+Runs the programs in benchmarks/ and reports their wall time and peak
+memory, compared against a stored baseline.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PLOX = os.path.join(ROOT, "plox.py")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_RUNS = 5
+# percent a benchmark's median may grow over the baseline's before it's flagged
+DEFAULT_THRESHOLD = 10.0
+
+
+class BenchmarkError(Exception):
+	pass
+
+
+def find_benchmarks(names=None):
+	benchmarks = list()
+	for file_name in sorted(os.listdir(BENCH_DIR)):
+		name, ext = os.path.splitext(file_name)
+		if ext == ".plox" and (not names or name in names):
+			benchmarks.append((name, os.path.join(BENCH_DIR, file_name)))
+
+	missing = set(names or ()) - set(name for name, _ in benchmarks)
+	if missing:
+		raise BenchmarkError(f"no such benchmark: {', '.join(sorted(missing))}")
+	return benchmarks
+
+
+def config_name(engine, optimize):
+	return engine + (" -O" if optimize else "")
+
+
+def run_once(path, engine, optimize):
+	'''
+	Runs the script once, returns the wall time in seconds and the peak
+	resident memory in MB (None where the platform can't tell).
+	'''
+	cmd = [sys.executable, PLOX, "--no-cache", "--engine", engine] + (["-O"] if optimize else []) + [path]
+
+	with tempfile.TemporaryFile() as stderr:
+		start = time.perf_counter()
+		proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+
+		peak = None
+		if hasattr(os, "wait4"):
+			# unlike getrusage(RUSAGE_CHILDREN), gives the peak of this child only
+			_, status, usage = os.wait4(proc.pid, 0)
+			proc.returncode = os.waitstatus_to_exitcode(status)
+			# kilobytes on Linux, bytes on macOS
+			peak = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+		else:
+			proc.wait()
+		elapsed = time.perf_counter() - start
+
+		if proc.returncode != 0:
+			stderr.seek(0)
+			message = stderr.read().decode(errors="replace").strip().splitlines()
+			raise BenchmarkError(f"{os.path.basename(path)} exited with {proc.returncode}: {message[-1] if message else ''}")
+
+	return elapsed, peak
+
+
+def measure(path, engine, optimize, runs):
+	times = list()
+	peaks = list()
+	for _ in range(runs):
+		elapsed, peak = run_once(path, engine, optimize)
+		times.append(elapsed)
+		if peak is not None:
+			peaks.append(peak)
+
+	return {
+		"mean": statistics.mean(times),
+		"median": statistics.median(times),
+		"stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+		"peak_mb": max(peaks) if peaks else None,
+	}
+
+
+def load_baseline(path):
+	try:
+		with open(path) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return dict()
+
+
+def save_baseline(path, baseline):
+	with open(path, "w") as f:
+		json.dump(baseline, f, indent=2, sort_keys=True)
+		f.write("\n")
+
+
+def run_suite(engine="tree", optimize=False, runs=DEFAULT_RUNS, names=None,
+		baseline_path=DEFAULT_BASELINE, threshold=DEFAULT_THRESHOLD, update_baseline=False):
+	'''
+	Runs the suite and prints a report, returns the exit status: 1 when a
+	benchmark failed or regressed past `threshold` percent, 0 otherwise.
+	'''
+	benchmarks = find_benchmarks(names)
+	config = config_name(engine, optimize)
+	baseline = load_baseline(baseline_path)
+	previous = baseline.get(config, dict())
+	results = dict()
+	status = 0
+
+	print(f"engine: {config}, {runs} run(s) each")
+	print(f"{'benchmark':<16}{'mean':>9}{'median':>9}{'stddev':>9}{'peak MB':>9}{'baseline':>10}{'change':>9}")
+
+	for name, path in benchmarks:
+		try:
+			result = measure(path, engine, optimize, runs)
+		except BenchmarkError as e:
+			print(f"{name:<16}FAILED: {e}")
+			status = 1
+			continue
+
+		results[name] = result
+		peak = f"{result['peak_mb']:.1f}" if result["peak_mb"] is not None else "-"
+		line = f"{name:<16}{result['mean']:>8.3f}s{result['median']:>8.3f}s{result['stddev']:>8.3f}s{peak:>9}"
+
+		if name in previous:
+			base = previous[name]["median"]
+			change = (result["median"] / base - 1) * 100
+			line += f"{base:>9.3f}s{change:>+8.1f}%"
+			if change > threshold:
+				line += "  REGRESSION"
+				status = 1
+		print(line)
+
+	if update_baseline:
+		previous.update(results)
+		baseline[config] = previous
+		save_baseline(baseline_path, baseline)
+		print(f"baseline for '{config}' saved to {baseline_path}")
+
+	return status
+
+
+def main(argv=None):
+	arg_parser = argparse.ArgumentParser(prog="bench", description="run the plox benchmark suite")
+	arg_parser.add_argument("names", nargs="*", help="benchmarks to run (file names without .plox), all when omitted")
+	arg_parser.add_argument("--engine", choices=("tree", "closure", "vm"), default="tree", help="execution engine to benchmark")
+	arg_parser.add_argument("-O", dest="optimize", action="store_true", help="run the scripts with -O")
+	arg_parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"runs per benchmark (default {DEFAULT_RUNS})")
+	arg_parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON file holding the baseline results")
+	arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+		help=f"percent slowdown of the median flagged as a regression (default {DEFAULT_THRESHOLD:g})")
+	arg_parser.add_argument("--save-baseline", action="store_true", help="store this run's results as the new baseline")
+	args = arg_parser.parse_args(argv)
+
+	if args.runs < 1:
+		arg_parser.error("--runs must be at least 1")
+
+	try:
+		return run_suite(args.engine, args.optimize, args.runs, args.names, args.baseline, args.threshold, args.save_baseline)
+	except BenchmarkError as e:
+		print(e)
+		return 2
+
+
+if __name__ == "__main__":
+	sys.exit(main())
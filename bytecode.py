@@ -0,0 +1,202 @@
+from array import array
+from enum import IntEnum
+from typing import List
+from instance import PropertyCache
+
+
+class OpCode(IntEnum):
+	CONSTANT = 0       # u16 constant index
+	NIL = 1
+	TRUE = 2
+	FALSE = 3
+	POP = 4
+	GET_LOCAL = 5      # u8 slot
+	SET_LOCAL = 6      # u8 slot
+	GET_GLOBAL = 7     # u16 name constant
+	DEFINE_GLOBAL = 8  # u16 name constant
+	SET_GLOBAL = 9     # u16 name constant
+	GET_UPVALUE = 10   # u8 upvalue index
+	SET_UPVALUE = 11   # u8 upvalue index
+	GET_PROPERTY = 12  # u16 PropertyCache constant
+	SET_PROPERTY = 13  # u16 PropertyCache constant
+	EQUAL = 14
+	NOT_EQUAL = 15
+	GREATER = 16
+	GREATER_EQUAL = 17
+	LESS = 18
+	LESS_EQUAL = 19
+	ADD = 20
+	SUBTRACT = 21
+	MULTIPLY = 22
+	DIVIDE = 23
+	BIT_AND = 24
+	BIT_OR = 25
+	BIT_XOR = 26
+	SHIFT_LEFT = 27
+	SHIFT_RIGHT = 28
+	NOT = 29
+	NEGATE = 30
+	BIT_NEGATE = 31
+	OR = 32
+	AND = 33
+	PRINT = 34
+	JUMP = 35          # u16 forward offset
+	JUMP_IF_FALSE = 36 # u16 forward offset, pops the condition
+	LOOP = 37          # u16 backward offset
+	CALL = 38          # u8 argument count
+	CLOSURE = 39       # u16 function constant, then (u8 is_local, u8 index) per upvalue
+	CLOSE_UPVALUE = 40
+	RETURN = 41
+	CLASS = 42         # u16 name constant
+	TAIL_CALL = 43     # u8 argument count, replaces the current frame
+	METHOD = 44        # u16 name constant, adds the closure on top to the class below it
+	GET_INDEX = 45     # pops index and object, pushes the element
+	SET_INDEX = 46     # pops value, index and object, pushes the value
+	BUILD_MAP = 47     # u16 entry count, pops that many keys and values in turn
+
+
+# size in bytes of the operands following each opcode
+OPERAND_SIZES = {op: 0 for op in OpCode}
+OPERAND_SIZES.update({
+	OpCode.CONSTANT: 2,
+	OpCode.GET_LOCAL: 1,
+	OpCode.SET_LOCAL: 1,
+	OpCode.GET_GLOBAL: 2,
+	OpCode.DEFINE_GLOBAL: 2,
+	OpCode.SET_GLOBAL: 2,
+	OpCode.GET_UPVALUE: 1,
+	OpCode.SET_UPVALUE: 1,
+	OpCode.GET_PROPERTY: 2,
+	OpCode.SET_PROPERTY: 2,
+	OpCode.JUMP: 2,
+	OpCode.JUMP_IF_FALSE: 2,
+	OpCode.LOOP: 2,
+	OpCode.CALL: 1,
+	OpCode.TAIL_CALL: 1,
+	OpCode.CLOSURE: 2,
+	OpCode.CLASS: 2,
+	OpCode.METHOD: 2,
+	OpCode.BUILD_MAP: 2,
+})
+
+
+class Chunk:
+	'''
+	Flat instruction stream of one function plus its constant pool.
+	'''
+	def __init__(self):
+		self.code = array('B')
+		self.constants: List[object] = list()
+		self.constant_index = dict()
+		# offset of a CALL/TAIL_CALL instruction -> callee name, for error messages
+		self.call_names = dict()
+
+
+	def write(self, byte):
+		self.code.append(byte)
+
+
+	def write_u16(self, value):
+		self.code.append((value >> 8) & 0xff)
+		self.code.append(value & 0xff)
+
+
+	def add_constant(self, value):
+		# keyed on the type as well, 1, 1.0 and true are different constants,
+		# functions and the caches of property accesses are never shared
+		if isinstance(value, (BytecodeFunction, PropertyCache)):
+			key = (type(value), id(value))
+		else:
+			key = (type(value), value)
+		index = self.constant_index.get(key)
+		if index is None:
+			index = len(self.constants)
+			self.constants.append(value)
+			self.constant_index[key] = index
+		return index
+
+
+	def read_u16(self, offset):
+		return (self.code[offset] << 8) | self.code[offset + 1]
+
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state["constant_index"]
+		return state
+
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.constant_index = dict()
+
+
+class BytecodeFunction:
+	'''
+	Compiled function: the chunk of its body and what it captures.
+	'''
+	def __init__(self, name, arity):
+		self.name = name
+		self.arity = arity
+		self.upvalue_count = 0
+		self.chunk = Chunk()
+
+
+	def __str__(self):
+		return f'<function {self.name if self.name else "anonymous"}>'
+
+
+def disassemble(function: BytecodeFunction, out=print):
+	'''
+	Prints the instructions of `function` followed by every function
+	nested in its constant pool.
+	'''
+	title = function.name if function.name else "anonymous"
+	out(f"== {title} (arity {function.arity}, upvalues {function.upvalue_count}) ==")
+
+	chunk = function.chunk
+	offset = 0
+	while offset < len(chunk.code):
+		offset = disassemble_instruction(chunk, offset, out)
+
+	for constant in chunk.constants:
+		if isinstance(constant, BytecodeFunction):
+			out("")
+			disassemble(constant, out)
+
+
+def disassemble_instruction(chunk: Chunk, offset: int, out=print):
+	op = OpCode(chunk.code[offset])
+	size = OPERAND_SIZES[op]
+	text = f"{offset:04d}  {op.name:<16}"
+
+	if op in (OpCode.JUMP, OpCode.JUMP_IF_FALSE):
+		jump = chunk.read_u16(offset + 1)
+		text += f"{offset} -> {offset + 3 + jump}"
+	elif op == OpCode.LOOP:
+		jump = chunk.read_u16(offset + 1)
+		text += f"{offset} -> {offset + 3 - jump}"
+	elif op == OpCode.CLOSURE:
+		index = chunk.read_u16(offset + 1)
+		function = chunk.constants[index]
+		text += f"{index:<4} {function}"
+		out(text)
+		offset += 3
+		for _ in range(function.upvalue_count):
+			is_local = chunk.code[offset]
+			index = chunk.code[offset + 1]
+			out(f"{offset:04d}    |{'':<14}{'local' if is_local else 'upvalue'} {index}")
+			offset += 2
+		return offset
+	elif op == OpCode.BUILD_MAP:
+		text += f"{chunk.read_u16(offset + 1)}"
+	elif size == 2:
+		index = chunk.read_u16(offset + 1)
+		text += f"{index:<4} {chunk.constants[index]!r}"
+	elif size == 1:
+		text += f"{chunk.code[offset + 1]}"
+		if op in (OpCode.CALL, OpCode.TAIL_CALL) and offset in chunk.call_names:
+			text += f"    ; {chunk.call_names[offset]}"
+
+	out(text.rstrip())
+	return offset + 1 + size
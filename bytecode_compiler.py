@@ -0,0 +1,511 @@
+import sys
+from syntax_tree import *
+from bytecode import OpCode, Chunk, BytecodeFunction
+from instance import PropertyCache
+from typing import List, Tuple
+
+
+class CompileError(Exception):
+	pass
+
+
+class Local:
+	def __init__(self, name, depth):
+		self.name = name
+		self.depth = depth
+		self.captured = False
+
+
+class FunctionState:
+	'''
+	Book-keeping for the function currently being compiled.
+	'''
+	def __init__(self, enclosing, function: BytecodeFunction, method=False):
+		self.enclosing = enclosing
+		self.function = function
+		# slot 0 holds the function being called, or the instance for a method
+		self.locals: List[Local] = [Local("this" if method else "", 0)]
+		self.upvalues: List[Tuple[bool, int]] = list()
+		self.scope_depth = 0
+		# init returns its instance, whatever its return statements say
+		self.initializer = method and function.name == "init"
+
+
+class BytecodeCompiler(ExprVisitor, StmtVisitor):
+	'''
+	Compiles the statements returned by Parser.parse() into bytecode.
+
+	Top level variables are globals looked up by name, everything declared
+	inside a block or function lives in a stack slot. Variables captured by
+	closures are reached through upvalues.
+	'''
+	MAX_LOCALS = 256
+	MAX_CONSTANTS = 1 << 16
+	MAX_JUMP = (1 << 16) - 1
+
+	def __init__(self):
+		self.state: FunctionState = None
+
+
+	def compile(self, stmts: List[Stmt]) -> BytecodeFunction:
+		script = BytecodeFunction("script", 0)
+		self.state = FunctionState(None, script)
+
+		for stmt in stmts:
+			self.compile_stmt(stmt)
+
+		self.emit(OpCode.NIL)
+		self.emit(OpCode.RETURN)
+		return script
+
+
+	def compile_stmt(self, stmt):
+		stmt.accept(self)
+
+
+	def compile_expr(self, expr):
+		expr.accept(self)
+
+
+	# emitting part
+	@property
+	def chunk(self) -> Chunk:
+		return self.state.function.chunk
+
+
+	def emit(self, *data):
+		for byte in data:
+			self.chunk.write(byte)
+
+
+	def emit_u16(self, op, value):
+		self.chunk.write(op)
+		self.chunk.write_u16(value)
+
+
+	def make_constant(self, value):
+		index = self.chunk.add_constant(value)
+		if index >= self.MAX_CONSTANTS:
+			raise CompileError("Too many constants in one function")
+		return index
+
+
+	def emit_constant(self, value):
+		self.emit_u16(OpCode.CONSTANT, self.make_constant(value))
+
+
+	def emit_jump(self, op):
+		self.chunk.write(op)
+		self.chunk.write_u16(0xffff)
+		return len(self.chunk.code) - 2
+
+
+	def patch_jump(self, offset):
+		jump = len(self.chunk.code) - offset - 2
+		if jump > self.MAX_JUMP:
+			raise CompileError("Too much code to jump over")
+
+		self.chunk.code[offset] = (jump >> 8) & 0xff
+		self.chunk.code[offset + 1] = jump & 0xff
+
+
+	def emit_loop(self, loop_start):
+		jump = len(self.chunk.code) + 3 - loop_start
+		if jump > self.MAX_JUMP:
+			raise CompileError("Loop body too large")
+		self.emit_u16(OpCode.LOOP, jump)
+
+
+	# variables part
+	def begin_scope(self):
+		self.state.scope_depth += 1
+
+
+	def end_scope(self):
+		state = self.state
+		state.scope_depth -= 1
+
+		while state.locals and state.locals[-1].depth > state.scope_depth:
+			if state.locals[-1].captured:
+				self.emit(OpCode.CLOSE_UPVALUE)
+			else:
+				self.emit(OpCode.POP)
+			state.locals.pop()
+
+
+	def add_local(self, name):
+		if len(self.state.locals) >= self.MAX_LOCALS:
+			raise CompileError("Too many local variables in function")
+		self.state.locals.append(Local(name, self.state.scope_depth))
+
+
+	def resolve_local(self, state, name):
+		for slot in range(len(state.locals) - 1, -1, -1):
+			if state.locals[slot].name == name:
+				return slot
+		return -1
+
+
+	def resolve_upvalue(self, state, name):
+		if state.enclosing is None:
+			return -1
+
+		slot = self.resolve_local(state.enclosing, name)
+		if slot != -1:
+			state.enclosing.locals[slot].captured = True
+			return self.add_upvalue(state, True, slot)
+
+		index = self.resolve_upvalue(state.enclosing, name)
+		if index != -1:
+			return self.add_upvalue(state, False, index)
+
+		return -1
+
+
+	def add_upvalue(self, state, is_local, index):
+		upvalue = (is_local, index)
+		if upvalue in state.upvalues:
+			return state.upvalues.index(upvalue)
+
+		if len(state.upvalues) >= 256:
+			raise CompileError("Too many closure variables in function")
+
+		state.upvalues.append(upvalue)
+		state.function.upvalue_count = len(state.upvalues)
+		return len(state.upvalues) - 1
+
+
+	def declare_variable(self, name):
+		'''
+		Binds the value on top of the stack to `name` in the current scope.
+		'''
+		state = self.state
+		if state.scope_depth == 0:
+			self.emit_u16(OpCode.DEFINE_GLOBAL, self.make_constant(name))
+			return
+
+		# redeclaring a variable in the same scope overwrites it
+		for local in reversed(state.locals):
+			if local.depth < state.scope_depth:
+				break
+			if local.name == name:
+				self.emit(OpCode.SET_LOCAL, state.locals.index(local))
+				self.emit(OpCode.POP)
+				return
+
+		self.add_local(name)
+
+
+	def hoist_functions(self, stmts):
+		'''
+		Gives the functions declared directly in a local scope their slots up
+		front, so they can call each other whatever order they're declared in.
+		'''
+		declared = set(local.name for local in self.state.locals if local.depth == self.state.scope_depth)
+		for stmt in stmts:
+			if isinstance(stmt, FunctionDeclStmt) and stmt.name.lexeme not in declared:
+				declared.add(stmt.name.lexeme)
+				self.emit(OpCode.NIL)
+				self.add_local(stmt.name.lexeme)
+
+
+	def hoist_branch_locals(self, stmt):
+		'''
+		Gives the variables declared by an unbraced if/while body their slots
+		in the enclosing scope before the condition runs, nil until the body
+		does, the way the resolver scopes them for the other engines.
+		'''
+		if self.state.scope_depth == 0:
+			return
+
+		declared = set(local.name for local in self.state.locals if local.depth == self.state.scope_depth)
+		for name in branch_declarations(stmt):
+			if name not in declared:
+				declared.add(name)
+				self.emit(OpCode.NIL)
+				self.add_local(name)
+
+
+	def get_variable(self, name):
+		slot = self.resolve_local(self.state, name)
+		if slot != -1:
+			self.emit(OpCode.GET_LOCAL, slot)
+			return
+
+		index = self.resolve_upvalue(self.state, name)
+		if index != -1:
+			self.emit(OpCode.GET_UPVALUE, index)
+			return
+
+		self.emit_u16(OpCode.GET_GLOBAL, self.make_constant(name))
+
+
+	def set_variable(self, name):
+		slot = self.resolve_local(self.state, name)
+		if slot != -1:
+			self.emit(OpCode.SET_LOCAL, slot)
+			return
+
+		index = self.resolve_upvalue(self.state, name)
+		if index != -1:
+			self.emit(OpCode.SET_UPVALUE, index)
+			return
+
+		self.emit_u16(OpCode.SET_GLOBAL, self.make_constant(name))
+
+
+	def compile_function(self, name, params, body, method=False):
+		function = BytecodeFunction(name, len(params))
+		self.state = FunctionState(self.state, function, method)
+		self.begin_scope()
+
+		for param in params:
+			self.add_local(param.lexeme)
+
+		self.hoist_functions(body)
+		for stmt in body:
+			self.compile_stmt(stmt)
+
+		self.emit_return_nil()
+
+		state = self.state
+		self.state = state.enclosing
+
+		self.emit_u16(OpCode.CLOSURE, self.make_constant(function))
+		for is_local, index in state.upvalues:
+			self.emit(1 if is_local else 0, index)
+
+
+	def emit_return_nil(self):
+		if self.state.initializer:
+			self.emit(OpCode.GET_LOCAL, 0)
+		else:
+			self.emit(OpCode.NIL)
+		self.emit(OpCode.RETURN)
+
+
+	# expressions part
+	def visit_literal_expr(self, literal):
+		if literal.value is None:
+			self.emit(OpCode.NIL)
+		elif literal.value is True:
+			self.emit(OpCode.TRUE)
+		elif literal.value is False:
+			self.emit(OpCode.FALSE)
+		else:
+			self.emit_constant(literal.value)
+
+
+	def visit_grouping_expr(self, group):
+		self.compile_expr(group.expr)
+
+
+	def visit_variable_expr(self, var):
+		self.get_variable(var.name.lexeme)
+
+
+	def visit_assign_expr(self, assign):
+		self.compile_expr(assign.value)
+		self.set_variable(assign.name.lexeme)
+
+
+	UNARY_OPS = {
+		TokenType.MINUS: OpCode.NEGATE,
+		TokenType.BIT_NEGATE: OpCode.BIT_NEGATE,
+		TokenType.NOT: OpCode.NOT,
+	}
+
+	def visit_unary_expr(self, unary):
+		self.compile_expr(unary.right)
+		self.emit(self.UNARY_OPS[unary.operator.token_type])
+
+
+	BINARY_OPS = {
+		TokenType.PLUS: OpCode.ADD,
+		TokenType.MINUS: OpCode.SUBTRACT,
+		TokenType.STAR: OpCode.MULTIPLY,
+		TokenType.SLASH: OpCode.DIVIDE,
+		TokenType.BIT_AND: OpCode.BIT_AND,
+		TokenType.BIT_OR: OpCode.BIT_OR,
+		TokenType.BIT_XOR: OpCode.BIT_XOR,
+		TokenType.BIT_SHIFT_LEFT: OpCode.SHIFT_LEFT,
+		TokenType.BIT_SHIFT_RIGHT: OpCode.SHIFT_RIGHT,
+		TokenType.GREATER: OpCode.GREATER,
+		TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+		TokenType.LESS: OpCode.LESS,
+		TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+		TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+		TokenType.NOT_EQUAL: OpCode.NOT_EQUAL,
+	}
+
+	def visit_binary_expr(self, binary):
+		self.compile_expr(binary.left_expr)
+		self.compile_expr(binary.right_expr)
+		self.emit(self.BINARY_OPS[binary.operator.token_type])
+
+
+	def visit_logical_expr(self, logical):
+		# both operands are always evaluated, like in the tree-walker
+		self.compile_expr(logical.left_expr)
+		self.compile_expr(logical.right_expr)
+		if logical.operator.token_type == TokenType.OR:
+			self.emit(OpCode.OR)
+		else:
+			self.emit(OpCode.AND)
+
+
+	def visit_func_call_expr(self, func_call_expr):
+		self.compile_call(func_call_expr, OpCode.CALL)
+
+
+	def compile_call(self, func_call_expr, op):
+		self.compile_expr(func_call_expr.callee)
+		for arg in func_call_expr.arguments:
+			self.compile_expr(arg)
+
+		if len(func_call_expr.arguments) > 255:
+			raise CompileError("Can't have more than 255 arguments")
+
+		if isinstance(func_call_expr.callee, (VariableExpr, ClassPropertyGetExpr, ThisExpr)):
+			self.chunk.call_names[len(self.chunk.code)] = func_call_expr.callee.name.lexeme
+		self.emit(op, len(func_call_expr.arguments))
+
+
+	def visit_this_expr(self, this):
+		self.get_variable("this")
+
+
+	def visit_anon_func_expr(self, anon):
+		self.compile_function(None, anon.parameters, anon.body)
+
+
+	def visit_class_prop_get_expr(self, get):
+		self.compile_expr(get.obj)
+		self.emit_u16(OpCode.GET_PROPERTY, self.make_constant(PropertyCache(get.name.lexeme)))
+
+
+	def visit_class_prop_set_expr(self, set):
+		self.compile_expr(set.obj)
+		self.compile_expr(set.value)
+		self.emit_u16(OpCode.SET_PROPERTY, self.make_constant(PropertyCache(set.name.lexeme)))
+
+
+	def visit_index_get_expr(self, get):
+		self.compile_expr(get.obj)
+		self.compile_expr(get.index)
+		self.emit(OpCode.GET_INDEX)
+
+
+	def visit_index_set_expr(self, set):
+		self.compile_expr(set.obj)
+		self.compile_expr(set.index)
+		self.compile_expr(set.value)
+		self.emit(OpCode.SET_INDEX)
+
+
+	def visit_map_expr(self, map):
+		if len(map.keys) > 0xffff:
+			raise CompileError("Too many entries in one map literal")
+		for key, value in zip(map.keys, map.values):
+			self.compile_expr(key)
+			self.compile_expr(value)
+		self.emit_u16(OpCode.BUILD_MAP, len(map.keys))
+
+
+	# statements part
+	def visit_print_stmt(self, printt):
+		self.compile_expr(printt.expr)
+		self.emit(OpCode.PRINT)
+
+
+	def visit_expr_stmt(self, expr_stmt):
+		self.compile_expr(expr_stmt.expr)
+		self.emit(OpCode.POP)
+
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is None:
+			self.emit_constant("undefined")
+		else:
+			self.compile_expr(var_decl.init)
+		self.declare_variable(var_decl.name)
+
+
+	def visit_block_stmt(self, block):
+		self.begin_scope()
+		self.hoist_functions(block.statements)
+		for stmt in block.statements:
+			self.compile_stmt(stmt)
+		self.end_scope()
+
+
+	def visit_if_stmt(self, if_stmt):
+		self.hoist_branch_locals(if_stmt)
+		self.compile_expr(if_stmt.condition)
+		else_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+		self.compile_stmt(if_stmt.if_true)
+
+		if if_stmt.if_false is None:
+			self.patch_jump(else_jump)
+			return
+
+		end_jump = self.emit_jump(OpCode.JUMP)
+		self.patch_jump(else_jump)
+		self.compile_stmt(if_stmt.if_false)
+		self.patch_jump(end_jump)
+
+
+	def visit_while_stmt(self, while_stmt):
+		self.hoist_branch_locals(while_stmt)
+		loop_start = len(self.chunk.code)
+		self.compile_expr(while_stmt.condition)
+		exit_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+		self.compile_stmt(while_stmt.body)
+		self.emit_loop(loop_start)
+		self.patch_jump(exit_jump)
+
+
+	def visit_func_decl_stmt(self, func_decl):
+		name = func_decl.name.lexeme
+		if self.state.scope_depth == 0:
+			self.compile_function(name, func_decl.parameters, func_decl.body)
+			self.emit_u16(OpCode.DEFINE_GLOBAL, self.make_constant(name))
+			return
+
+		# hoisted by the enclosing block, so the function can call itself
+		self.compile_function(name, func_decl.parameters, func_decl.body)
+		self.declare_variable(name)
+
+
+	def visit_return_stmt(self, ret):
+		if self.state.initializer:
+			if ret.value is not None:
+				self.compile_expr(ret.value)
+				self.emit(OpCode.POP)
+			self.emit_return_nil()
+			return
+
+		if ret.value is None:
+			self.emit(OpCode.NIL)
+		elif ret.tail_call:
+			# natives called this way leave their result for the RETURN below
+			self.compile_call(ret.value, OpCode.TAIL_CALL)
+		else:
+			self.compile_expr(ret.value)
+		self.emit(OpCode.RETURN)
+
+
+	def visit_class_decl_stmt(self, cls):
+		name = cls.name.lexeme
+		self.emit_u16(OpCode.CLASS, self.make_constant(name))
+		self.declare_variable(name)
+
+		if not cls.funcs:
+			return
+
+		# the class goes back on the stack while its methods are added to it
+		self.get_variable(name)
+		for method in cls.funcs:
+			self.compile_function(method.name.lexeme, method.parameters, method.body, method=True)
+			self.emit_u16(OpCode.METHOD, self.make_constant(method.name.lexeme))
+		self.emit(OpCode.POP)
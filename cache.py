@@ -0,0 +1,111 @@
+'''
+On-disk cache of parsed and resolved programs, one entry per script
+in `__ploxcache__` next to it or under `--cache-dir`.
+'''
+import os
+import sys
+import gc
+import stat
+import pickle
+import hashlib
+
+
+CACHE_DIR_NAME = "__ploxcache__"
+MAGIC = b"PLOXCACHE"
+
+
+def source_hash(program: str):
+	return hashlib.sha256(program.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def cache_path(script_path, cache_dir=None):
+	script_path = os.path.abspath(script_path)
+	script_dir, script_name = os.path.split(script_path)
+
+	if cache_dir is None:
+		directory = os.path.join(script_dir, CACHE_DIR_NAME)
+	else:
+		# mirror the script's directory so equally named scripts don't collide
+		directory = os.path.join(cache_dir, os.path.splitdrive(script_dir)[1].lstrip(os.sep))
+
+	return os.path.join(directory, script_name + ".pickle")
+
+
+def trusted(st):
+	'''
+	True when `st` is the stat of a file or directory only the current user
+	could have written. Unpickling runs code, so nothing else is loaded.
+	'''
+	if not hasattr(os, "getuid"):
+		# no owners to check on Windows
+		return True
+	return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+# first line of an entry, one built by another version or from other source is stale
+def make_header(version, digest):
+	return b" ".join((MAGIC, version.encode(), digest.encode())) + b"\n"
+
+
+def load(script_path, program, version, cache_dir=None):
+	'''
+	Returns the cached statements for `program` or None when there's no
+	usable entry.
+	'''
+	path = cache_path(script_path, cache_dir)
+	header = make_header(version, source_hash(program))
+
+	gc_enabled = gc.isenabled()
+	try:
+		with open(path, "rb") as f:
+			if not trusted(os.fstat(f.fileno())) or not trusted(os.stat(os.path.dirname(path))):
+				return None
+			if f.readline() != header:
+				return None
+			# unpickling only creates objects, letting the collector scan them
+			# all over and over makes loading big programs several times slower
+			gc.disable()
+			return pickle.load(f)
+	except OSError:
+		return None
+	except Exception:
+		# truncated or otherwise corrupt entry, it gets rewritten after parsing
+		return None
+	finally:
+		if gc_enabled:
+			gc.enable()
+
+
+def store(script_path, program, version, stmts, cache_dir=None):
+	'''
+	Writes `stmts` to the cache. The entry is written to a temporary file
+	first and moved in place, so concurrent runs never see half an entry.
+	Failing to write the cache never fails the run.
+	'''
+	path = cache_path(script_path, cache_dir)
+	header = make_header(version, source_hash(program))
+
+	try:
+		payload = pickle.dumps(stmts, pickle.HIGHEST_PROTOCOL)
+	except (RecursionError, pickle.PicklingError):
+		# very deeply nested syntax trees are just not cached
+		return
+
+	tmp_path = f"{path}.{os.getpid()}.tmp"
+	try:
+		# not writable by others whatever the umask, or load() won't trust it
+		os.makedirs(os.path.dirname(path), mode=0o755, exist_ok=True)
+		if not trusted(os.stat(os.path.dirname(path))):
+			# someone else's directory, load() would ignore the entry anyway
+			return
+		try:
+			with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644), "wb") as f:
+				f.write(header)
+				f.write(payload)
+			os.replace(tmp_path, path)
+		except BaseException:
+			if os.path.exists(tmp_path):
+				os.unlink(tmp_path)
+			raise
+	except OSError as e:
+		sys.stderr.write(f"warning: could not write cache {path}: {e}\n")
@@ -1,35 +1,33 @@
-from interpreter import Interpreter
 from environment import Environment
+from instance import PloxInstance
 from typing import List
 import sys
 
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        super().__init__("")
-        self.value = value
+# what a statement which ran a `return` gives back, ifs, loops and blocks
+# pass it on up to the function call, which finds the value in
+# Interpreter.return_value. Every other statement gives back None.
+RETURN = object()
 
+# called with the function a tail call switches to, set by the profiler
+on_tail_call = None
 
-class PloxInstance():
-    def __init__(self, klass):
-        self.klass = klass
-        self.fields = dict()
 
+class TailCall:
+    '''
+    Returned by `return f(...);` when f is a PloxFunction, the function
+    returning runs f in its own call instead of nesting another one.
+    '''
+    __slots__ = ("function", "arguments")
 
-    def get(self, name):
-        if name in self.fields:
-            return self.fields[name]
-
-        print(f"Undefined property '{name}'")
-
-
-    def set(self, name, value):
-        self.fields[name] = value
+    def __init__(self, function, arguments):
+        self.function = function
+        self.arguments = arguments
 
 
 # callable interface
 class PloxCallable:
-    def call(self, interp: Interpreter, args: List[object]):
+    def call(self, interp, args: List[object]):
         pass
 
     def arity(self):
@@ -42,22 +40,35 @@ class PloxFunction(PloxCallable):
         self.closure = closure
 
 
-    def call(self, interp: Interpreter, args: List[object]):
-        if len(args) != self.arity():
-            print(f'Expected {self.arity()} arguments but got {len(args)}');
-            sys.exit(10)
+    def call(self, interp, args: List[object]):
+        function = self
+        # tail calls loop here, so they take no more Python stack than one call
+        while True:
+            declaration = function.declaration
+            if len(args) != len(declaration.parameters):
+                print(f'Expected {function.arity()} arguments but got {len(args)}');
+                sys.exit(10)
+
+            env = Environment(function.closure, declaration.frame_size)
+            env.values[:len(args)] = args
 
-        env = Environment(enclosing=self.closure)
+            if interp.execute_block(declaration.body, env) is not RETURN:
+                return None
 
-        for i, arg in enumerate(args):
-            env.declare(self.declaration.parameters[i].lexeme, arg)
+            value = interp.return_value
+            if type(value) is not TailCall:
+                return value
+            function = value.function
+            args = value.arguments
+            if on_tail_call is not None:
+                on_tail_call(function)
 
-        try:
-            interp.execute_block(self.declaration.body, env)
-        except ReturnException as e:
-            return e.value
 
-        return None
+    def bind(self, instance):
+        # the frame the resolver put around methods, holding `this`
+        env = Environment(self.closure, 1)
+        env.values[0] = instance
+        return PloxFunction(self.declaration, env)
 
 
     def arity(self):
@@ -69,14 +80,30 @@ class PloxFunction(PloxCallable):
 
 
 class PloxClass(PloxCallable):
-    def __init__(self, name):
+    def __init__(self, name, methods=None):
         self.name = name
+        # method name -> method, bound to an instance when read through it
+        self.methods = methods if methods is not None else dict()
 
 
     def call(self, interp, args):
         instance = PloxInstance(self)
+
+        init = self.methods.get("init")
+        if init is not None:
+            # whatever init returns, the class call gives the instance
+            init.bind(instance).call(interp, args)
+        elif len(args) != 0:
+            print(f'Expected 0 arguments but got {len(args)}')
+            sys.exit(10)
+
         return instance
 
 
+    def arity(self):
+        init = self.methods.get("init")
+        return init.arity() if init is not None else 0
+
+
     def __str__(self):
         return f'<class {self.name}>'
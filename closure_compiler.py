@@ -0,0 +1,538 @@
+import sys
+from syntax_tree import *
+from environment import Environment
+from operators import PLAIN_NUMERIC_OPERATORS
+from interpreter import Interpreter, callee_name
+from events import running
+from callable import PloxCallable, PloxFunction, PloxClass, TailCall, RETURN
+from globals import NativeFunction, NATIVE_ERRORS
+from instance import PloxInstance
+from arrays import PloxArray, INDEX_ERRORS, get_index, set_index
+from maps import PloxMap, make_map
+from typing import List
+
+
+class ClosureCompiler(ExprVisitor, StmtVisitor):
+	'''
+	Walks the syntax tree once and turns every node into a Python closure.
+
+	Expression closures take no arguments and return the value of the
+	expression, statement closures take no arguments and return None, or
+	RETURN once a `return` ran, like the interpreter's statements.
+	The closures read and write variables through `interp.var_env`, so
+	they share environments, functions and classes with the tree-walker.
+	'''
+	def __init__(self, interp: Interpreter):
+		self.interp = interp
+		# set while sampling to a dict, id of a statement's code -> (code, line)
+		self.lines = None
+
+
+	def compile(self, node):
+		compiled = node.accept(self)
+		if compiled is None:
+			# node kinds without a specialized closure are walked by the interpreter
+			interp = self.interp
+			return lambda: node.accept(interp)
+		return compiled
+
+
+	def compile_block(self, stmts: List[Stmt]):
+		compiled = [self.compile(stmt) for stmt in stmts]
+
+		if self.lines is not None:
+			for stmt, stmt_fn in zip(stmts, compiled):
+				self.track_line(stmt_fn, stmt.line)
+
+		if len(compiled) == 0:
+			return lambda: None
+
+		if len(compiled) == 1:
+			return compiled[0]
+
+		if len(compiled) == 2:
+			first, second = compiled
+			def run_two():
+				return first() or second()
+			return run_two
+
+		def run_all():
+			for stmt in compiled:
+				if stmt() is not None:
+					return RETURN
+			return None
+		return run_all
+
+
+	def track_line(self, stmt_fn, line):
+		'''
+		Gives a statement's closure a code object of its own, which the
+		sampler finds its line by. Unlike a wrapper it costs nothing to run.
+		'''
+		lines = self.lines
+		if id(stmt_fn.__code__) not in lines:
+			stmt_fn.__code__ = stmt_fn.__code__.replace()
+			lines[id(stmt_fn.__code__)] = (stmt_fn.__code__, line)
+
+
+	# expressions part
+	def visit_literal_expr(self, literal):
+		value = literal.value
+		return lambda: value
+
+
+	def visit_grouping_expr(self, group):
+		return self.compile(group.expr)
+
+
+	def visit_variable_expr(self, var):
+		interp = self.interp
+		slot = var.slot
+
+		if var.depth is None:
+			name = var.name.lexeme
+			return lambda: interp.globals.get_var_value(name)
+
+		if var.depth == 0:
+			return lambda: interp.var_env.values[slot]
+
+		if var.depth == 1:
+			return lambda: interp.var_env.enclosing.values[slot]
+
+		depth = var.depth
+		return lambda: interp.var_env.ancestor(depth).values[slot]
+
+
+	def visit_assign_expr(self, assign):
+		interp = self.interp
+		slot = assign.slot
+		value_fn = self.compile(assign.value)
+
+		if assign.depth is None:
+			name = assign.name.lexeme
+			def assign_global():
+				value = value_fn()
+				interp.globals.assign(name, value)
+				return value
+			return assign_global
+
+		if assign.depth == 0:
+			def assign_local():
+				value = interp.var_env.values[slot] = value_fn()
+				return value
+			return assign_local
+
+		depth = assign.depth
+		def assign_var():
+			value = interp.var_env.ancestor(depth).values[slot] = value_fn()
+			return value
+		return assign_var
+
+
+	def visit_unary_expr(self, unary):
+		right = self.compile(unary.right)
+		operate = unary.operate
+		return lambda: operate(right())
+
+
+	def visit_binary_expr(self, binary):
+		left = self.compile(binary.left_expr)
+		operate = binary.operate
+		py_op = PLAIN_NUMERIC_OPERATORS.get(binary.operator.token_type)
+
+		# `i < 10`, `i + 1`: the literal side needs no closure call
+		if isinstance(binary.right_expr, LiteralExpr):
+			constant = binary.right_expr.value
+			kind = type(constant)
+
+			if py_op is not None and (kind is int or kind is float):
+				def numeric_const():
+					lval = left()
+					if type(lval) is kind:
+						return py_op(lval, constant)
+					return operate(lval, constant)
+				return numeric_const
+
+			return lambda: operate(left(), constant)
+
+		right = self.compile(binary.right_expr)
+
+		if py_op is not None:
+			def numeric():
+				lval = left()
+				rval = right()
+				kind = type(lval)
+				if kind is type(rval) and (kind is int or kind is float):
+					return py_op(lval, rval)
+				return operate(lval, rval)
+			return numeric
+
+		return lambda: operate(left(), right())
+
+
+	def visit_logical_expr(self, logical):
+		left = self.compile(logical.left_expr)
+		right = self.compile(logical.right_expr)
+		op = logical.operator.token_type
+
+		if op == TokenType.OR:
+			def logical_or():
+				lval = left()
+				rval = right()
+				return lval or rval
+			return logical_or
+
+		elif op == TokenType.AND:
+			def logical_and():
+				lval = left()
+				rval = right()
+				return lval and rval
+			return logical_and
+
+		return lambda: None
+
+
+	def compile_call(self, func_call_expr):
+		'''
+		Closures for the callee and each argument of a call, plus the
+		function reporting a callee that can't be called.
+		'''
+		callee_fn = self.compile(func_call_expr.callee)
+		arg_fns = [self.compile(arg) for arg in func_call_expr.arguments]
+
+		def not_callable(callee):
+			print(f'\'{callee_name(func_call_expr.callee, callee)}\' is not a function')
+			sys.exit(13)
+
+		return callee_fn, arg_fns, not_callable
+
+
+	def visit_func_call_expr(self, func_call_expr):
+		interp = self.interp
+		callee_fn, arg_fns, not_callable = self.compile_call(func_call_expr)
+
+		argc = len(arg_fns)
+
+		# natives with the right arity are called directly with the arguments,
+		# the others report their arity error through call()
+		if argc == 0:
+			def call_no_args():
+				callee = callee_fn()
+				if type(callee) is NativeFunction and callee.argc == 0:
+					try:
+						return callee.function()
+					except NATIVE_ERRORS as e:
+						callee.fail(e)
+				if not isinstance(callee, PloxCallable):
+					not_callable(callee)
+				return callee.call(interp, [])
+			return call_no_args
+
+		if argc == 1:
+			arg_fn = arg_fns[0]
+			def call_one_arg():
+				callee = callee_fn()
+				arg = arg_fn()
+				if type(callee) is NativeFunction and callee.argc == 1:
+					try:
+						return callee.function(arg)
+					except NATIVE_ERRORS as e:
+						callee.fail(e)
+				args = [arg]
+				if not isinstance(callee, PloxCallable):
+					not_callable(callee)
+				return callee.call(interp, args)
+			return call_one_arg
+
+		def call():
+			callee = callee_fn()
+			args = [arg_fn() for arg_fn in arg_fns]
+			if type(callee) is NativeFunction and callee.argc == argc:
+				try:
+					return callee.function(*args)
+				except NATIVE_ERRORS as e:
+					callee.fail(e)
+			if not isinstance(callee, PloxCallable):
+				not_callable(callee)
+			return callee.call(interp, args)
+		return call
+
+
+	def visit_this_expr(self, this):
+		return self.visit_variable_expr(this)
+
+
+	def visit_anon_func_expr(self, anon):
+		interp = self.interp
+		func = FunctionDeclStmt(None, anon.parameters, anon.body)
+		func.frame_size = anon.frame_size
+		func.line = anon.line
+		return lambda: PloxFunction(func, interp.var_env)
+
+
+	def visit_class_prop_get_expr(self, get):
+		obj_fn = self.compile(get.obj)
+		cache = get.cache
+
+		def get_prop():
+			obj = obj_fn()
+			if not isinstance(obj, PloxInstance):
+				print("Only instances can have properties")
+				sys.exit(14)
+			if obj.shape is cache.shape:
+				return obj.values[cache.index]
+			return cache.lookup(obj)
+		return get_prop
+
+
+	def visit_class_prop_set_expr(self, set):
+		obj_fn = self.compile(set.obj)
+		value_fn = self.compile(set.value)
+		cache = set.cache
+
+		def set_prop():
+			obj = obj_fn()
+			if not isinstance(obj, PloxInstance):
+				print("Only instances can have fields")
+				sys.exit(15)
+			value = value_fn()
+			if obj.shape is not cache.shape:
+				cache.store(obj, value)
+			elif cache.next_shape is None:
+				obj.values[cache.index] = value
+			else:
+				obj.shape = cache.next_shape
+				obj.values.append(value)
+			return value
+		return set_prop
+
+
+	def visit_index_get_expr(self, get):
+		obj_fn = self.compile(get.obj)
+		index_fn = self.compile(get.index)
+
+		def get_item():
+			obj = obj_fn()
+			index = index_fn()
+			if type(obj) is PloxArray and type(index) is int:
+				try:
+					return obj.items[index]
+				except INDEX_ERRORS:
+					pass
+			elif type(obj) is PloxMap and type(index) is not bool:
+				try:
+					return obj.entries[index]
+				except (KeyError, TypeError):
+					pass
+			return get_index(obj, index)
+		return get_item
+
+
+	def visit_index_set_expr(self, set):
+		obj_fn = self.compile(set.obj)
+		index_fn = self.compile(set.index)
+		value_fn = self.compile(set.value)
+
+		def set_item():
+			obj = obj_fn()
+			index = index_fn()
+			value = value_fn()
+			if type(obj) is PloxArray and type(index) is int:
+				try:
+					obj.items[index] = value
+					return value
+				except INDEX_ERRORS:
+					pass
+			elif type(obj) is PloxMap and type(index) is not bool:
+				try:
+					obj.entries[index] = value
+					return value
+				except TypeError:
+					pass
+			return set_index(obj, index, value)
+		return set_item
+
+
+	def visit_map_expr(self, map):
+		entry_fns = [self.compile(expr) for entry in zip(map.keys, map.values) for expr in entry]
+		return lambda: make_map([entry_fn() for entry_fn in entry_fns])
+
+
+	# statements part
+	def visit_print_stmt(self, printt):
+		stringify = self.interp.stringify
+		write_line = self.interp.output.write_line
+		expr_fn = self.compile(printt.expr)
+		return lambda: write_line(stringify(expr_fn()))
+
+
+	def visit_expr_stmt(self, expr_stmt):
+		expr_fn = self.compile(expr_stmt.expr)
+
+		def expr_stmt_fn():
+			expr_fn()
+		return expr_stmt_fn
+
+
+	def declare(self, name, slot, value_fn):
+		interp = self.interp
+
+		if slot is None:
+			return lambda: interp.globals.declare(name, value_fn())
+
+		def declare_local():
+			interp.var_env.values[slot] = value_fn()
+		return declare_local
+
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is None:
+			return self.declare(var_decl.name, var_decl.slot, lambda: "undefined")
+
+		return self.declare(var_decl.name, var_decl.slot, self.compile(var_decl.init))
+
+
+	def visit_block_stmt(self, block):
+		interp = self.interp
+		body = self.compile_block(block.statements)
+		frame_size = block.frame_size
+
+		if frame_size == 0:
+			return body
+
+		if block.captured:
+			def run_block():
+				prev_env = interp.var_env
+				interp.var_env = Environment(prev_env, frame_size)
+				try:
+					return body()
+				finally:
+					interp.var_env = prev_env
+			return run_block
+
+		pool = block.frame_pool
+		def run_pooled_block():
+			prev_env = interp.var_env
+			env = pool.pop() if pool else Environment(None, frame_size)
+			env.enclosing = prev_env
+			interp.var_env = env
+			try:
+				return body()
+			finally:
+				interp.var_env = prev_env
+				env.release()
+				pool.append(env)
+		return run_pooled_block
+
+
+	def visit_if_stmt(self, if_stmt):
+		condition = self.compile(if_stmt.condition)
+		if_true = self.compile(if_stmt.if_true)
+
+		if if_stmt.if_false is None:
+			def run_if():
+				if condition():
+					return if_true()
+				return None
+			return run_if
+
+		if_false = self.compile(if_stmt.if_false)
+		def run_if_else():
+			if condition():
+				return if_true()
+			return if_false()
+		return run_if_else
+
+
+	def visit_while_stmt(self, while_stmt):
+		condition = self.compile(while_stmt.condition)
+		body = self.compile(while_stmt.body)
+
+		def run_while():
+			while condition():
+				if body() is not None:
+					return RETURN
+			return None
+		return run_while
+
+
+	def visit_func_decl_stmt(self, func_decl):
+		interp = self.interp
+		return self.declare(func_decl.name.lexeme, func_decl.slot, lambda: PloxFunction(func_decl, interp.var_env))
+
+
+	def visit_return_stmt(self, ret):
+		if ret.tail_call:
+			return self.compile_tail_call(ret.value)
+
+		interp = self.interp
+		if ret.value is None:
+			def return_nil():
+				interp.return_value = None
+				return RETURN
+			return return_nil
+
+		value_fn = self.compile(ret.value)
+		def return_value():
+			interp.return_value = value_fn()
+			return RETURN
+		return return_value
+
+
+	def compile_tail_call(self, func_call_expr):
+		interp = self.interp
+		callee_fn, arg_fns, not_callable = self.compile_call(func_call_expr)
+
+		def return_tail_call():
+			callee = callee_fn()
+			args = [arg_fn() for arg_fn in arg_fns]
+			if isinstance(callee, PloxFunction):
+				interp.return_value = TailCall(callee, args)
+				return RETURN
+			if not isinstance(callee, PloxCallable):
+				not_callable(callee)
+			interp.return_value = callee.call(interp, args)
+			return RETURN
+		return return_tail_call
+
+
+	def visit_class_decl_stmt(self, cls):
+		interp = self.interp
+		name = cls.name.lexeme
+		methods = cls.funcs
+
+		def make_class():
+			return PloxClass(name, {method.name.lexeme: PloxFunction(method, interp.var_env) for method in methods})
+		return self.declare(name, cls.slot, make_class)
+
+
+class ClosureInterpreter(Interpreter):
+	'''
+	Interpreter which runs programs as compiled closures instead of walking
+	the syntax tree. Function bodies are compiled the first time they run.
+	'''
+	def __init__(self, buffered=True):
+		super().__init__(buffered)
+		self.compiler = ClosureCompiler(self)
+		self.compiled_blocks = dict()
+
+
+	def interpret(self, stmts: List[Stmt]):
+		with self.output, running(self):
+			self.compiler.compile_block(stmts)()
+
+
+	def execute_block(self, stmts, env):
+		compiled = self.compiled_blocks.get(id(stmts))
+		if compiled is None:
+			# keep a reference to stmts so its id is never reused
+			compiled = (stmts, self.compiler.compile_block(stmts))
+			self.compiled_blocks[id(stmts)] = compiled
+
+		prev_env = self.var_env
+		self.var_env = env
+
+		try:
+			return compiled[1]()
+		finally:
+			self.var_env = prev_env
@@ -1,10 +1,73 @@
-from typing import Dict
+from typing import Dict, List
+
 
 class Environment:
-	def __init__(self, enclosing = None, pre = None):
-		self.variable_values: Dict[str, object] = dict()
+	'''
+	Frame of one block or function call. Variables are stored in a list
+	and addressed by the (depth, slot) pairs Resolver assigns to them.
+	'''
+	__slots__ = ("values", "enclosing")
+
+	def __init__(self, enclosing = None, size = 0):
+		self.values: List[object] = [None] * size
 		self.enclosing = enclosing
 
+
+	def release(self):
+		'''
+		Drops the values and the enclosing frame so a pooled frame keeps
+		nothing alive.
+		'''
+		values = self.values
+		for slot in range(len(values)):
+			values[slot] = None
+		self.enclosing = None
+
+
+	def ancestor(self, depth):
+		env = self
+		for _ in range(depth):
+			env = env.enclosing
+		return env
+
+
+	def get(self, depth, slot):
+		if depth == 0:
+			return self.values[slot]
+		return self.ancestor(depth).values[slot]
+
+
+	def assign(self, depth, slot, value):
+		if depth == 0:
+			self.values[slot] = value
+		else:
+			self.ancestor(depth).values[slot] = value
+
+
+	def dump(self):
+		env = self
+		depth = 0
+		while isinstance(env, Environment):
+			for slot, value in enumerate(env.values):
+				print(f"({depth}, {slot}) -> {value}")
+			env = env.enclosing
+			depth += 1
+
+		if env is not None:
+			env.dump()
+
+
+class GlobalEnvironment:
+	'''
+	Top level scope. Globals stay keyed by name, so functions can refer to
+	globals declared after them and the prompt can add new ones any time.
+	Names no script declared are looked up in `builtins`, a native found
+	there is declared on first use.
+	'''
+	def __init__(self, pre = None, builtins = None):
+		self.variable_values: Dict[str, object] = dict()
+		self.builtins = builtins
+
 		if pre:
 			for key, value in pre.items():
 				self.variable_values[key] = value
@@ -14,34 +77,30 @@ class Environment:
 		self.variable_values[name] = value
 
 
+	def declare_builtin(self, name):
+		native = self.builtins.lookup(name) if self.builtins is not None else None
+		if native is None:
+			return False
+
+		self.variable_values[name] = native
+		return True
+
+
 	def assign(self, name, value):
-		if name in self.variable_values:
+		if name in self.variable_values or self.declare_builtin(name):
 			self.variable_values[name] = value
 			return
 
-		if self.enclosing:
-			if name in self.enclosing.variable_values:
-				self.enclosing.variable_values[name] = value
-			return
-
 		print(f"Undefined identifier '{name}'")
 
 
 	def get_var_value(self, name):
-		if name in self.variable_values:
+		if name in self.variable_values or self.declare_builtin(name):
 			return self.variable_values.get(name)
 
-		if self.enclosing:
-			if name in self.enclosing.variable_values:
-				return self.enclosing.variable_values.get(name)
-
 		print(f"Undefined identifier '{name}'")
 
 
 	def dump(self):
-		if self.enclosing:
-			for key, value in self.enclosing.variable_values.items():
-				print(f"{key} -> {value}")
-
 		for key, value in self.variable_values.items():
 			print(f"{key} -> {value}")
@@ -0,0 +1,56 @@
+from enum import Enum
+import sys
+
+
+# Python frames a running script may take, a Plox call takes about ten on
+# the tree engine and five on the closure engine. Pickling and printing
+# nested values recurse in C against the same limit, so it's kept well
+# below what overflows the C stack
+RECURSION_LIMIT = 20000
+
+
+class ErrorType(Enum):
+	PloxTypeError = 1,
+	PloxDivisonByZeroError = 2
+	PloxIndexError = 3
+	PloxImportError = 4
+	PloxKeyError = 5
+
+
+def runtime_error(typ, msg=None):
+	# output buffered so far comes before the error
+	sys.stdout.flush()
+	if typ == ErrorType.PloxTypeError:
+		sys.stderr.write(f"TypeError: {msg if msg else ''}\n")
+	elif typ == ErrorType.PloxDivisonByZeroError:
+		sys.stderr.write(f"DivisionByZeroError: {msg if msg else 'division by zero'}\n")
+	elif typ == ErrorType.PloxIndexError:
+		sys.stderr.write(f"IndexError: {msg if msg else ''}\n")
+	elif typ == ErrorType.PloxImportError:
+		sys.stderr.write(f"ImportError: {msg if msg else ''}\n")
+	elif typ == ErrorType.PloxKeyError:
+		sys.stderr.write(f"KeyError: {msg if msg else ''}\n")
+	sys.exit(12)
+
+
+def stack_overflow():
+	sys.stdout.flush()
+	sys.stderr.write("Stack overflow.\n")
+	sys.exit(12)
+
+
+def type_name(value):
+	from ropes import Rope
+	# a rope is just a long string to scripts
+	return "str" if type(value) is Rope else value.__class__.__name__
+
+
+def unsupported_operands_error(operator, left, right):
+	runtime_error(ErrorType.PloxTypeError, f'unsupported operand type(s) for {operator}: {type_name(left)} and {type_name(right)}')
+
+
+def native_error(name, error):
+	# error is the Python exception a native raised on its arguments
+	sys.stdout.flush()
+	sys.stderr.write(f"{type(error).__name__}: {name}(): {error}\n")
+	sys.exit(12)
@@ -0,0 +1,215 @@
+'''
+Timers, file I/O and processes waited on together on an asyncio event loop,
+with the `set_timeout`, `read_file_async`, `write_file_async`, `run_process`
+and `cancel` natives.
+'''
+import os
+import sys
+import signal
+import errors
+from contextlib import contextmanager
+from globals import NATIVE_ERRORS, expect_function, expect_string, read_file, write_file
+from maps import PloxMap
+
+
+class PloxTask:
+	__slots__ = ("task",)
+
+	def __init__(self, task):
+		# an asyncio.Task running Events.finish()
+		self.task = task
+
+
+	def __str__(self):
+		return "<task>"
+
+
+class Events:
+	'''
+	Event loop of one engine, made by the first native using it.
+	'''
+	def __init__(self, engine):
+		import asyncio
+
+		self.engine = engine
+		self.loop = asyncio.new_event_loop()
+		self.tasks = set()
+
+
+	def start(self, name, callback, operation, *args):
+		'''
+		Runs the coroutine function `operation` with `args` as a task, and
+		`callback` with the list of arguments it returns. `name` is the
+		native's, for errors.
+		'''
+		task = self.loop.create_task(self.finish(name, callback, operation, args))
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+		return PloxTask(task)
+
+
+	async def finish(self, name, callback, operation, args):
+		try:
+			results = await operation(*args)
+		except NATIVE_ERRORS as e:
+			errors.native_error(name, e)
+
+		if callback is not None:
+			try:
+				callback.call(self.engine, results)
+			except RecursionError:
+				# the task would keep it, unlike the SystemExit of other errors
+				errors.stack_overflow()
+
+
+	def run(self):
+		import asyncio
+
+		try:
+			while self.tasks:
+				self.loop.run_until_complete(asyncio.wait(set(self.tasks)))
+		except BaseException:
+			# a runtime error in a callback, the other tasks stop waiting
+			self.stop()
+			raise
+		self.close()
+
+
+	def stop(self):
+		import asyncio
+
+		tasks = list(self.tasks)
+		for task in tasks:
+			task.cancel()
+		self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+		self.close()
+
+
+	def close(self):
+		self.loop.close()
+		self.engine.events = None
+
+
+@contextmanager
+def running(engine):
+	'''
+	Runs the tasks the script in the `with` block started once it's done,
+	or stops them when it stopped with an error. Recursing too deep, in the
+	script or a callback, is reported as a stack overflow.
+	'''
+	if sys.getrecursionlimit() < errors.RECURSION_LIMIT:
+		sys.setrecursionlimit(errors.RECURSION_LIMIT)
+
+	try:
+		try:
+			yield
+		except BaseException:
+			if engine.events is not None:
+				engine.events.stop()
+			raise
+
+		if engine.events is not None:
+			engine.events.run()
+	except RecursionError:
+		# raised deep down, reported once the stack has unwound
+		errors.stack_overflow()
+
+
+def events_of(engine):
+	if engine.events is None:
+		engine.events = Events(engine)
+	return engine.events
+
+
+def expect_callback(value, argc):
+	# nil for no callback
+	return None if value is None else expect_function(value, argc)
+
+
+async def timer(loop, deadline):
+	import asyncio
+
+	await asyncio.sleep(max(0, deadline - loop.time()))
+	return []
+
+
+# asyncio has no non-blocking file I/O, files are read and written on executor threads
+async def read(loop, path):
+	return [await loop.run_in_executor(None, read_file, path)]
+
+
+async def write(loop, path, text):
+	await loop.run_in_executor(None, write_file, path, text)
+	return []
+
+
+def kill(child):
+	try:
+		if hasattr(os, "killpg"):
+			os.killpg(child.pid, signal.SIGKILL)
+		else:
+			child.kill()
+	except ProcessLookupError:
+		pass
+
+
+async def process(command):
+	import asyncio
+
+	# in a session of its own, so stopping it stops what the shell started too
+	child = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE,
+		stderr=asyncio.subprocess.PIPE, start_new_session=True)
+	try:
+		stdout, stderr = await child.communicate()
+	except asyncio.CancelledError:
+		kill(child)
+		# the loop closes the pipes once the child is gone
+		await child.communicate()
+		raise
+
+	return [PloxMap({
+		"status": child.returncode,
+		"stdout": stdout.decode(errors="replace"),
+		"stderr": stderr.decode(errors="replace"),
+	})]
+
+
+def set_timeout(engine, callback, ms):
+	expect_callback(callback, 0)
+	if type(ms) is not int and type(ms) is not float or ms < 0:
+		raise ValueError(f"the delay must be a non-negative number of milliseconds, got {ms}")
+
+	events = events_of(engine)
+	# the time counts from now, not from when the loop gets to the task
+	deadline = events.loop.time() + ms / 1000
+	return events.start("set_timeout", callback, timer, events.loop, deadline)
+
+
+def read_file_async(engine, path, callback):
+	path = expect_string(path)
+	expect_callback(callback, 1)
+	events = events_of(engine)
+	return events.start("read_file_async", callback, read, events.loop, path)
+
+
+def write_file_async(engine, path, text, callback):
+	path = expect_string(path)
+	text = expect_string(text)
+	expect_callback(callback, 0)
+	events = events_of(engine)
+	return events.start("write_file_async", callback, write, events.loop, path, text)
+
+
+def run_process(engine, command, callback):
+	command = expect_string(command)
+	expect_callback(callback, 1)
+	return events_of(engine).start("run_process", callback, process, command)
+
+
+def cancel(engine, task):
+	'''
+	Stops a task before its callback runs, true when it hadn't finished yet.
+	'''
+	if type(task) is not PloxTask:
+		raise TypeError(f"expected a task, got {type(task).__name__}")
+	return task.task.cancel()
@@ -1,10 +1,347 @@
+'''
+Native functions, implemented in Python and called like any Plox function,
+grouped into modules that are only built once a script uses them.
+'''
+import sys
+import errors
 from callable import PloxCallable
-from math import sqrt
+from ropes import Rope, plain
 from typing import List
 
-class Sqrt(PloxCallable):
+
+# what a native raises for arguments it can't work with, reported as a runtime error
+NATIVE_ERRORS = (TypeError, ValueError, OverflowError, ZeroDivisionError, OSError)
+
+
+class NativeFunction(PloxCallable):
+    '''
+    Native taking a fixed number of arguments. The engines call `function`
+    with the arguments themselves when their count matches `argc`, call()
+    is the generic way in.
+    '''
+    def __init__(self, name, argc, function):
+        self.name = name
+        self.argc = argc
+        self.function = function
+
+
     def call(self, interp, args: List[object]):
-        return sqrt(args[0])
+        if len(args) != self.argc:
+            self.arity_error(len(args))
+        try:
+            return self.function(*args)
+        except NATIVE_ERRORS as e:
+            self.fail(e)
+
 
     def arity(self):
-        return 1
+        return self.argc
+
+
+    def arity_error(self, count):
+        print(f'Expected {self.argc} arguments but got {count}')
+        sys.exit(10)
+
+
+    def fail(self, error):
+        errors.native_error(self.name, error)
+
+
+    def __str__(self):
+        return f'<native function {self.name}>'
+
+
+class EngineNative(NativeFunction):
+    '''
+    Native which needs the engine running it, `function` gets the engine
+    before the arguments. An `argc` of None takes any number of arguments.
+    The engines only call NativeFunctions directly, these go through call().
+    '''
+    def call(self, interp, args: List[object]):
+        if self.argc is not None and len(args) != self.argc:
+            self.arity_error(len(args))
+        try:
+            return self.function(interp, *args)
+        except NATIVE_ERRORS as e:
+            self.fail(e)
+
+
+def expect_function(value, argc):
+    if not isinstance(value, PloxCallable):
+        raise TypeError(f"expected a function, got {type(value).__name__}")
+    arity = value.arity()
+    if arity is not None and arity != argc:
+        raise TypeError(f"{value} takes {arity} arguments, not {argc}")
+    return value
+
+
+def expect_string(value):
+    if type(value) is Rope:
+        return value.flatten()
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {type(value).__name__}")
+    return value
+
+
+# math
+def math_module():
+    import math
+    import random
+
+    return [
+        NativeFunction("sqrt", 1, math.sqrt),
+        NativeFunction("abs", 1, abs),
+        NativeFunction("floor", 1, math.floor),
+        NativeFunction("ceil", 1, math.ceil),
+        NativeFunction("round", 1, round),
+        NativeFunction("pow", 2, pow),
+        NativeFunction("min", 2, min),
+        NativeFunction("max", 2, max),
+        NativeFunction("exp", 1, math.exp),
+        NativeFunction("log", 1, math.log),
+        NativeFunction("sin", 1, math.sin),
+        NativeFunction("cos", 1, math.cos),
+        NativeFunction("tan", 1, math.tan),
+        NativeFunction("atan", 1, math.atan),
+        NativeFunction("atan2", 2, math.atan2),
+        NativeFunction("hypot", 2, math.hypot),
+        NativeFunction("random", 0, random.random),
+    ]
+
+
+# string
+def to_string(value):
+    return "nil" if value is None else str(value)
+
+
+def to_number(value):
+    '''
+    Number a string spells out, nil when it doesn't spell out one.
+    '''
+    if type(value) is int or type(value) is float:
+        return value
+    value = plain(value)
+    if not isinstance(value, str):
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def string_method(method):
+    def native(string, *args):
+        return method(expect_string(string), *map(plain, args))
+    return native
+
+
+def substr(string, start, end):
+    return expect_string(string)[start:end]
+
+
+def contains(string, part):
+    return expect_string(part) in expect_string(string)
+
+
+def words(string):
+    import re
+    from iterators import PloxIterator
+
+    # one word at a time, the string isn't split up front
+    return PloxIterator(map(re.Match.group, re.finditer(r"\S+", expect_string(string))))
+
+
+def string_module():
+    return [
+        NativeFunction("len", 1, len),
+        NativeFunction("str", 1, to_string),
+        NativeFunction("num", 1, to_number),
+        NativeFunction("upper", 1, string_method(str.upper)),
+        NativeFunction("lower", 1, string_method(str.lower)),
+        NativeFunction("trim", 1, string_method(str.strip)),
+        NativeFunction("substr", 3, substr),
+        NativeFunction("index_of", 2, string_method(str.find)),
+        NativeFunction("contains", 2, contains),
+        NativeFunction("starts_with", 2, string_method(str.startswith)),
+        NativeFunction("ends_with", 2, string_method(str.endswith)),
+        NativeFunction("replace", 3, string_method(str.replace)),
+        NativeFunction("chr", 1, chr),
+        NativeFunction("ord", 1, lambda char: ord(expect_string(char))),
+        NativeFunction("words", 1, words),
+    ]
+
+
+# time
+def time_module():
+    import time
+
+    return [
+        NativeFunction("clock", 0, time.perf_counter),
+        NativeFunction("time", 0, time.time),
+        NativeFunction("sleep", 1, time.sleep),
+    ]
+
+
+# io
+def read_line():
+    # a prompt printed before has to show up before the script waits
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    # nil at the end of the input, an empty line is ""
+    return line.rstrip("\n") if line else None
+
+
+def read_file(path):
+    with open(expect_string(path), encoding="utf-8") as f:
+        return f.read()
+
+
+def write_file(path, text):
+    with open(expect_string(path), "w", encoding="utf-8") as f:
+        f.write(expect_string(text))
+
+
+def io_module():
+    return [
+        NativeFunction("read_line", 0, read_line),
+        NativeFunction("read_file", 1, read_file),
+        NativeFunction("write_file", 2, write_file),
+    ]
+
+
+# array
+def array_module():
+    import arrays
+
+    return [
+        NativeFunction("array", 1, lambda size: arrays.zeros("d", size)),
+        NativeFunction("int_array", 1, lambda size: arrays.zeros("q", size)),
+        NativeFunction("append", 2, arrays.append),
+        NativeFunction("slice", 3, arrays.view),
+        NativeFunction("copy", 1, arrays.copy),
+        NativeFunction("fill", 2, arrays.fill),
+        NativeFunction("sum", 1, arrays.total),
+        NativeFunction("min_of", 1, arrays.smallest),
+        NativeFunction("max_of", 1, arrays.largest),
+    ]
+
+
+# vec, needs NumPy
+def vec_module():
+    import vectors
+
+    return [
+        NativeFunction("vec", 1, vectors.zeros),
+        NativeFunction("vec_of", 1, vectors.vec_of),
+        NativeFunction("vec_range", 2, vectors.vec_range),
+        NativeFunction("to_array", 1, vectors.to_array),
+        NativeFunction("mean", 1, vectors.mean),
+        NativeFunction("dot", 2, vectors.dot),
+        NativeFunction("all", 1, vectors.all_of),
+        NativeFunction("any", 1, vectors.any_of),
+    ]
+
+
+# map
+def map_module():
+    import maps
+    import iterators
+
+    return [
+        NativeFunction("get", 3, maps.get),
+        NativeFunction("set", 3, maps.put),
+        NativeFunction("has", 2, maps.has),
+        NativeFunction("delete", 2, maps.delete),
+        NativeFunction("keys", 1, maps.keys),
+        NativeFunction("size", 1, maps.size),
+        NativeFunction("has_next", 1, iterators.has_next),
+        NativeFunction("next", 1, iterators.next_item),
+    ]
+
+
+# memo
+def memo_module():
+    import memo
+
+    return [
+        NativeFunction("memoize", 2, memo.memoize),
+        NativeFunction("memo_stats", 1, memo.stats),
+        NativeFunction("memo_clear", 1, memo.clear),
+    ]
+
+
+# parallel
+def parallel_module():
+    import parallel
+
+    return [
+        EngineNative("spawn", None, parallel.spawn),
+        EngineNative("wait", 1, parallel.wait),
+        EngineNative("await_all", 1, parallel.await_all),
+        EngineNative("parallel_map", 2, parallel.parallel_map),
+    ]
+
+
+# event
+def event_module():
+    import events
+
+    return [
+        EngineNative("set_timeout", 2, events.set_timeout),
+        EngineNative("read_file_async", 2, events.read_file_async),
+        EngineNative("write_file_async", 3, events.write_file_async),
+        EngineNative("run_process", 2, events.run_process),
+        EngineNative("cancel", 1, events.cancel),
+    ]
+
+
+# module name -> (names of its natives, function building them)
+MODULES = {
+    "math": (("sqrt", "abs", "floor", "ceil", "round", "pow", "min", "max", "exp", "log",
+        "sin", "cos", "tan", "atan", "atan2", "hypot", "random"), math_module),
+    "string": (("len", "str", "num", "upper", "lower", "trim", "substr", "index_of", "contains",
+        "starts_with", "ends_with", "replace", "chr", "ord", "words"), string_module),
+    "time": (("clock", "time", "sleep"), time_module),
+    "io": (("read_line", "read_file", "write_file"), io_module),
+    "array": (("array", "int_array", "append", "slice", "copy", "fill", "sum", "min_of", "max_of"), array_module),
+    "vec": (("vec", "vec_of", "vec_range", "to_array", "mean", "dot", "all", "any"), vec_module),
+    "map": (("get", "set", "has", "delete", "keys", "size", "has_next", "next"), map_module),
+    "memo": (("memoize", "memo_stats", "memo_clear"), memo_module),
+    "parallel": (("spawn", "wait", "await_all", "parallel_map"), parallel_module),
+    "event": (("set_timeout", "read_file_async", "write_file_async", "run_process", "cancel"), event_module),
+}
+
+# native name -> name of its module
+NATIVE_MODULES = {name: module for module, (names, _) in MODULES.items() for name in names}
+
+
+class Builtins:
+    '''
+    The natives of one interpreter, each module built on first use.
+    '''
+    def __init__(self):
+        self.natives = dict()
+        self.loaded = set()
+
+
+    def lookup(self, name):
+        '''
+        Returns the native called `name`, None when there's no such native.
+        '''
+        native = self.natives.get(name)
+        if native is not None:
+            return native
+
+        module = NATIVE_MODULES.get(name)
+        if module is None or module in self.loaded:
+            return None
+
+        self.loaded.add(module)
+        for native in MODULES[module][1]():
+            self.natives[native.name] = native
+        return self.natives.get(name)
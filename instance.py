@@ -0,0 +1,122 @@
+'''
+Instances of Plox classes and the inline caches used to access their fields.
+'''
+
+
+class Shape:
+	'''
+	Which field sits at which index of an instance's values. Instances that
+	got the same fields in the same order share one shape.
+	'''
+	__slots__ = ("slots", "transitions")
+
+	def __init__(self, slots):
+		# field name -> index in the instance's values
+		self.slots = slots
+		# field name -> shape of an instance of this shape once it gets that field
+		self.transitions = dict()
+
+
+	def with_field(self, name):
+		shape = self.transitions.get(name)
+		if shape is None:
+			slots = dict(self.slots)
+			slots[name] = len(slots)
+			shape = self.transitions[name] = Shape(slots)
+		return shape
+
+
+# shape of instances with no fields yet, all the others grow from it
+ROOT_SHAPE = Shape(dict())
+
+
+class PloxInstance:
+	__slots__ = ("klass", "shape", "values", "bound")
+
+	def __init__(self, klass):
+		self.klass = klass
+		self.shape = ROOT_SHAPE
+		self.values = list()
+		# method name -> the method bound to this instance, made on first use
+		self.bound = None
+
+
+	def get(self, name):
+		index = self.shape.slots.get(name)
+		if index is not None:
+			return self.values[index]
+
+		# fields shadow methods of the same name
+		method = self.klass.methods.get(name)
+		if method is not None:
+			return self.bind(name, method)
+
+		print(f"Undefined property '{name}'")
+
+
+	def bind(self, name, method):
+		bound = self.bound
+		if bound is None:
+			bound = self.bound = dict()
+
+		bound_method = bound.get(name)
+		if bound_method is None:
+			bound_method = bound[name] = method.bind(self)
+		return bound_method
+
+
+	def set(self, name, value):
+		index = self.shape.slots.get(name)
+		if index is None:
+			self.shape = self.shape.with_field(name)
+			self.values.append(value)
+		else:
+			self.values[index] = value
+
+
+class PropertyCache:
+	'''
+	Inline cache of a single property access. Engines compare the
+	instance's shape with `shape` themselves and only call lookup() or
+	store() when it differs, those update the cache for the new shape.
+	'''
+	__slots__ = ("name", "shape", "index", "next_shape")
+
+	def __init__(self, name):
+		self.name = name
+		self.shape = None
+		self.index = None
+		# set when writing the field adds it to instances of `shape`
+		self.next_shape = None
+
+
+	def lookup(self, instance):
+		shape = instance.shape
+		index = shape.slots.get(self.name)
+		if index is None:
+			return instance.get(self.name)
+
+		self.shape = shape
+		self.index = index
+		self.next_shape = None
+		return instance.values[index]
+
+
+	def store(self, instance, value):
+		shape = instance.shape
+		index = shape.slots.get(self.name)
+		self.shape = shape
+
+		if index is None:
+			self.index = len(instance.values)
+			self.next_shape = instance.shape = shape.with_field(self.name)
+			instance.values.append(value)
+		else:
+			self.index = index
+			self.next_shape = None
+			instance.values[index] = value
+
+
+	def __repr__(self):
+		# shows up in disassembled bytecode as the property's name
+		return repr(self.name)
@@ -1,39 +1,56 @@
 from syntax_tree import *
-from environment import Environment
+from environment import Environment, GlobalEnvironment
+from instance import PloxInstance
+from arrays import PloxArray, INDEX_ERRORS, get_index, set_index
+from maps import PloxMap, make_map
+from callable import PloxCallable, PloxFunction, PloxClass, TailCall, RETURN
+from globals import Builtins, NativeFunction, NATIVE_ERRORS
+from output import Output
+from events import running
+from errors import ErrorType
+import errors
 from typing import List
-from enum import Enum
 import sys
 
 
-class ErrorType(Enum):
-	PloxTypeError = 1,
-	PloxDivisonByZeroError = 2
+def callee_name(callee_expr, callee):
+	'''
+	How a call to something that isn't callable names it in the error.
+	'''
+	name = getattr(callee_expr, "name", None)
+	if name is not None:
+		return name.lexeme
+	return "nil" if callee is None else str(callee)
 
 
 class Interpreter(ExprVisitor, StmtVisitor):
-	def __init__(self):
-		self.globals = Environment()
-		self.init_globals()
+	def __init__(self, buffered=True):
+		# natives are declared as globals the first time a script uses them
+		self.globals = GlobalEnvironment(builtins=Builtins())
+		# stands in for sys.stdout while interpret() runs
+		self.output = Output(buffered)
 
-		self.var_env = Environment(enclosing=self.globals)
-
-
-	def init_globals(self):
-		import globals
-		sqrt_math_func = globals.Sqrt()
-		self.globals.declare("sqrt", sqrt_math_func)
+		# innermost frame, the globals themselves at top level
+		self.var_env = self.globals
+		# value of the last `return`, or the TailCall it made
+		self.return_value = None
+		# event loop of the callback natives, made when a script first uses one
+		self.events = None
 
 
 	def interpret(self, stmts: List[Stmt]):
-		for stmt in stmts:
-			#print(stmt)
-			self.execute(stmt)
+		with self.output, running(self):
+			for stmt in stmts:
+				#print(stmt)
+				if self.execute(stmt) is not None:
+					# `return` at top level ends the script
+					break
 
 		#self.var_env.dump()
 
 
 	def execute(self, stmt):
-		stmt.accept(self)
+		return stmt.accept(self)
 
 
 	#expressions part
@@ -46,154 +63,37 @@ class Interpreter(ExprVisitor, StmtVisitor):
 
 
 	def visit_unary_expr(self, unary):
-		expr_res = self.evaluate(unary.right)
-
-		if unary.operator.token_type == TokenType.MINUS:
-			if self.check_int_operand(expr_res):
-				return -int(expr_res)
-			elif self.check_float_operand(expr_res):
-				return -float(expr_res)
-
-			self.runtime_error(ErrorType.PloxTypeError, "unsupported operand type(s) for -")
-
-		elif unary.operator.token_type == TokenType.BIT_NEGATE:
-			if self.check_int_operand(expr_res):
-				return ~int(expr_res)
-
-			self.runtime_error(ErrorType.PloxTypeError, "unsupported operand type(s) for ~")
-
-		elif unary.operator.token_type == TokenType.NOT:
-			if self.check_number_operand(expr_res):
-				return not bool(expr_res)
-
-		return None
+		return unary.operate(self.evaluate(unary.right))
 
 
 	def visit_binary_expr(self, binary):
-		left = self.evaluate(binary.left_expr)
-		right = self.evaluate(binary.right_expr)
-
-		left_type_name = left.__class__.__name__
-		right_type_name = right.__class__.__name__
-
-		if binary.operator.token_type == TokenType.MINUS:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left - right
-
-			self.runtime_unsupported_operands_error("-", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.PLUS:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left + right
-			elif isinstance(left, str) and isinstance(right, str):
-				return str(left) + str(right)
-
-			self.runtime_unsupported_operands_error("+", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.SLASH:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				if right == 0:
-					self.runtime_error(ErrorType.PloxDivisonByZeroError)
-				return left / right
-
-			self.runtime_unsupported_operands_error("/", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.STAR:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left * right
-			elif any([self.check_str_operand(left), self.check_str_operand(right)]) and any([self.check_int_operand(left), self.check_int_operand(right)]):
-				return left * right
-
-			self.runtime_unsupported_operands_error("*", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.BIT_AND:
-			if self.check_int_operand(left) and self.check_int_operand(right):
-				return left & right
-
-			self.runtime_unsupported_operands_error("&", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.BIT_OR:
-			if self.check_int_operand(left) and self.check_int_operand(right):
-				return left | right
-
-			self.runtime_unsupported_operands_error("|", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.BIT_XOR:
-			if self.check_int_operand(left) and self.check_int_operand(right):
-				return left ^ right
-
-			self.runtime_unsupported_operands_error("^", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.BIT_SHIFT_LEFT:
-			if self.check_int_operand(left) and self.check_int_operand(right):
-				return left << right
-
-			self.runtime_unsupported_operands_error("<<", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.BIT_SHIFT_RIGHT:
-			if self.check_int_operand(left) and self.check_int_operand(right):
-				return left >> right
-
-			self.runtime_unsupported_operands_error(">>", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.GREATER:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left > right
-
-			self.runtime_unsupported_operands_error(">", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.GREATER_EQUAL:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left >= right
-
-			self.runtime_unsupported_operands_error(">=", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.LESS:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left < right
-
-			self.runtime_unsupported_operands_error("<", left_type_name, right_type_name)
+		return binary.operate(self.evaluate(binary.left_expr), self.evaluate(binary.right_expr))
 
-		elif binary.operator.token_type == TokenType.LESS_EQUAL:
-			if self.check_number_operand(left) and self.check_number_operand(right):
-				return left <= right
 
-			self.runtime_unsupported_operands_error("<=", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.NOT_EQUAL:
-			if type(left) == type(right):
-				return left != right
-			elif any([self.check_int_operand(left), self.check_int_operand(right)]) and any([self.check_float_operand(left), self.check_float_operand(right)]):
-				return left != right
-
-			self.runtime_unsupported_operands_error("!=", left_type_name, right_type_name)
-
-		elif binary.operator.token_type == TokenType.EQUAL_EQUAL:
-			if type(left) == type(right):
-				return left == right
-			elif any([self.check_int_operand(left), self.check_int_operand(right)]) and any([self.check_float_operand(left), self.check_float_operand(right)]):
-				return left == right
-
-			self.runtime_unsupported_operands_error("==", left_type_name, right_type_name)
-
-		return None
+	def visit_variable_expr(self, var):
+		if var.depth is None:
+			return self.globals.get_var_value(var.name.lexeme)
+		return self.var_env.get(var.depth, var.slot)
 
 
-	def visit_variable_expr(self, var):
-		return self.var_env.get_var_value(var.name.lexeme)
+	def visit_this_expr(self, this):
+		return self.var_env.get(this.depth, this.slot)
 
 
 	def visit_anon_func_expr(self, anon):
-		from callable import PloxFunction
 		func = FunctionDeclStmt(None, anon.parameters, anon.body)
+		func.frame_size = anon.frame_size
+		func.line = anon.line
 		plox_func = PloxFunction(func, self.var_env)
 		return plox_func
 
 
 	def visit_assign_expr(self, assign):
-		var_name = assign.name.lexeme
 		value = self.evaluate(assign.value)
-		self.var_env.assign(var_name, value)
+		if assign.depth is None:
+			self.globals.assign(assign.name.lexeme, value)
+		else:
+			self.var_env.assign(assign.depth, assign.slot, value)
 		return value
 
 
@@ -211,9 +111,26 @@ class Interpreter(ExprVisitor, StmtVisitor):
 
 
 	def visit_func_call_expr(self, func_call_expr):
-		from callable import PloxCallable
-
 		callee = self.evaluate(func_call_expr.callee)
+
+		if type(callee) is NativeFunction:
+			arguments = func_call_expr.arguments
+			if len(arguments) != callee.argc:
+				callee.arity_error(len(arguments))
+			try:
+				return callee.function(*map(self.evaluate, arguments))
+			except NATIVE_ERRORS as e:
+				callee.fail(e)
+
+		args = self.evaluate_arguments(func_call_expr, callee)
+		return callee.call(self, args)
+
+
+	def evaluate_arguments(self, func_call_expr, callee):
+		'''
+		Evaluates the arguments of a call to `callee`, stops the script if
+		`callee` turns out not to be callable.
+		'''
 		args = list()
 
 		for arg in func_call_expr.arguments:
@@ -221,25 +138,26 @@ class Interpreter(ExprVisitor, StmtVisitor):
 			args.append(eval)
 
 		if not isinstance(callee, PloxCallable):
-			print(f'\'{func_call_expr.callee.name.lexeme}\' is not a function')
+			print(f'\'{callee_name(func_call_expr.callee, callee)}\' is not a function')
 			sys.exit(13)
 
-		return callee.call(self, args)
+		return args
 
 
 	def visit_class_prop_get_expr(self, get):
-		from callable import PloxInstance
 		obj = self.evaluate(get.obj)
 
 		if not isinstance(obj, PloxInstance):
 			print("Only instances can have properties")
 			sys.exit(14)
 
-		return obj.get(get.name.lexeme)
+		cache = get.cache
+		if obj.shape is cache.shape:
+			return obj.values[cache.index]
+		return cache.lookup(obj)
 
 
 	def visit_class_prop_set_expr(self, set):
-		from callable import PloxInstance
 		obj = self.evaluate(set.obj)
 
 		if not isinstance(obj, PloxInstance):
@@ -247,21 +165,73 @@ class Interpreter(ExprVisitor, StmtVisitor):
 			sys.exit(15)
 
 		value = self.evaluate(set.value)
-		obj.set(set.name.lexeme, value)
+		cache = set.cache
+		if obj.shape is not cache.shape:
+			cache.store(obj, value)
+		elif cache.next_shape is None:
+			obj.values[cache.index] = value
+		else:
+			obj.shape = cache.next_shape
+			obj.values.append(value)
 		return value
 
 
+	def visit_index_get_expr(self, get):
+		obj = self.evaluate(get.obj)
+		index = self.evaluate(get.index)
+
+		# bools index like ints in Python, get_index() rejects them for arrays
+		# and keeps them apart from numbers in maps
+		if type(obj) is PloxArray and type(index) is int:
+			try:
+				return obj.items[index]
+			except INDEX_ERRORS:
+				pass
+		elif type(obj) is PloxMap and type(index) is not bool:
+			try:
+				return obj.entries[index]
+			except (KeyError, TypeError):
+				pass
+		return get_index(obj, index)
+
+
+	def visit_index_set_expr(self, set):
+		obj = self.evaluate(set.obj)
+		index = self.evaluate(set.index)
+		value = self.evaluate(set.value)
+
+		if type(obj) is PloxArray and type(index) is int:
+			try:
+				obj.items[index] = value
+				return value
+			except INDEX_ERRORS:
+				pass
+		elif type(obj) is PloxMap and type(index) is not bool:
+			try:
+				obj.entries[index] = value
+				return value
+			except TypeError:
+				pass
+		return set_index(obj, index, value)
+
+
+	def visit_map_expr(self, map):
+		keys_and_values = list()
+		for key, value in zip(map.keys, map.values):
+			keys_and_values.append(self.evaluate(key))
+			keys_and_values.append(self.evaluate(value))
+		return make_map(keys_and_values)
+
+
 	def visit_func_decl_stmt(self, func_decl):
-		from callable import PloxFunction
 		function = PloxFunction(func_decl, self.var_env)
-		self.var_env.variable_values[func_decl.name.lexeme] = function
+		self.declare(func_decl.name.lexeme, func_decl.slot, function)
 
 
 	# statements part
 	def visit_print_stmt(self, printt):
 		expr_result = self.evaluate(printt.expr)
-		# sys.stdout.write(self.stringify(expr_result))
-		print(self.stringify(expr_result))
+		self.output.write_line(self.stringify(expr_result))
 
 
 	def visit_expr_stmt(self, expr_stmt):
@@ -271,10 +241,10 @@ class Interpreter(ExprVisitor, StmtVisitor):
 	def visit_if_stmt(self, if_stmt):
 		condition = self.evaluate(if_stmt.condition)
 		if condition:
-			self.execute(if_stmt.if_true)
+			return self.execute(if_stmt.if_true)
 		else:
 			if if_stmt.if_false:
-				self.execute(if_stmt.if_false)
+				return self.execute(if_stmt.if_false)
 
 
 	def visit_var_declare_stmt(self, var_decl):
@@ -283,43 +253,81 @@ class Interpreter(ExprVisitor, StmtVisitor):
 			value = self.evaluate(var_decl.init)
 
 		#declare new variable
-		self.var_env.declare(var_decl.name, value)
+		self.declare(var_decl.name, var_decl.slot, value)
 
 
 	def visit_while_stmt(self, while_stmt):
 		while self.evaluate(while_stmt.condition):
-			self.execute(while_stmt.body)
+			if self.execute(while_stmt.body) is not None:
+				return RETURN
 
 
 	def visit_return_stmt(self, ret):
-		from callable import ReturnException
 		return_value = None
 
-		if ret.value is not None:
+		if ret.tail_call:
+			callee = self.evaluate(ret.value.callee)
+			args = self.evaluate_arguments(ret.value, callee)
+			if isinstance(callee, PloxFunction):
+				return_value = TailCall(callee, args)
+			else:
+				return_value = callee.call(self, args)
+		elif ret.value is not None:
 			return_value = self.evaluate(ret.value)
 
-		raise ReturnException(return_value)
+		self.return_value = return_value
+		return RETURN
 
 
 	def visit_class_decl_stmt(self, cls):
-		import callable
-		kls = callable.PloxClass(cls.name.lexeme)
-		self.var_env.declare(cls.name.lexeme, kls)
+		methods = {method.name.lexeme: PloxFunction(method, self.var_env) for method in cls.funcs}
+		kls = PloxClass(cls.name.lexeme, methods)
+		self.declare(cls.name.lexeme, cls.slot, kls)
 
 
 	def visit_block_stmt(self, block):
-		env = Environment(enclosing=self.var_env)
-		self.execute_block(block.statements, env)
+		if block.frame_size == 0:
+			for stmt in block.statements:
+				if self.execute(stmt) is not None:
+					return RETURN
+			return None
+
+		if block.captured:
+			env = Environment(self.var_env, block.frame_size)
+			return self.execute_block(block.statements, env)
+
+		# nothing can hold on to the frame once the block is done, so reuse it
+		pool = block.frame_pool
+		env = pool.pop() if pool else Environment(None, block.frame_size)
+		env.enclosing = self.var_env
+		try:
+			return self.execute_block(block.statements, env)
+		finally:
+			env.release()
+			pool.append(env)
+
+
+	def declare(self, name, slot, value):
+		if slot is None:
+			self.globals.declare(name, value)
+		else:
+			self.var_env.values[slot] = value
 
 
 	def execute_block(self, stmts, env):
+		'''
+		Runs `stmts` in `env`, returns RETURN when one of them ran a `return`.
+		'''
 		prev_env = self.var_env
 		self.var_env = env
 
-		for stmt in stmts:
-			self.execute(stmt)
-
-		self.var_env = prev_env
+		try:
+			for stmt in stmts:
+				if self.execute(stmt) is not None:
+					return RETURN
+			return None
+		finally:
+			self.var_env = prev_env
 
 
 	def stringify(self, obj):
@@ -329,11 +337,7 @@ class Interpreter(ExprVisitor, StmtVisitor):
 
 
 	def runtime_error(self, typ, msg=None):
-		if typ == ErrorType.PloxTypeError:
-			sys.stderr.write(f"TypeError: {msg if msg else ''}\n")
-		elif typ == ErrorType.PloxDivisonByZeroError:
-			sys.stderr.write(f"DivisionByZeroError: {msg if msg else 'division by zero'}\n")
-		sys.exit(12)
+		errors.runtime_error(typ, msg)
 
 
 	def is_equal(self, obj1, obj2):
@@ -344,22 +348,6 @@ class Interpreter(ExprVisitor, StmtVisitor):
 		return obj1 is obj2
 
 
-	def check_str_operand(self, value):
-		return isinstance(value, str)
-
-
-	def check_number_operand(self, value):
-		return self.check_int_operand(value) or self.check_float_operand(value)
-
-
-	def check_int_operand(self, value):
-		return isinstance(value, int)
-
-
-	def check_float_operand(self, value):
-		return isinstance(value, float)
-
-
 	def evaluate(self, expr):
 		return expr.accept(self)
 
@@ -0,0 +1,59 @@
+'''
+Iterators handed out by natives like keys() and words(), stepped through
+from Plox with has_next() and next().
+'''
+
+
+class PloxIterator:
+	__slots__ = ("items", "item", "done", "source", "size")
+
+	def __init__(self, items, source=None):
+		self.items = iter(items)
+		self.item = None
+		self.done = False
+		# the map iterated over, the item pulled ahead is stale once it changes size
+		self.source = source
+		self.size = len(source) if source is not None else 0
+		self.advance()
+
+
+	def check(self):
+		if self.source is not None and len(self.source) != self.size:
+			raise ValueError("map changed size during iteration")
+
+
+	def advance(self):
+		try:
+			self.item = next(self.items)
+		except StopIteration:
+			self.item = None
+			self.done = True
+		except RuntimeError:
+			# a dict changing size while iterated over it
+			raise ValueError("map changed size during iteration")
+
+
+	def __str__(self):
+		return "<iterator>"
+
+
+def expect_iterator(value):
+	if type(value) is not PloxIterator:
+		raise TypeError(f"expected an iterator, got {type(value).__name__}")
+	return value
+
+
+def has_next(it):
+	it = expect_iterator(it)
+	it.check()
+	return not it.done
+
+
+def next_item(it):
+	it = expect_iterator(it)
+	it.check()
+	if it.done:
+		raise ValueError("no items left")
+	item = it.item
+	it.advance()
+	return item
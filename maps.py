@@ -0,0 +1,115 @@
+'''
+Hash maps, made with `{key: value, ...}` literals.
+'''
+import errors
+from errors import ErrorType
+from iterators import PloxIterator
+from ropes import Rope
+
+
+class PloxMap:
+	__slots__ = ("entries",)
+
+	def __init__(self, entries):
+		self.entries = entries
+
+
+	def __len__(self):
+		return len(self.entries)
+
+
+	def __str__(self):
+		return "{" + ", ".join(f"{show(plain_key(key))}: {show(value)}" for key, value in self.entries.items()) + "}"
+
+
+def entry_key(key):
+	# true and 1 are one dict key in Python, Plox can't even compare them
+	return (bool, key) if type(key) is bool else key
+
+
+def plain_key(key):
+	# no Plox value is a tuple, only bool keys are
+	return key[1] if type(key) is tuple else key
+
+
+def show(value):
+	if value is None:
+		return "nil"
+	if type(value) is str or type(value) is Rope:
+		return f'"{value}"'
+	return str(value)
+
+
+def make_map(keys_and_values):
+	'''
+	Map of a literal, from its keys and values in turn.
+	'''
+	entries = dict()
+	for at in range(0, len(keys_and_values), 2):
+		key = keys_and_values[at]
+		try:
+			entries[entry_key(key)] = keys_and_values[at + 1]
+		except TypeError:
+			unhashable(key)
+	return PloxMap(entries)
+
+
+def unhashable(key):
+	errors.runtime_error(ErrorType.PloxTypeError, f"{type(key).__name__} can't be a map key")
+
+
+def get_entry(map, key):
+	try:
+		return map.entries[entry_key(key)]
+	except KeyError:
+		errors.runtime_error(ErrorType.PloxKeyError, f"{show(key)} is not in the map")
+	except TypeError:
+		unhashable(key)
+
+
+def set_entry(map, key, value):
+	try:
+		map.entries[entry_key(key)] = value
+	except TypeError:
+		unhashable(key)
+	return value
+
+
+def expect_map(value):
+	if type(value) is not PloxMap:
+		raise TypeError(f"expected a map, got {type(value).__name__}")
+	return value.entries
+
+
+def get(map, key, default):
+	return expect_map(map).get(entry_key(key), default)
+
+
+def put(map, key, value):
+	expect_map(map)[entry_key(key)] = value
+
+
+def has(map, key):
+	return entry_key(key) in expect_map(map)
+
+
+def delete(map, key):
+	'''
+	Removes `key`, returns whether it was there.
+	'''
+	entries = expect_map(map)
+	key = entry_key(key)
+	if key in entries:
+		del entries[key]
+		return True
+	return False
+
+
+def keys(map):
+	# iterates the dict itself, no copy of the keys
+	entries = expect_map(map)
+	return PloxIterator((plain_key(key) for key in entries), entries)
+
+
+def size(map):
+	return len(expect_map(map))
@@ -0,0 +1,89 @@
+'''
+Memoized functions, made with the `memoize` native.
+'''
+from collections import OrderedDict
+from callable import PloxCallable
+from maps import PloxMap
+from ropes import Rope
+
+
+# argument types a call is cached for
+KEY_TYPES = frozenset((int, float, str, bool, type(None), Rope))
+
+
+class PloxMemo(PloxCallable):
+	def __init__(self, function, maxsize):
+		self.function = function
+		self.maxsize = maxsize
+		# arguments and their types -> result, least recently used first
+		self.cache = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.bypassed = 0
+
+
+	def call(self, interp, args):
+		types = tuple(map(type, args))
+		if not KEY_TYPES.issuperset(types):
+			self.bypassed += 1
+			return self.function.call(interp, args)
+
+		key = (tuple(args), types)
+		cache = self.cache
+		try:
+			result = cache[key]
+		except KeyError:
+			pass
+		else:
+			cache.move_to_end(key)
+			self.hits += 1
+			return result
+
+		self.misses += 1
+		result = self.function.call(interp, args)
+		cache[key] = result
+		if self.maxsize is not None and len(cache) > self.maxsize:
+			cache.popitem(last=False)
+			self.evictions += 1
+		return result
+
+
+	def arity(self):
+		return self.function.arity()
+
+
+	def __str__(self):
+		return f'<memoized {self.function}>'
+
+
+def memoize(function, maxsize):
+	if not isinstance(function, PloxCallable):
+		raise TypeError(f"expected a function, got {type(function).__name__}")
+	if maxsize is not None and (type(maxsize) is not int or maxsize < 1):
+		raise ValueError(f"maxsize must be a positive integer or nil, got {maxsize}")
+	return PloxMemo(function, maxsize)
+
+
+def expect_memo(value):
+	if type(value) is not PloxMemo:
+		raise TypeError(f"expected a memoized function, got {type(value).__name__}")
+	return value
+
+
+def stats(memo):
+	memo = expect_memo(memo)
+	return PloxMap({
+		"hits": memo.hits,
+		"misses": memo.misses,
+		"evictions": memo.evictions,
+		"bypassed": memo.bypassed,
+		"size": len(memo.cache),
+		"maxsize": memo.maxsize,
+	})
+
+
+def clear(memo):
+	memo = expect_memo(memo)
+	memo.cache.clear()
+	memo.hits = memo.misses = memo.evictions = memo.bypassed = 0
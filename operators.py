@@ -0,0 +1,285 @@
+'''
+Handlers for every binary and unary operator, looked up once per syntax
+tree node by operator token type.
+'''
+import operator
+from scanner import TokenType
+from errors import ErrorType, runtime_error, unsupported_operands_error
+from vectors import PloxVec
+import vectors
+from ropes import Rope, ROPE_MIN, concat, plain
+
+
+def is_number(value):
+	return isinstance(value, int) or isinstance(value, float)
+
+
+def is_string(value):
+	return isinstance(value, str) or type(value) is Rope
+
+
+def has_vector(left, right):
+	return type(left) is PloxVec or type(right) is PloxVec
+
+
+def numbers_only(symbol, compute):
+	def slow_path(left, right):
+		if is_number(left) and is_number(right):
+			return compute(left, right)
+		if has_vector(left, right):
+			return vectors.operate(symbol, compute, left, right)
+		unsupported_operands_error(symbol, left, right)
+	return slow_path
+
+
+def integers_only(symbol, compute):
+	def slow_path(left, right):
+		if isinstance(left, int) and isinstance(right, int):
+			return compute(left, right)
+		if has_vector(left, right):
+			return vectors.operate(symbol, compute, left, right)
+		unsupported_operands_error(symbol, left, right)
+	return slow_path
+
+
+# binary operators
+def add_slow(left, right):
+	if is_number(left) and is_number(right):
+		return left + right
+	elif is_string(left) and is_string(right):
+		return concat(left, right)
+	elif has_vector(left, right):
+		return vectors.operate("+", operator.add, left, right)
+	unsupported_operands_error("+", left, right)
+
+
+def add(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float or (kind is str and len(left) + len(right) < ROPE_MIN)):
+		return left + right
+	return add_slow(left, right)
+
+
+subtract_slow = numbers_only("-", lambda left, right: left - right)
+
+def subtract(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left - right
+	return subtract_slow(left, right)
+
+
+def multiply_slow(left, right):
+	if is_number(left) and is_number(right):
+		return left * right
+	elif (isinstance(left, str) or isinstance(right, str)) and (isinstance(left, int) or isinstance(right, int)):
+		return left * right
+	elif has_vector(left, right):
+		return vectors.operate("*", operator.mul, left, right)
+	elif type(left) is Rope or type(right) is Rope:
+		return multiply_slow(plain(left), plain(right))
+	unsupported_operands_error("*", left, right)
+
+
+def multiply(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left * right
+	return multiply_slow(left, right)
+
+
+def divide_slow(left, right):
+	if is_number(left) and is_number(right):
+		if right == 0:
+			runtime_error(ErrorType.PloxDivisonByZeroError)
+		return left / right
+	elif has_vector(left, right):
+		return vectors.operate("/", operator.truediv, left, right)
+	unsupported_operands_error("/", left, right)
+
+
+def divide(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float) and right:
+		return left / right
+	return divide_slow(left, right)
+
+
+bit_and_slow = integers_only("&", lambda left, right: left & right)
+
+def bit_and(left, right):
+	if type(left) is int and type(right) is int:
+		return left & right
+	return bit_and_slow(left, right)
+
+
+bit_or_slow = integers_only("|", lambda left, right: left | right)
+
+def bit_or(left, right):
+	if type(left) is int and type(right) is int:
+		return left | right
+	return bit_or_slow(left, right)
+
+
+bit_xor_slow = integers_only("^", lambda left, right: left ^ right)
+
+def bit_xor(left, right):
+	if type(left) is int and type(right) is int:
+		return left ^ right
+	return bit_xor_slow(left, right)
+
+
+shift_left_slow = integers_only("<<", lambda left, right: left << right)
+
+def shift_left(left, right):
+	if type(left) is int and type(right) is int:
+		return left << right
+	return shift_left_slow(left, right)
+
+
+shift_right_slow = integers_only(">>", lambda left, right: left >> right)
+
+def shift_right(left, right):
+	if type(left) is int and type(right) is int:
+		return left >> right
+	return shift_right_slow(left, right)
+
+
+greater_slow = numbers_only(">", lambda left, right: left > right)
+
+def greater(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left > right
+	return greater_slow(left, right)
+
+
+greater_equal_slow = numbers_only(">=", lambda left, right: left >= right)
+
+def greater_equal(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left >= right
+	return greater_equal_slow(left, right)
+
+
+less_slow = numbers_only("<", lambda left, right: left < right)
+
+def less(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left < right
+	return less_slow(left, right)
+
+
+less_equal_slow = numbers_only("<=", lambda left, right: left <= right)
+
+def less_equal(left, right):
+	kind = type(left)
+	if kind is type(right) and (kind is int or kind is float):
+		return left <= right
+	return less_equal_slow(left, right)
+
+
+def mixed_numbers(left, right):
+	return (isinstance(left, int) or isinstance(right, int)) and (isinstance(left, float) or isinstance(right, float))
+
+
+def equal(left, right):
+	if type(left) == type(right) or mixed_numbers(left, right):
+		return left == right
+	if has_vector(left, right):
+		return vectors.operate("==", operator.eq, left, right)
+	if is_string(left) and is_string(right):
+		return plain(left) == plain(right)
+	unsupported_operands_error("==", left, right)
+
+
+def not_equal(left, right):
+	if type(left) == type(right) or mixed_numbers(left, right):
+		return left != right
+	if has_vector(left, right):
+		return vectors.operate("!=", operator.ne, left, right)
+	if is_string(left) and is_string(right):
+		return plain(left) != plain(right)
+	unsupported_operands_error("!=", left, right)
+
+
+BINARY_OPERATORS = {
+	TokenType.PLUS: add,
+	TokenType.MINUS: subtract,
+	TokenType.STAR: multiply,
+	TokenType.SLASH: divide,
+	TokenType.BIT_AND: bit_and,
+	TokenType.BIT_OR: bit_or,
+	TokenType.BIT_XOR: bit_xor,
+	TokenType.BIT_SHIFT_LEFT: shift_left,
+	TokenType.BIT_SHIFT_RIGHT: shift_right,
+	TokenType.GREATER: greater,
+	TokenType.GREATER_EQUAL: greater_equal,
+	TokenType.LESS: less,
+	TokenType.LESS_EQUAL: less_equal,
+	TokenType.EQUAL_EQUAL: equal,
+	TokenType.NOT_EQUAL: not_equal,
+}
+
+
+# operators whose result on two ints or two floats is the plain Python
+# operator, engines that inline their own fast path can use these
+PLAIN_NUMERIC_OPERATORS = {
+	TokenType.PLUS: operator.add,
+	TokenType.MINUS: operator.sub,
+	TokenType.STAR: operator.mul,
+	TokenType.GREATER: operator.gt,
+	TokenType.GREATER_EQUAL: operator.ge,
+	TokenType.LESS: operator.lt,
+	TokenType.LESS_EQUAL: operator.le,
+}
+
+
+# unary operators
+def negate(value):
+	if type(value) is int or type(value) is float:
+		return -value
+	if is_number(value):
+		return -int(value) if isinstance(value, int) else -float(value)
+	if type(value) is PloxVec:
+		return vectors.operate_unary("-", operator.neg, value)
+	runtime_error(ErrorType.PloxTypeError, "unsupported operand type(s) for -")
+
+
+def bit_negate(value):
+	if isinstance(value, int):
+		return ~int(value)
+	if type(value) is PloxVec:
+		return vectors.operate_unary("~", operator.invert, value)
+	runtime_error(ErrorType.PloxTypeError, "unsupported operand type(s) for ~")
+
+
+def logical_not(value):
+	if is_number(value):
+		return not value
+	return None
+
+
+UNARY_OPERATORS = {
+	TokenType.MINUS: negate,
+	TokenType.BIT_NEGATE: bit_negate,
+	TokenType.NOT: logical_not,
+}
+
+
+def unknown_binary(left, right):
+	return None
+
+
+def unknown_unary(value):
+	return None
+
+
+def binary_operator(token_type):
+	return BINARY_OPERATORS.get(token_type, unknown_binary)
+
+
+def unary_operator(token_type):
+	return UNARY_OPERATORS.get(token_type, unknown_unary)
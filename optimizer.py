@@ -0,0 +1,442 @@
+from syntax_tree import *
+from operators import is_number, mixed_numbers
+from ropes import ROPE_MIN
+from typing import List
+
+
+# largest shift folded at compile time, bigger ones are left to run time
+MAX_FOLDED_SHIFT = 64
+
+
+def can_fold(token_type, left, right):
+	'''
+	Whether `left <op> right` can be computed ahead of time: true only
+	when it can't raise a runtime error or build a huge value.
+	'''
+	if token_type in (TokenType.MINUS, TokenType.STAR, TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL):
+		return is_number(left) and is_number(right)
+
+	if token_type == TokenType.PLUS:
+		# a longer string would be a Rope, which isn't a literal
+		return (is_number(left) and is_number(right)) or (isinstance(left, str) and isinstance(right, str) and len(left) + len(right) < ROPE_MIN)
+
+	if token_type == TokenType.SLASH:
+		return is_number(left) and is_number(right) and right != 0
+
+	if token_type in (TokenType.BIT_AND, TokenType.BIT_OR, TokenType.BIT_XOR):
+		return isinstance(left, int) and isinstance(right, int)
+
+	if token_type in (TokenType.BIT_SHIFT_LEFT, TokenType.BIT_SHIFT_RIGHT):
+		return isinstance(left, int) and isinstance(right, int) and 0 <= right <= MAX_FOLDED_SHIFT
+
+	if token_type in (TokenType.EQUAL_EQUAL, TokenType.NOT_EQUAL):
+		return type(left) == type(right) or mixed_numbers(left, right)
+
+	return False
+
+
+def can_fold_unary(token_type, value):
+	if token_type == TokenType.MINUS:
+		return is_number(value)
+	if token_type == TokenType.BIT_NEGATE:
+		return isinstance(value, int)
+	return token_type == TokenType.NOT
+
+
+class ScopeWalker(ExprVisitor, StmtVisitor):
+	'''
+	Walks resolved statements keeping a stack of the scopes Resolver
+	created, so a (depth, slot) pair can be turned back into the scope
+	that declares it.
+	'''
+	def __init__(self):
+		# the node owning each scope: a BlockStmt, a function, or a class
+		# for the scope holding `this` around its methods
+		self.scopes = list()
+
+
+	def variable_key(self, depth, slot, name):
+		if depth is None:
+			return ("global", name)
+		return (id(self.scopes[-1 - depth]), slot)
+
+
+	def declaration_key(self, slot, name):
+		if slot is None:
+			return ("global", name)
+		return (id(self.scopes[-1]), slot)
+
+
+	def walk_block(self, block):
+		if block.frame_size == 0:
+			return self.walk_stmts(block.statements)
+
+		self.scopes.append(block)
+		try:
+			return self.walk_stmts(block.statements)
+		finally:
+			self.scopes.pop()
+
+
+	def walk_function(self, function):
+		self.scopes.append(function)
+		try:
+			return self.walk_stmts(function.body)
+		finally:
+			self.scopes.pop()
+
+
+	def walk_methods(self, cls):
+		'''
+		Walks the methods of `cls`, returns what walk_function() returned for each.
+		'''
+		self.scopes.append(cls)
+		try:
+			return [self.walk_function(method) for method in cls.funcs]
+		finally:
+			self.scopes.pop()
+
+
+	def walk_stmts(self, stmts):
+		for stmt in stmts:
+			stmt.accept(self)
+
+
+class AssignmentCollector(ScopeWalker):
+	'''
+	Finds every variable that is assigned to or declared more than once.
+	'''
+	def __init__(self):
+		super().__init__()
+		self.declared = set()
+		self.reassigned = set()
+
+
+	def collect(self, stmts):
+		self.walk_stmts(stmts)
+		return self.reassigned
+
+
+	def declare(self, key):
+		if key in self.declared:
+			self.reassigned.add(key)
+		self.declared.add(key)
+
+
+	def visit_literal_expr(self, literal):
+		pass
+
+	def visit_grouping_expr(self, group):
+		group.expr.accept(self)
+
+	def visit_unary_expr(self, unary):
+		unary.right.accept(self)
+
+	def visit_binary_expr(self, binary):
+		binary.left_expr.accept(self)
+		binary.right_expr.accept(self)
+
+	def visit_logical_expr(self, logical):
+		logical.left_expr.accept(self)
+		logical.right_expr.accept(self)
+
+	def visit_variable_expr(self, var):
+		pass
+
+	def visit_assign_expr(self, assign):
+		assign.value.accept(self)
+		self.reassigned.add(self.variable_key(assign.depth, assign.slot, assign.name.lexeme))
+
+	def visit_func_call_expr(self, func_call_expr):
+		func_call_expr.callee.accept(self)
+		for arg in func_call_expr.arguments:
+			arg.accept(self)
+
+	def visit_anon_func_expr(self, anon):
+		self.walk_function(anon)
+
+	def visit_class_prop_get_expr(self, get):
+		get.obj.accept(self)
+
+	def visit_class_prop_set_expr(self, set):
+		set.obj.accept(self)
+		set.value.accept(self)
+
+	def visit_index_get_expr(self, get):
+		get.obj.accept(self)
+		get.index.accept(self)
+
+	def visit_index_set_expr(self, set):
+		set.obj.accept(self)
+		set.index.accept(self)
+		set.value.accept(self)
+
+	def visit_map_expr(self, map):
+		for expr in map.keys + map.values:
+			expr.accept(self)
+
+	def visit_this_expr(self, this):
+		pass
+
+	def visit_print_stmt(self, printt):
+		printt.expr.accept(self)
+
+	def visit_expr_stmt(self, expr_stmt):
+		expr_stmt.expr.accept(self)
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is not None:
+			var_decl.init.accept(self)
+		self.declare(self.declaration_key(var_decl.slot, var_decl.name))
+
+	def visit_block_stmt(self, block):
+		self.walk_block(block)
+
+	def visit_if_stmt(self, if_stmt):
+		if_stmt.condition.accept(self)
+		if_stmt.if_true.accept(self)
+		if if_stmt.if_false is not None:
+			if_stmt.if_false.accept(self)
+
+	def visit_while_stmt(self, while_stmt):
+		while_stmt.condition.accept(self)
+		while_stmt.body.accept(self)
+
+	def visit_func_decl_stmt(self, func_decl):
+		self.declare(self.declaration_key(func_decl.slot, func_decl.name.lexeme))
+		self.walk_function(func_decl)
+
+	def visit_return_stmt(self, ret):
+		if ret.value is not None:
+			ret.value.accept(self)
+
+	def visit_class_decl_stmt(self, cls):
+		self.declare(self.declaration_key(cls.slot, cls.name.lexeme))
+		self.walk_methods(cls)
+
+
+class Optimizer(ScopeWalker):
+	'''
+	Optional pass over resolved statements, enabled with `plox.py -O`.
+
+	- folds unary, binary and logical expressions over literals, as long as
+	  computing them can't fail at run time
+	- drops GroupingExpr wrappers, the tree already encodes precedence
+	- replaces reads of a `var` initialized with a literal and never
+	  reassigned with that literal, from the declaration onwards
+	- drops if/while branches whose condition is a literal
+	- drops the statements following a `return` in the same block, other
+	  than function declarations
+
+	Every visit_* returns the node to use in place of the one visited, a
+	statement visit returns None when the statement can be dropped.
+	'''
+	def __init__(self):
+		super().__init__()
+		self.reassigned = set()
+		self.constants = dict()
+		# > 0 while visiting the body of an if/while that isn't a block
+		self.conditional = 0
+
+
+	def optimize(self, stmts: List[Stmt]) -> List[Stmt]:
+		self.reassigned = AssignmentCollector().collect(stmts)
+		return self.walk_stmts(stmts)
+
+
+	def walk_stmts(self, stmts):
+		optimized = list()
+		returned = False
+		for stmt in stmts:
+			# functions are hoisted, the ones declared after a return can
+			# still be called by those declared before it
+			if returned and not isinstance(stmt, FunctionDeclStmt):
+				continue
+			stmt = stmt.accept(self)
+			if stmt is not None:
+				optimized.append(stmt)
+				returned = returned or isinstance(stmt, ReturnStmt)
+		return optimized
+
+
+	def optimize_branch(self, stmt):
+		self.conditional += 1
+		try:
+			optimized = stmt.accept(self)
+		finally:
+			self.conditional -= 1
+		return optimized if optimized is not None else BlockStmt([])
+
+
+	# expressions part
+	def visit_literal_expr(self, literal):
+		return literal
+
+
+	def visit_grouping_expr(self, group):
+		return group.expr.accept(self)
+
+
+	def visit_unary_expr(self, unary):
+		unary.right = unary.right.accept(self)
+
+		if isinstance(unary.right, LiteralExpr) and can_fold_unary(unary.operator.token_type, unary.right.value):
+			return LiteralExpr(unary.operate(unary.right.value))
+		return unary
+
+
+	def visit_binary_expr(self, binary):
+		binary.left_expr = binary.left_expr.accept(self)
+		binary.right_expr = binary.right_expr.accept(self)
+
+		if isinstance(binary.left_expr, LiteralExpr) and isinstance(binary.right_expr, LiteralExpr):
+			left = binary.left_expr.value
+			right = binary.right_expr.value
+			if can_fold(binary.operator.token_type, left, right):
+				return LiteralExpr(binary.operate(left, right))
+		return binary
+
+
+	def visit_logical_expr(self, logical):
+		logical.left_expr = logical.left_expr.accept(self)
+		logical.right_expr = logical.right_expr.accept(self)
+
+		if isinstance(logical.left_expr, LiteralExpr) and isinstance(logical.right_expr, LiteralExpr):
+			left = logical.left_expr.value
+			right = logical.right_expr.value
+			if logical.operator.token_type == TokenType.OR:
+				return LiteralExpr(left or right)
+			elif logical.operator.token_type == TokenType.AND:
+				return LiteralExpr(left and right)
+		return logical
+
+
+	def visit_variable_expr(self, var):
+		key = self.variable_key(var.depth, var.slot, var.name.lexeme)
+		if key in self.constants:
+			return LiteralExpr(self.constants[key])
+		return var
+
+
+	def visit_assign_expr(self, assign):
+		assign.value = assign.value.accept(self)
+		return assign
+
+
+	def visit_func_call_expr(self, func_call_expr):
+		# a callee variable is kept, the 'not a function' error reports its name
+		if not isinstance(func_call_expr.callee, VariableExpr):
+			func_call_expr.callee = func_call_expr.callee.accept(self)
+		func_call_expr.arguments = [arg.accept(self) for arg in func_call_expr.arguments]
+		return func_call_expr
+
+
+	def visit_anon_func_expr(self, anon):
+		anon.body = self.walk_function(anon)
+		return anon
+
+
+	def visit_class_prop_get_expr(self, get):
+		get.obj = get.obj.accept(self)
+		return get
+
+
+	def visit_class_prop_set_expr(self, set):
+		set.obj = set.obj.accept(self)
+		set.value = set.value.accept(self)
+		return set
+
+
+	def visit_index_get_expr(self, get):
+		get.obj = get.obj.accept(self)
+		get.index = get.index.accept(self)
+		return get
+
+
+	def visit_index_set_expr(self, set):
+		set.obj = set.obj.accept(self)
+		set.index = set.index.accept(self)
+		set.value = set.value.accept(self)
+		return set
+
+
+	def visit_map_expr(self, map):
+		map.keys = [key.accept(self) for key in map.keys]
+		map.values = [value.accept(self) for value in map.values]
+		return map
+
+
+	def visit_this_expr(self, this):
+		return this
+
+
+	# statements part
+	def visit_print_stmt(self, printt):
+		printt.expr = printt.expr.accept(self)
+		return printt
+
+
+	def visit_expr_stmt(self, expr_stmt):
+		expr_stmt.expr = expr_stmt.expr.accept(self)
+		return expr_stmt
+
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is not None:
+			var_decl.init = var_decl.init.accept(self)
+
+		key = self.declaration_key(var_decl.slot, var_decl.name)
+		# a declaration in an if/while body without braces may not run at all
+		if isinstance(var_decl.init, LiteralExpr) and key not in self.reassigned and not self.conditional:
+			self.constants[key] = var_decl.init.value
+		return var_decl
+
+
+	def visit_block_stmt(self, block):
+		block.statements = self.walk_block(block)
+		return block
+
+
+	def visit_if_stmt(self, if_stmt):
+		if_stmt.condition = if_stmt.condition.accept(self)
+
+		if isinstance(if_stmt.condition, LiteralExpr):
+			live, dead = if_stmt.if_true, if_stmt.if_false
+			if not if_stmt.condition.value:
+				live, dead = dead, live
+			# what a dropped branch declares would go missing from the enclosing scope
+			if dead is None or not branch_declarations(dead):
+				return self.optimize_branch(live) if live is not None else None
+
+		if_stmt.if_true = self.optimize_branch(if_stmt.if_true)
+		if if_stmt.if_false is not None:
+			if_stmt.if_false = self.optimize_branch(if_stmt.if_false)
+		return if_stmt
+
+
+	def visit_while_stmt(self, while_stmt):
+		while_stmt.condition = while_stmt.condition.accept(self)
+
+		if isinstance(while_stmt.condition, LiteralExpr) and not while_stmt.condition.value \
+				and not branch_declarations(while_stmt.body):
+			return None
+
+		while_stmt.body = self.optimize_branch(while_stmt.body)
+		return while_stmt
+
+
+	def visit_func_decl_stmt(self, func_decl):
+		func_decl.body = self.walk_function(func_decl)
+		return func_decl
+
+
+	def visit_return_stmt(self, ret):
+		if ret.value is not None:
+			ret.value = ret.value.accept(self)
+		return ret
+
+
+	def visit_class_decl_stmt(self, cls):
+		for method, body in zip(cls.funcs, self.walk_methods(cls)):
+			method.body = body
+		return cls
@@ -0,0 +1,65 @@
+'''
+Buffered standard output of an interpreter.
+'''
+import sys
+
+
+# characters collected before they're written out
+DEFAULT_LIMIT = 1 << 16
+
+
+class Output:
+	'''
+	Stands in for sys.stdout while a script runs, writing what it prints in
+	blocks of `limit` characters, or every line right away when unbuffered.
+	'''
+	def __init__(self, buffered=True, limit=DEFAULT_LIMIT):
+		self.stream = sys.stdout
+		self.limit = limit if buffered else 0
+		self.parts = list()
+		self.size = 0
+
+
+	def write_line(self, text):
+		parts = self.parts
+		parts.append(text)
+		parts.append("\n")
+		self.size += len(text) + 1
+		if self.size >= self.limit:
+			self.flush()
+
+
+	def write(self, text):
+		self.parts.append(text)
+		self.size += len(text)
+		if self.size >= self.limit:
+			self.flush()
+		return len(text)
+
+
+	def flush(self):
+		if self.parts:
+			text = "".join(self.parts)
+			self.parts.clear()
+			self.size = 0
+			self.stream.write(text)
+		self.stream.flush()
+
+
+	def __getattr__(self, name):
+		# everything else a file has, like isatty() and encoding, is the real stdout's
+		return getattr(self.stream, name)
+
+
+	def __enter__(self):
+		self.stream = sys.stdout
+		if self.stream.isatty():
+			# someone is watching, show every line as it's printed
+			self.limit = 0
+		sys.stdout = self
+		return self
+
+
+	def __exit__(self, *exc_info):
+		sys.stdout = self.stream
+		self.flush()
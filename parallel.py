@@ -0,0 +1,199 @@
+'''
+Plox functions running in a pool of worker processes, with the `spawn`,
+`wait`, `await_all` and `parallel_map` natives.
+'''
+import array
+import io
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from globals import Builtins, NativeFunction, expect_function
+from iterators import PloxIterator
+from events import PloxTask, running
+from maps import PloxMap, expect_map
+from arrays import PloxArray
+from vm import VM, Upvalue
+
+
+# parallel_map splits its items into this many chunks per worker, fewer
+# chunks send the globals fewer times, more even out uneven calls
+CHUNKS_PER_WORKER = 4
+
+WORKERS = os.cpu_count() or 1
+
+pool = None
+
+
+class PloxFuture:
+	'''
+	Result of a spawned call, pickled until wait() first needs it.
+	'''
+	__slots__ = ("future", "builtins", "value")
+
+	def __init__(self, future, builtins):
+		self.future = future
+		self.builtins = builtins
+		self.value = None
+
+
+	def get(self):
+		if self.future is not None:
+			self.value = loads(result_of(self.future), self.builtins)[0]
+			self.future = None
+		return self.value
+
+
+	def __str__(self):
+		return "<future>"
+
+
+class Pickler(pickle.Pickler):
+	def __init__(self, file, engine):
+		super().__init__(file, pickle.HIGHEST_PROTOCOL)
+		self.engine = engine
+
+
+	# natives go by name and are looked up again in the worker
+	def persistent_id(self, obj):
+		if isinstance(obj, NativeFunction):
+			return ("native", obj.name)
+		if type(obj) is Builtins:
+			return ("builtins", None)
+		return None
+
+
+	def reducer_override(self, obj):
+		kind = type(obj)
+		if kind is PloxIterator or kind is PloxFuture or kind is PloxTask:
+			return (type(None), ())
+		if kind is memoryview:
+			# an array slice, the worker gets the elements as an array of their own
+			return (array.array, (obj.format, obj.tobytes()))
+		if kind is Upvalue and obj.index >= 0:
+			# the variable is still on the VM's stack, the copy takes its value
+			return (closed_upvalue, (self.engine.stack[obj.index],))
+		return NotImplemented
+
+
+class Unpickler(pickle.Unpickler):
+	def __init__(self, data, builtins):
+		super().__init__(io.BytesIO(data))
+		self.builtins = builtins
+
+
+	def persistent_load(self, pid):
+		kind, name = pid
+		if kind == "builtins":
+			return self.builtins
+		return self.builtins.lookup(name)
+
+
+def closed_upvalue(value):
+	upvalue = Upvalue(-1)
+	upvalue.value = value
+	return upvalue
+
+
+def dumps(value, engine):
+	buffer = io.BytesIO()
+	try:
+		Pickler(buffer, engine).dump(value)
+	except (pickle.PicklingError, TypeError, AttributeError) as e:
+		raise TypeError(f"can't send a value to another process: {e}")
+	return buffer.getvalue()
+
+
+def loads(data, builtins):
+	return Unpickler(data, builtins).load()
+
+
+def builtins_of(engine):
+	return engine.builtins if isinstance(engine, VM) else engine.globals.builtins
+
+
+def run_calls(engine_class, shared, calls):
+	'''
+	Runs in a worker: calls the function pickled in `shared` once for
+	every list of arguments in `calls` and returns their results pickled.
+	'''
+	engine = engine_class()
+	builtins = builtins_of(engine)
+	globals_, function = loads(shared, builtins)
+	engine.globals = globals_
+	if not isinstance(engine, VM):
+		engine.var_env = globals_
+
+	with engine.output, running(engine):
+		results = [function.call(engine, args) for args in loads(calls, builtins)]
+	return dumps(results, engine)
+
+
+def start_worker():
+	# a forked worker inherits the Output standing in for stdout
+	sys.stdout = sys.__stdout__
+
+
+def submit(engine, shared, calls):
+	global pool
+	if pool is None:
+		pool = ProcessPoolExecutor(WORKERS, initializer=start_worker)
+
+	# whatever the script printed so far comes first, and isn't copied into a forked worker
+	sys.stdout.flush()
+	return pool.submit(run_calls, type(engine), shared, dumps(calls, engine))
+
+
+def result_of(future):
+	try:
+		return future.result()
+	except BrokenProcessPool:
+		raise OSError("a worker process stopped unexpectedly")
+	except SystemExit:
+		# a runtime error in the worker, which has reported it, stops the script
+		pool.shutdown(wait=False, cancel_futures=True)
+		raise
+
+
+def spawn(engine, function=None, *args):
+	expect_function(function, len(args))
+	shared = dumps((engine.globals, function), engine)
+	return PloxFuture(submit(engine, shared, [list(args)]), builtins_of(engine))
+
+
+def wait(engine, future):
+	if type(future) is not PloxFuture:
+		raise TypeError(f"expected a future, got {type(future).__name__}")
+	return future.get()
+
+
+def await_all(engine, futures):
+	return PloxMap({key: wait(engine, future) for key, future in expect_map(futures).items()})
+
+
+def parallel_map(engine, function, items):
+	'''
+	Map with the keys of `items`, a map or an array, and the results of
+	calling `function` with their values.
+	'''
+	if type(items) is PloxArray:
+		keys = range(len(items))
+		values = items.items.tolist()
+	elif type(items) is PloxMap:
+		keys = list(items.entries)
+		values = list(items.entries.values())
+	else:
+		raise TypeError(f"expected an array or a map, got {type(items).__name__}")
+	expect_function(function, 1)
+
+	shared = dumps((engine.globals, function), engine)
+	size = -(-len(values) // (WORKERS * CHUNKS_PER_WORKER)) or 1
+	futures = [submit(engine, shared, [[value] for value in values[at:at + size]])
+		for at in range(0, len(values), size)]
+
+	builtins = builtins_of(engine)
+	results = list()
+	for future in futures:
+		results.extend(loads(result_of(future), builtins))
+	return PloxMap(dict(zip(keys, results)))
@@ -1,13 +1,18 @@
 import sys
 from scanner import *
 from syntax_tree import *
-from typing import List
+from typing import Iterable, List
 
 
 class Parser:
-	def __init__(self, tokens: List[Token]):
-		self.tokens = tokens
-		self.current = 0
+	'''
+	Recursive descent parser. Tokens are pulled from any iterable, a list or
+	Scanner.iter_tokens(), and only the current and previous ones are kept.
+	'''
+	def __init__(self, tokens: Iterable[Token]):
+		self.tokens = iter(tokens)
+		self.current_token = next(self.tokens)
+		self.previous_token = None
 
 		# for token in tokens:
 		# 	print(token)
@@ -26,6 +31,13 @@ class Parser:
 
 
 	def parse_stmt(self):
+		line = self.peek().line
+		stmt = self.parse_stmt_kind()
+		stmt.line = line
+		return stmt
+
+
+	def parse_stmt_kind(self):
 		# parsing of variable declaration starts here
 		if self.match(TokenType.VAR):
 			return self.parse_var_decl_stmt()
@@ -53,11 +65,11 @@ class Parser:
 			condition = self.parse_expr()
 			self.consume(TokenType.RIGHT_PAREN, "Expected ')' after conditional expression")
 
-			if_true = self.parse_var_decl_stmt()
+			if_true = self.parse_stmt()
 			if_false = None
 			if self.match(TokenType.ELSE):
 				self.advance()
-				if_false = self.parse_var_decl_stmt()
+				if_false = self.parse_stmt()
 
 			if_stmt = IfStmt(condition, if_true, if_false)
 			return if_stmt
@@ -68,7 +80,7 @@ class Parser:
 			condition = self.parse_expr()
 			self.consume(TokenType.RIGHT_PAREN, "Expected ')' after conditional expression")
 
-			body = self.parse_var_decl_stmt()
+			body = self.parse_stmt()
 			while_stmt = WhileStmt(condition, body)
 			return while_stmt
 
@@ -133,13 +145,20 @@ class Parser:
 	def parse_class_decl_stmt(self):
 		'''
 		Class is a collection of variables and method(function).
+		Methods reach their instance through `this`, a method named `init`
+		runs on every new instance and takes the arguments of the class call.
 
 		Syntax:
 
 		class ObjName {
+			fun init(greeting)
+			{
+				this.greeting = greeting;
+			}
+
 			fun callMe()
 			{
-				print("Hello world");
+				print(this.greeting);
 			}
 		}
 		'''
@@ -150,6 +169,8 @@ class Parser:
 
 		methods = list()
 		while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
+			if not self.check(TokenType.FUN):
+				self.error(self.peek(), "Expected method declaration in class body")
 			methods.append(self.parse_func_decl_stmt())
 
 		self.consume(TokenType.RIGHT_BRACE, "Expected '}' after class body")
@@ -190,7 +211,7 @@ class Parser:
 		anon_func = None
 
 		if self.match(TokenType.FUN):
-			self.advance()
+			keyword = self.advance()
 			self.consume(TokenType.LEFT_PAREN, "Expected '(' after 'fun' keyword in anonymous function expression")
 
 			params = list()
@@ -209,7 +230,7 @@ class Parser:
 			self.consume(TokenType.LEFT_BRACE, "Expected '{' before function body")
 			body = self.parse_block_stmt()
 
-			anon_func = AnonFunctionExpr(params, body)
+			anon_func = AnonFunctionExpr(params, body, keyword.line)
 			return anon_func
 
 		return self.parse_assign_expr()
@@ -228,6 +249,8 @@ class Parser:
 			elif isinstance(expr, ClassPropertyGetExpr):
 				set = ClassPropertySetExpr(expr.obj, expr.name, value)
 				return set
+			elif isinstance(expr, IndexGetExpr):
+				return IndexSetExpr(expr.obj, expr.bracket, expr.index, value)
 
 			print("Invalid lvalue")
 			sys.exit(16)
@@ -237,7 +260,7 @@ class Parser:
 	def parse_or_expr(self):
 		expr = self.parse_and_expr()
 
-		if self.match(TokenType.OR):
+		while self.match(TokenType.OR):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_and_expr()
@@ -249,7 +272,7 @@ class Parser:
 	def parse_and_expr(self):
 		expr = self.parse_bitwise()
 
-		if self.match(TokenType.AND):
+		while self.match(TokenType.AND):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_bitwise()
@@ -261,7 +284,7 @@ class Parser:
 	def parse_bitwise(self):
 		expr = self.parse_equality()
 
-		if self.match(TokenType.BIT_AND, TokenType.BIT_OR, TokenType.BIT_XOR, TokenType.BIT_SHIFT_LEFT, TokenType.BIT_SHIFT_RIGHT):
+		while self.match(TokenType.BIT_AND, TokenType.BIT_OR, TokenType.BIT_XOR, TokenType.BIT_SHIFT_LEFT, TokenType.BIT_SHIFT_RIGHT):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_equality()
@@ -273,7 +296,7 @@ class Parser:
 	def parse_equality(self):
 		expr = self.parse_comparision()
 
-		if self.match(TokenType.NOT_EQUAL, TokenType.EQUAL_EQUAL):
+		while self.match(TokenType.NOT_EQUAL, TokenType.EQUAL_EQUAL):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_comparision()
@@ -285,7 +308,7 @@ class Parser:
 	def parse_comparision(self):
 		expr = self.parse_term()
 
-		if self.match(TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL):
+		while self.match(TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_term()
@@ -297,7 +320,7 @@ class Parser:
 	def parse_term(self):
 		expr = self.parse_factor()
 
-		if self.match(TokenType.MINUS, TokenType.PLUS):
+		while self.match(TokenType.MINUS, TokenType.PLUS):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_factor()
@@ -309,7 +332,7 @@ class Parser:
 	def parse_factor(self):
 		expr = self.parse_unary()
 
-		if self.match(TokenType.SLASH, TokenType.STAR):
+		while self.match(TokenType.SLASH, TokenType.STAR):
 			operator = self.peek()
 			self.advance()
 			right = self.parse_unary()
@@ -330,28 +353,39 @@ class Parser:
 
 
 	def parse_func_call(self):
+		'''
+		Calls, property accesses and indexing chain left to right: `a.b(1).c[2]()`
+		'''
 		expr = self.parse_primary()
 
-		if self.check(TokenType.LEFT_PAREN):
-			self.advance() # advance pass (
-			args: List[Expr] = list()
-
-			if not self.check(TokenType.RIGHT_PAREN):
-				args.append(self.parse_expr())
+		while True:
+			if self.check(TokenType.LEFT_PAREN):
+				self.advance() # advance pass (
+				args: List[Expr] = list()
 
-				while self.check(TokenType.COMMA):
-					self.advance()
+				if not self.check(TokenType.RIGHT_PAREN):
 					args.append(self.parse_expr())
 
-			self.consume(TokenType.RIGHT_PAREN, "Expected ')' to end function call")
-			expr = FunctionCallExpr(expr, args)
+					while self.check(TokenType.COMMA):
+						self.advance()
+						args.append(self.parse_expr())
 
-		elif self.check(TokenType.DOT):
-			self.advance() # advance pass '.'
-			name = self.consume(TokenType.IDENTIFIER, "Expected property name after '.'")
-			expr = ClassPropertyGetExpr(expr, name)
+				self.consume(TokenType.RIGHT_PAREN, "Expected ')' to end function call")
+				expr = FunctionCallExpr(expr, args)
 
-		return expr
+			elif self.check(TokenType.DOT):
+				self.advance() # advance pass '.'
+				name = self.consume(TokenType.IDENTIFIER, "Expected property name after '.'")
+				expr = ClassPropertyGetExpr(expr, name)
+
+			elif self.check(TokenType.LEFT_BRACKET):
+				bracket = self.advance()
+				index = self.parse_expr()
+				self.consume(TokenType.RIGHT_BRACKET, "Expected ']' after index")
+				expr = IndexGetExpr(expr, bracket, index)
+
+			else:
+				return expr
 
 
 	def parse_primary(self):
@@ -383,9 +417,36 @@ class Parser:
 			expr = VariableExpr(self.peek())
 			self.advance()
 
+		if self.match(TokenType.THIS):
+			expr = ThisExpr(self.peek())
+			self.advance()
+
+		if self.match(TokenType.LEFT_BRACE):
+			expr = self.parse_map()
+
 		return expr
 
 
+	def parse_map(self):
+		'''
+		Map literal, `{key: value, ...}` with an optional trailing comma.
+		'''
+		brace = self.advance()
+		keys: List[Expr] = list()
+		values: List[Expr] = list()
+
+		while not self.check(TokenType.RIGHT_BRACE):
+			keys.append(self.parse_expr())
+			self.consume(TokenType.COLON, "Expected ':' after map key")
+			values.append(self.parse_expr())
+			if not self.check(TokenType.COMMA):
+				break
+			self.advance()
+
+		self.consume(TokenType.RIGHT_BRACE, "Expected '}' after map entries")
+		return MapExpr(brace, keys, values)
+
+
 	def consume(self, typ, msg):
 		if self.check(typ):
 			return self.advance()
@@ -407,7 +468,8 @@ class Parser:
 
 	def advance(self):
 		if not self.is_at_end():
-			self.current += 1
+			self.previous_token = self.current_token
+			self.current_token = next(self.tokens)
 		return self.previous()
 
 
@@ -422,8 +484,8 @@ class Parser:
 
 
 	def peek(self):
-		return self.tokens[self.current]
+		return self.current_token
 
 
 	def previous(self):
-		return self.tokens[self.current - 1]
+		return self.previous_token
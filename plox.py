@@ -3,40 +3,125 @@
 import sys
 import os
 import argparse
+import importlib
 from typing import List, Dict, Tuple
 
 # custom
 from scanner import Token, Scanner
 from parser import Parser
-from interpreter import Interpreter
+from resolver import Resolver
+from syntax_tree import ASTPrinter
+import cache
+
+
+# part of every cache entry's key, bump it whenever the syntax tree or
+# anything that annotates it changes
+VERSION = "0.9.0"
+
+
+# milliseconds between two --sample samples
+SAMPLE_INTERVAL = 5
+
+
+# module and class of each engine, only the one a script runs on gets imported,
+# like the optimizer, profiler and sampler are only with their options
+ENGINES = {
+	"tree": ("interpreter", "Interpreter"),
+	"closure": ("closure_compiler", "ClosureInterpreter"),
+	"vm": ("vm", "VM"),
+}
+
+
+def make_engine(engine, buffered=True):
+	module, name = ENGINES[engine]
+	return getattr(importlib.import_module(module), name)(buffered=buffered)
 
 
 def error(line, message):
 	print(f"[{line}]: {message}")
 
 
-def run(program):
-	scan = Scanner(program)
-	tokens = scan.scan_tokens()
-	parser = Parser(tokens)
+def parse(scan: Scanner):
+	parser = Parser(scan.iter_tokens())
 	stmts = parser.parse()
-	interp = Interpreter()
-	interp.interpret(stmts)
+	Resolver().resolve(stmts)
+	return stmts
+
+
+def run(stmts, options):
+	if options.optimize:
+		from optimizer import Optimizer
+		stmts = Optimizer().optimize(stmts)
+
+	if options.dump_ast:
+		print(ASTPrinter().print_stmts(stmts))
+		return
 
+	if options.disassemble:
+		from bytecode import disassemble
+		from bytecode_compiler import BytecodeCompiler, CompileError
+		try:
+			disassemble(BytecodeCompiler().compile(stmts))
+		except CompileError as e:
+			print(f"CompileError: {e}")
+			sys.exit(12)
+		return
 
-def run_program(file_name):
-	with open(file_name) as f:
-		byte_array = bytearray()
-		while True:
-			byte = f.read(1)
-			if not byte:
-				break
-			byte_array.append(ord(byte))
-		run(byte_array.decode())
+	interp = make_engine(options.engine, buffered=not options.unbuffered)
+	if not options.profile and not options.sample:
+		interp.interpret(stmts)
+		return
 
+	profiler = None
+	if options.profile:
+		from profiler import Profiler
+		profiler = Profiler(options.script)
+		profiler.install()
 
-def run_prompt():
-	interp = Interpreter()
+	sampler = None
+	if options.sample:
+		from sampler import SamplingProfiler
+		sampler = SamplingProfiler(options.sample_interval / 1000)
+		sampler.install(interp)
+		sampler.start()
+
+	try:
+		interp.interpret(stmts)
+	finally:
+		# also runs when the script stops with a runtime error
+		if sampler is not None:
+			sampler.stop()
+			sampler.write(options.sample)
+
+		if profiler is not None:
+			profiler.uninstall()
+			if options.profile_output:
+				profiler.dump(options.profile_output)
+			else:
+				profiler.report(options.profile_sort)
+
+
+def run_program(file_name, options):
+	with open(file_name, encoding="utf-8") as f:
+		program = f.read()
+
+	stmts = None
+	if options.use_cache:
+		stmts = cache.load(file_name, program, VERSION, options.cache_dir)
+
+	if stmts is None:
+		scan = Scanner(program)
+		stmts = parse(scan)
+		# scan errors are only reported, keep them showing up on every run
+		if options.use_cache and not scan.had_error:
+			cache.store(file_name, program, VERSION, stmts, options.cache_dir)
+
+	run(stmts, options)
+
+
+def run_prompt(engine="tree", buffered=True):
+	# output still shows up after every line entered, buffered or not
+	interp = make_engine(engine, buffered)
 	while True:
 		line = input(">>> ")
 		if line is not None:
@@ -48,18 +133,49 @@ def run_prompt():
 					line += temp
 				line += "}"
 
-			scan = Scanner(line)
-			tokens = scan.scan_tokens()
-			parser = Parser(tokens)
-			stmts = parser.parse()
+			stmts = parse(Scanner(line))
 			interp.interpret(stmts)
 
 
 if __name__ == "__main__":
-	if len(sys.argv) > 2:
-		print("Usage: plox [script]")
-		sys.exit(32)
-	elif len(sys.argv) == 2:
-		run_program(sys.argv[1])
+	arg_parser = argparse.ArgumentParser(prog="plox")
+	arg_parser.add_argument("--version", action="version", version=f"%(prog)s {VERSION}")
+	arg_parser.add_argument("script", nargs="?", help="plox script to run, starts the prompt when omitted")
+	arg_parser.add_argument("--engine", choices=ENGINES.keys(), default="tree",
+		help="execution engine: 'tree' walks the syntax tree, 'closure' compiles it to closures first, 'vm' compiles it to bytecode")
+	arg_parser.add_argument("--unbuffered", action="store_true", help="write every printed line right away instead of collecting output, for watching a script's progress")
+	arg_parser.add_argument("--disassemble", action="store_true", help="print the bytecode of the script instead of running it")
+	arg_parser.add_argument("-O", dest="optimize", action="store_true", help="fold constants and drop dead branches before running the script")
+	arg_parser.add_argument("--dump-ast", action="store_true", help="print the syntax tree of the script, after -O if given, instead of running it")
+	arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false", help="always parse the script, don't read or write __ploxcache__")
+	arg_parser.add_argument("--cache-dir", help=f"keep parsed scripts under this directory instead of a {cache.CACHE_DIR_NAME} directory next to each script")
+	arg_parser.add_argument("--bench", action="store_true", help="run the benchmarks/ suite with the chosen engine and compare it to the stored baseline")
+	arg_parser.add_argument("--profile", action="store_true", help="count calls and time spent in each plox function, report printed to stderr at exit")
+	arg_parser.add_argument("--profile-sort", default="tottime", help="column the --profile report is sorted by: tottime, cumtime, calls or name")
+	arg_parser.add_argument("--profile-output", metavar="FILE", help="write --profile data to FILE in pstats format instead of printing it")
+	arg_parser.add_argument("--sample", metavar="FILE", help="sample the plox call stack while the script runs and write it to FILE as folded stacks, for flame graphs")
+	arg_parser.add_argument("--sample-interval", metavar="MS", type=float, default=SAMPLE_INTERVAL,
+		help=f"milliseconds between two --sample samples (default {SAMPLE_INTERVAL:g})")
+	args = arg_parser.parse_args()
+
+	if args.profile_output:
+		args.profile = True
+	if args.profile and args.engine == "vm":
+		arg_parser.error("--profile supports the 'tree' and 'closure' engines")
+	if args.profile:
+		from profiler import SORT_KEYS
+		if args.profile_sort not in SORT_KEYS:
+			arg_parser.error(f"--profile-sort must be one of {', '.join(SORT_KEYS)}")
+	if args.sample and args.engine == "vm":
+		arg_parser.error("--sample supports the 'tree' and 'closure' engines")
+	if args.sample_interval <= 0:
+		arg_parser.error("--sample-interval must be positive")
+
+	if args.bench:
+		# only needed here, keep it out of every script's startup
+		import bench
+		sys.exit(bench.run_suite(args.engine, args.optimize))
+	elif args.script:
+		run_program(args.script, args)
 	else:
-		run_prompt()
+		run_prompt(args.engine, not args.unbuffered)
@@ -0,0 +1,201 @@
+'''
+Deterministic profiler for Plox programs, enabled with `plox.py --profile`.
+Functions are keyed the way cProfile keys them, so pstats reads the stats.
+'''
+import sys
+import time
+from typing import Dict, List, Tuple
+
+
+# sort keys accepted by --profile-sort, a subset of pstats' own
+SORT_KEYS = ("tottime", "cumtime", "calls", "name")
+
+# file name cProfile uses for builtins
+NATIVE_FILE = "~"
+
+
+class Profiler:
+	def __init__(self, script_name="<script>", clock=time.perf_counter):
+		self.script_name = script_name
+		self.clock = clock
+
+		# key -> [primitive calls, total calls, self time, inclusive time, callers]
+		# where callers maps a caller's key to the same four numbers for the
+		# calls made from it, the layout pstats expects
+		self.stats: Dict[Tuple, list] = dict()
+		# entries for active calls: [key, start time, time spent in callees]
+		self.stack: List[list] = list()
+		# number of active calls per key, inclusive time only counts the outermost
+		self.active: Dict[Tuple, int] = dict()
+		self.patched = list()
+
+
+	def function_key(self, function):
+		declaration = function.declaration
+		name = declaration.name.lexeme if declaration.name is not None else "<anonymous>"
+		return (self.script_name, declaration.line or 0, name)
+
+
+	def class_key(self, klass):
+		return (self.script_name, 0, f"<class {klass.name}>")
+
+
+	def native_key(self, native):
+		return (NATIVE_FILE, 0, f"<native {type(native).__name__.lower()}>")
+
+
+	def install(self):
+		import callable as callables
+		from callable import PloxCallable, PloxFunction, PloxClass
+		from globals import NativeFunction
+
+		self.patch(PloxFunction, self.function_key)
+		self.patch_tail_calls(callables)
+		self.patch(PloxClass, self.class_key)
+		self.patch_natives(NativeFunction)
+
+		natives = list(PloxCallable.__subclasses__())
+		while natives:
+			native = natives.pop()
+			natives.extend(native.__subclasses__())
+			# subclasses of NativeFunction are wrapped by patch_natives
+			if native not in (PloxFunction, PloxClass) and not issubclass(native, NativeFunction):
+				self.patch(native, self.native_key)
+
+
+	def uninstall(self):
+		for cls, name, original in reversed(self.patched):
+			setattr(cls, name, original)
+		self.patched.clear()
+
+
+	def patch(self, cls, key_of):
+		if "call" not in cls.__dict__:
+			return
+
+		original = cls.__dict__["call"]
+		enter = self.enter
+		leave = self.leave
+
+		def call(callee, interp, args):
+			enter(key_of(callee))
+			try:
+				return original(callee, interp, args)
+			finally:
+				leave()
+
+		cls.call = call
+		self.patched.append((cls, "call", original))
+
+
+	def patch_tail_calls(self, module):
+		enter = self.enter
+		leave = self.leave
+		function_key = self.function_key
+
+		def on_tail_call(function):
+			# the call returned from is replaced by the new one, so is its entry
+			leave()
+			enter(function_key(function))
+
+		self.patched.append((module, "on_tail_call", module.on_tail_call))
+		module.on_tail_call = on_tail_call
+
+
+	def patch_natives(self, cls):
+		# engines call a native's Python function directly, so every native
+		# made while installed gets a wrapped function instead
+		original = cls.__dict__["__init__"]
+		enter = self.enter
+		leave = self.leave
+
+		def __init__(native, name, argc, function):
+			key = (NATIVE_FILE, 0, f"<native {name}>")
+
+			def profiled(*args):
+				enter(key)
+				try:
+					return function(*args)
+				finally:
+					leave()
+
+			original(native, name, argc, profiled)
+
+		cls.__init__ = __init__
+		self.patched.append((cls, "__init__", original))
+
+
+	def enter(self, key):
+		self.active[key] = self.active.get(key, 0) + 1
+		self.stack.append([key, self.clock(), 0.0])
+
+
+	def leave(self):
+		now = self.clock()
+		key, start, in_callees = self.stack.pop()
+		elapsed = now - start
+		own_time = elapsed - in_callees
+
+		self.active[key] -= 1
+		outermost = self.active[key] == 0
+
+		entry = self.stats.get(key)
+		if entry is None:
+			entry = self.stats[key] = [0, 0, 0.0, 0.0, dict()]
+		self.record(entry, outermost, own_time, elapsed)
+
+		if self.stack:
+			caller = self.stack[-1]
+			caller[2] += elapsed
+			caller_entry = entry[4].get(caller[0])
+			if caller_entry is None:
+				caller_entry = entry[4][caller[0]] = [0, 0, 0.0, 0.0]
+			self.record(caller_entry, outermost, own_time, elapsed)
+
+
+	def record(self, entry, outermost, own_time, elapsed):
+		if outermost:
+			entry[0] += 1
+			entry[3] += elapsed
+		entry[1] += 1
+		entry[2] += own_time
+
+
+	def finish(self):
+		# calls still active when the program exited through an error
+		while self.stack:
+			self.leave()
+
+
+	def collected(self):
+		stats = dict()
+		for key, (cc, nc, tt, ct, callers) in self.stats.items():
+			# pstats keeps total calls first for callers
+			callers = {caller: (c_nc, c_cc, c_tt, c_ct) for caller, (c_cc, c_nc, c_tt, c_ct) in callers.items()}
+			stats[key] = (cc, nc, tt, ct, callers)
+		return stats
+
+
+	def to_pstats(self, stream=None):
+		# pstats takes a while to import, only load it once there is a report to make
+		import pstats
+		self.finish()
+		holder = _StatsHolder(self.collected())
+		return pstats.Stats(holder, stream=stream or sys.stderr)
+
+
+	def report(self, sort="tottime", limit=30, stream=None):
+		self.to_pstats(stream).sort_stats(sort).print_stats(limit)
+
+
+	def dump(self, path):
+		self.to_pstats().dump_stats(path)
+
+
+# pstats.Stats() reads profile data from any object with `stats` and create_stats()
+class _StatsHolder:
+	def __init__(self, stats):
+		self.stats = stats
+
+	def create_stats(self):
+		pass
@@ -0,0 +1,260 @@
+import sys
+from syntax_tree import *
+from typing import List, Dict
+
+
+class Scope:
+	def __init__(self, block=None):
+		self.slots: Dict[str, int] = dict()
+		# BlockStmt the scope belongs to, None for a function's scope
+		self.block = block
+
+
+class Resolver(ExprVisitor, StmtVisitor):
+	'''
+	Static pass run between Parser and Interpreter.
+
+	Gives every variable declared in a block or function a slot in that
+	scope's frame, and annotates each VariableExpr/AssignExpr with the
+	depth (number of frames to walk up) and slot it refers to. Names that
+	don't resolve to any enclosing scope are left with depth None and are
+	looked up in the globals by name.
+
+	Names bind to the variables declared before them, the way the bytecode
+	compiler binds them. Only the functions declared directly in a scope get
+	their slots up front, so they can call each other in any order.
+
+	Blocks that declare nothing get no scope and run in the enclosing frame.
+	Blocks with a function inside are marked as captured, the interpreter
+	can reuse the frames of all other blocks.
+
+	Returns of a call made inside a function are marked as tail calls, the
+	engines run those without growing the stack.
+
+	The methods of a class get a scope of their own around them holding
+	just `this`, the frame binding a method to an instance.
+	'''
+	def __init__(self):
+		self.scopes: List[Scope] = list()
+		self.in_function = False
+
+
+	def resolve(self, stmts: List[Stmt]):
+		for stmt in stmts:
+			stmt.accept(self)
+		return stmts
+
+
+	def resolve_function(self, function):
+		# the function keeps the frames around it alive as its closure
+		for scope in self.scopes:
+			if scope.block is not None:
+				scope.block.captured = True
+
+		in_function = self.in_function
+		self.in_function = True
+		self.begin_scope()
+
+		for param in function.parameters:
+			self.declare(param.lexeme)
+
+		self.hoist_functions(function.body)
+		for stmt in function.body:
+			stmt.accept(self)
+
+		function.frame_size = self.end_scope()
+		self.in_function = in_function
+
+
+	def hoist_functions(self, stmts):
+		for stmt in stmts:
+			if isinstance(stmt, FunctionDeclStmt):
+				self.declare(stmt.name.lexeme)
+
+
+	def begin_scope(self, block=None):
+		self.scopes.append(Scope(block))
+
+
+	def end_scope(self):
+		return len(self.scopes.pop().slots)
+
+
+	def declares_variables(self, stmts):
+		'''
+		Whether running `stmts` can declare a variable in their own scope.
+		'''
+		for stmt in stmts:
+			if isinstance(stmt, (VarDeclareStmt, FunctionDeclStmt, ClassDeclStmt)):
+				return True
+			if isinstance(stmt, IfStmt):
+				branches = [stmt.if_true] if stmt.if_false is None else [stmt.if_true, stmt.if_false]
+				if self.declares_variables(branches):
+					return True
+			if isinstance(stmt, WhileStmt) and self.declares_variables([stmt.body]):
+				return True
+		return False
+
+
+	def declare(self, name):
+		'''
+		Returns the slot of `name` in the innermost scope, or None at top level.
+		'''
+		if not self.scopes:
+			return None
+
+		slots = self.scopes[-1].slots
+		slot = slots.get(name)
+		if slot is None:
+			slot = len(slots)
+			slots[name] = slot
+		return slot
+
+
+	def resolve_local(self, expr, name):
+		for depth, scope in enumerate(reversed(self.scopes)):
+			slot = scope.slots.get(name)
+			if slot is not None:
+				expr.depth = depth
+				expr.slot = slot
+				return
+
+		expr.depth = None
+		expr.slot = None
+
+
+	# expressions part
+	def visit_literal_expr(self, literal):
+		pass
+
+
+	def visit_grouping_expr(self, group):
+		group.expr.accept(self)
+
+
+	def visit_unary_expr(self, unary):
+		unary.right.accept(self)
+
+
+	def visit_binary_expr(self, binary):
+		binary.left_expr.accept(self)
+		binary.right_expr.accept(self)
+
+
+	def visit_logical_expr(self, logical):
+		logical.left_expr.accept(self)
+		logical.right_expr.accept(self)
+
+
+	def visit_variable_expr(self, var):
+		self.resolve_local(var, var.name.lexeme)
+
+
+	def visit_assign_expr(self, assign):
+		assign.value.accept(self)
+		self.resolve_local(assign, assign.name.lexeme)
+
+
+	def visit_func_call_expr(self, func_call_expr):
+		func_call_expr.callee.accept(self)
+		for arg in func_call_expr.arguments:
+			arg.accept(self)
+
+
+	def visit_anon_func_expr(self, anon):
+		self.resolve_function(anon)
+
+
+	def visit_class_prop_get_expr(self, get):
+		get.obj.accept(self)
+
+
+	def visit_class_prop_set_expr(self, set):
+		set.obj.accept(self)
+		set.value.accept(self)
+
+
+	def visit_index_get_expr(self, get):
+		get.obj.accept(self)
+		get.index.accept(self)
+
+
+	def visit_index_set_expr(self, set):
+		set.obj.accept(self)
+		set.index.accept(self)
+		set.value.accept(self)
+
+
+	def visit_map_expr(self, map):
+		for expr in map.keys + map.values:
+			expr.accept(self)
+
+
+	def visit_this_expr(self, this):
+		self.resolve_local(this, "this")
+		if this.depth is None:
+			print(f"[line {this.name.line}] Can't use 'this' outside of a method")
+			sys.exit(12)
+
+
+	# statements part
+	def visit_print_stmt(self, printt):
+		printt.expr.accept(self)
+
+
+	def visit_expr_stmt(self, expr_stmt):
+		expr_stmt.expr.accept(self)
+
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is not None:
+			var_decl.init.accept(self)
+		var_decl.slot = self.declare(var_decl.name)
+
+
+	def visit_block_stmt(self, block):
+		if not self.declares_variables(block.statements):
+			# frame_size stays 0, the block runs in the enclosing frame
+			for stmt in block.statements:
+				stmt.accept(self)
+			return
+
+		self.begin_scope(block)
+		self.hoist_functions(block.statements)
+		for stmt in block.statements:
+			stmt.accept(self)
+		block.frame_size = self.end_scope()
+
+
+	def visit_if_stmt(self, if_stmt):
+		if_stmt.condition.accept(self)
+		if_stmt.if_true.accept(self)
+		if if_stmt.if_false is not None:
+			if_stmt.if_false.accept(self)
+
+
+	def visit_while_stmt(self, while_stmt):
+		while_stmt.condition.accept(self)
+		while_stmt.body.accept(self)
+
+
+	def visit_func_decl_stmt(self, func_decl):
+		# declared before its body is resolved, so it can call itself
+		func_decl.slot = self.declare(func_decl.name.lexeme)
+		self.resolve_function(func_decl)
+
+
+	def visit_return_stmt(self, ret):
+		if ret.value is not None:
+			ret.value.accept(self)
+		ret.tail_call = self.in_function and isinstance(ret.value, FunctionCallExpr)
+
+
+	def visit_class_decl_stmt(self, cls):
+		cls.slot = self.declare(cls.name.lexeme)
+
+		self.begin_scope()
+		self.declare("this")
+		for method in cls.funcs:
+			self.resolve_function(method)
+		self.end_scope()
@@ -0,0 +1,87 @@
+'''
+Strings built up by repeated `+`, kept as a list of pieces until the whole
+string is needed.
+'''
+
+
+# shorter results of `+` are plain strings, copying them is cheaper than a Rope
+ROPE_MIN = 1024
+
+
+class Rope:
+	__slots__ = ("parts", "count", "length")
+
+	def __init__(self, parts, count, length):
+		# ropes grown from one another share this list, each using its first `count` pieces
+		self.parts = parts
+		self.count = count
+		self.length = length
+
+
+	def flatten(self):
+		parts = self.parts
+		if self.count == 1:
+			return parts[0]
+
+		flat = "".join(parts) if self.count == len(parts) else "".join(parts[:self.count])
+		# the other ropes on the old list keep it, this one starts a new list
+		self.parts = [flat]
+		self.count = 1
+		return flat
+
+
+	def __len__(self):
+		return self.length
+
+
+	def __str__(self):
+		return self.flatten()
+
+
+	def __repr__(self):
+		return repr(self.flatten())
+
+
+	# equal to a rope or string with the same characters, and a map key
+	# matching that string's
+	def __eq__(self, other):
+		if type(other) is Rope:
+			return self.length == other.length and self.flatten() == other.flatten()
+		return self.flatten() == other
+
+
+	def __ne__(self, other):
+		return not self == other
+
+
+	def __hash__(self):
+		return hash(self.flatten())
+
+
+def plain(value):
+	'''
+	`value` with a Rope turned into its string, for code that needs a str.
+	'''
+	return value.flatten() if type(value) is Rope else value
+
+
+def concat(left, right):
+	'''
+	`left + right` for two strings or ropes.
+	'''
+	if type(right) is Rope:
+		right = right.flatten()
+
+	if type(left) is not Rope:
+		length = len(left) + len(right)
+		if length < ROPE_MIN:
+			return left + right
+		return Rope([left, right], 2, length)
+
+	parts = left.parts
+	count = left.count
+	if count != len(parts):
+		# a newer rope is already using the rest of the list
+		parts = parts[:count]
+	parts.append(right)
+	return Rope(parts, count + 1, left.length + len(right))
@@ -0,0 +1,109 @@
+'''
+Sampling profiler for Plox programs, enabled with `plox.py --sample FILE`,
+writing the Plox stacks it sees in folded stack format.
+'''
+import sys
+import threading
+from collections import Counter
+
+
+ROOT_FRAME = "<script>"
+
+
+class SamplingProfiler:
+	def __init__(self, interval):
+		self.interval = interval
+		# code objects of the frames a Plox stack is read from
+		self.call_code = None
+		self.execute_code = None
+		# the closure engine's, see ClosureCompiler.track_line()
+		self.lines = dict()
+
+		self.samples = Counter()
+		self.stopped = threading.Event()
+		self.thread = None
+		self.thread_id = None
+
+
+	def install(self, interp):
+		'''
+		Nothing runs on the script's side while sampling, the closure engine
+		only marks which statement each of its closures runs.
+		'''
+		from callable import PloxFunction
+		from interpreter import Interpreter
+		from closure_compiler import ClosureInterpreter
+
+		self.call_code = PloxFunction.__dict__["call"].__code__
+		self.execute_code = Interpreter.execute.__code__
+		if isinstance(interp, ClosureInterpreter):
+			interp.compiler.lines = self.lines
+
+
+	def start(self):
+		self.thread_id = threading.get_ident()
+		self.thread = threading.Thread(target=self.run, name="plox-sampler", daemon=True)
+		self.thread.start()
+
+
+	def stop(self):
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is not None:
+				self.sample(frame)
+
+
+	def sample(self, frame):
+		'''
+		Walks the Python stack from the innermost frame out. A statement's
+		frame gives the line its Plox function is at, a call of a
+		PloxFunction ends that function's frame.
+		'''
+		call_code = self.call_code
+		execute_code = self.execute_code
+		lines = self.lines
+
+		stack = list()
+		line = None
+		while frame is not None:
+			code = frame.f_code
+			if code is execute_code:
+				if line is None:
+					line = frame.f_locals["stmt"].line
+			elif line is None and id(code) in lines:
+				line = lines[id(code)][1]
+			elif code is call_code:
+				local_vars = frame.f_locals
+				# `function` is the one running after a tail call, unset right on entry
+				declaration = local_vars.get("function", local_vars["self"]).declaration
+				name = declaration.name.lexeme if declaration.name is not None else "<anonymous>"
+				stack.append((name, line if line is not None else declaration.line or 0))
+				line = None
+			frame = frame.f_back
+
+		stack.append((ROOT_FRAME, line or 0))
+		stack.reverse()
+		self.samples[tuple(stack)] += 1
+
+
+	def folded(self):
+		'''
+		Samples in folded stack format, one "frame;frame;... count" line per
+		distinct stack.
+		'''
+		lines = list()
+		for stack, count in self.samples.items():
+			lines.append(";".join(f"{name}:{line}" for name, line in stack) + f" {count}")
+		lines.sort()
+		return "\n".join(lines) + ("\n" if lines else "")
+
+
+	def write(self, path):
+		with open(path, "w") as f:
+			f.write(self.folded())
@@ -1,5 +1,7 @@
 from typing import List, Dict, Tuple
 from enum import Enum
+import re
+from itertools import repeat
 
 had_error: bool = False
 
@@ -61,6 +63,13 @@ class TokenType(Enum):
 	EOF = 45
 	ENUM = 46
 
+	# indexing
+	LEFT_BRACKET = 47
+	RIGHT_BRACKET = 48
+
+	# map literals
+	COLON = 49
+
 
 KEYWORDS = {
 	'and': TokenType.AND,
@@ -84,6 +93,8 @@ KEYWORDS = {
 
 
 class Token:
+	__slots__ = ("token_type", "lexeme", "literal", "line")
+
 	def __init__(self, tok_type: TokenType, lexeme: str, literal: object, line: int):
 		self.token_type = tok_type
 		self.lexeme = lexeme
@@ -94,188 +105,123 @@ class Token:
 		return f"{self.token_type} {self.lexeme} {self.literal}"
 
 
+# one or two character tokens
+OPERATORS = {
+	'(': TokenType.LEFT_PAREN,
+	')': TokenType.RIGHT_PAREN,
+	'{': TokenType.LEFT_BRACE,
+	'}': TokenType.RIGHT_BRACE,
+	'[': TokenType.LEFT_BRACKET,
+	']': TokenType.RIGHT_BRACKET,
+	',': TokenType.COMMA,
+	'.': TokenType.DOT,
+	'-': TokenType.MINUS,
+	'+': TokenType.PLUS,
+	';': TokenType.SEMICOLON,
+	':': TokenType.COLON,
+	'/': TokenType.SLASH,
+	'*': TokenType.STAR,
+	'&': TokenType.BIT_AND,
+	'|': TokenType.BIT_OR,
+	'^': TokenType.BIT_XOR,
+	'~': TokenType.BIT_NEGATE,
+	'!': TokenType.NOT,
+	'!=': TokenType.NOT_EQUAL,
+	'=': TokenType.EQUAL,
+	'==': TokenType.EQUAL_EQUAL,
+	'>': TokenType.GREATER,
+	'>=': TokenType.GREATER_EQUAL,
+	'>>': TokenType.BIT_SHIFT_RIGHT,
+	'<': TokenType.LESS,
+	'<=': TokenType.LESS_EQUAL,
+	'<<': TokenType.BIT_SHIFT_LEFT,
+}
+
+
+# tokens whose type only depends on their text
+FIXED_TOKENS = {**OPERATORS, **KEYWORDS}
+
+
+# Every match is one token, or a newline or block comment, together with
+# the spaces and line comments before it. `\Z` matches whatever is left
+# after the last token.
+TOKEN_REGEX = re.compile(r'''
+	(?:[ \t\r]+ | //[^\n]*)*
+	(
+		\n
+		| [^\W\d]\w*
+		| [!=<>]= | << | >>
+		| [0-9]+ (?:\.[0-9]+)?
+		| "[^"]*"
+		| /\*.*?\*/ | /\*
+		| .
+		| \Z
+	)
+''', re.VERBOSE | re.DOTALL)
+
+
 class Scanner:
+	'''
+	Matches the source against TOKEN_REGEX one token at a time and sorts
+	each match out by its text, instead of making a method call per
+	character.
+	'''
 	def __init__(self, source: str):
 		self.source: str = source
 		self.tokens: List[Token] = list()
-		self.current = 0
-		self.start = 0
 		self.line = 1
+		self.had_error = False
 
 	def scan_tokens(self):
-		while not self.is_at_end():
-			self.start = self.current
-			self.scan_token()
-
-		_eof = Token(TokenType.EOF, "", None, self.line)
-		self.tokens.append(_eof)
+		self.tokens.extend(self.iter_tokens())
 		return self.tokens
 
-	def scan_token(self):
-		c = self.advance()
-
-		if c == "(":
-			self.add_token(TokenType.LEFT_PAREN)
-
-		elif c == ")":
-			self.add_token(TokenType.RIGHT_PAREN)
-
-		elif c == "{":
-			self.add_token(TokenType.LEFT_BRACE)
-
-		elif c == "}":
-			self.add_token(TokenType.RIGHT_BRACE)
-
-		elif c == ",":
-			self.add_token(TokenType.COMMA)
-
-		elif c == ".":
-			self.add_token(TokenType.DOT)
-
-		elif c == "-":
-			self.add_token(TokenType.MINUS)
-
-		elif c == "+":
-			self.add_token(TokenType.PLUS)
-
-		elif c == ";":
-			self.add_token(TokenType.SEMICOLON)
-
-		elif c == "*":
-			self.add_token(TokenType.STAR)
-
-		elif c == "&":
-			self.add_token(TokenType.BIT_AND)
-
-		elif c == "|":
-			self.add_token(TokenType.BIT_OR)
-
-		elif c == "^":
-			self.add_token(TokenType.BIT_XOR)
-
-		elif c == "~":
-			self.add_token(TokenType.BIT_NEGATE)
-
-		elif c == "!":
-			if self.match("="):
-				self.add_token(TokenType.NOT_EQUAL)
-				self.advance()
-			else:
-				self.add_token(TokenType.NOT)
-
-		elif c == "<":
-			if self.match("="):
-				self.add_token(TokenType.LESS_EQUAL)
-				self.advance()
-			elif self.match("<"):
-				self.add_token(TokenType.BIT_SHIFT_LEFT)
-				self.advance()
-			else:
-				self.add_token(TokenType.LESS)
-
-		elif c == ">":
-			if self.match("="):
-				self.add_token(TokenType.GREATER_EQUAL)
-				self.advance()
-			elif self.match(">"):
-				self.add_token(TokenType.BIT_SHIFT_RIGHT)
-				self.advance()
-			else:
-				self.add_token(TokenType.GREATER)
-
-		elif c == "=":
-			if self.match("="):
-				self.add_token(TokenType.EQUAL_EQUAL)
-				self.advance()
-			else:
-				self.add_token(TokenType.EQUAL)
-
-		elif c == "/":
-			if self.match("*"):
-				self.advance()
-				while self.peek() != '*' and self.peek_next() != '/' and not self.is_at_end():
-					if self.peek() == '\n':
-						self.line += 1
-					self.advance()
-
-				if self.is_at_end():
-					print(f'[line {self.line}]: Error: Unterminated multiline comment')
-
-				self.advance() # for *
-				self.advance() # for /
-			elif self.match("/"):
-				self.advance()
-				while self.peek() != '\n' and not self.is_at_end():
-					self.advance()
-			else:
-				self.add_token(TokenType.SLASH)
-
-		elif c == '\n':
-			self.line += 1
-
-		elif c == '"':
-			while self.peek() != '"' and not self.is_at_end():
-				if self.peek() == '\n':
-					self.line += 1
-				self.advance()
-
-			if self.is_at_end():
-				print(f"[line {self.line}]: Error: Unterminated string")
-				return
-
-			self.advance() # advancing the closing "
-			self.add_token(TokenType.STRING, self.source[self.start + 1: self.current - 1])
-
-		elif c.isdigit():
-				while self.peek().isdigit():
-					self.advance()
-				if self.peek() == '.' and self.peek_next().isdigit():
-					self.advance()
-					while self.peek().isdigit():
-						self.advance()
-					self.add_token(TokenType.NUMBER, float(self.source[self.start:self.current]))
-				else:
-					self.add_token(TokenType.NUMBER, int(self.source[self.start:self.current]))
-
-		elif c.isalpha() or c == "_":
-			while self.peek().isalnum() or self.peek() == "_":
-				self.advance()
-			text = self.source[self.start:self.current]
-			typ = KEYWORDS.get(text)
-			if typ is None:
-				typ = TokenType.IDENTIFIER
-			self.add_token(typ)
-
-		else:
-			if c == ' ' or '\r' or '\t':
-				return
-			else:
-				print(f"[line: {self.line}]: Error: Unexpected character")
-
-
-	def advance(self):
-		result = self.source[self.current] if self.current < len(self.source) else '\0'
-		self.current += 1
-		return result
-
-
-	def match(self, ch):
-		return not self.is_at_end() and ch == self.source[self.current]
-
-
-	def peek(self):
-		return '\0' if self.is_at_end() else self.source[self.current]
-
-
-	def peek_next(self):
-		return self.source[self.current + 1] if (self.current + 1) < len(self.source) else '\0'
-
-
-	def add_token(self, token_type, literal=None):
-		lexeme = self.source[self.start:self.current]
-		token = Token(token_type, lexeme, literal, self.line)
-		self.tokens.append(token)
-
-
-	def is_at_end(self):
-		return self.current >= len(self.source)
+	def iter_tokens(self):
+		'''
+		Generator version of scan_tokens(), yields each token as soon as it's
+		matched so the whole list never has to exist.
+		'''
+		fixed_type = FIXED_TOKENS.get
+		line = self.line
+
+		for text in map(re.Match.group, TOKEN_REGEX.finditer(self.source), repeat(1)):
+			typ = fixed_type(text)
+			if typ is not None:
+				yield Token(typ, text, None, line)
+				continue
+
+			if text == '\n':
+				line += 1
+				continue
+
+			c = text[:1]
+			if c.isdigit():
+				yield Token(TokenType.NUMBER, text, float(text) if '.' in text else int(text), line)
+
+			elif c == '"':
+				if text == '"':
+					line = self.line + self.source.count('\n')
+					print(f"[line {line}]: Error: Unterminated string")
+					self.had_error = True
+					break
+
+				# multiline strings get the line they end on
+				line += text.count('\n')
+				yield Token(TokenType.STRING, text, text[1:-1], line)
+
+			elif c == '/':
+				if text == '/*':
+					line = self.line + self.source.count('\n')
+					print(f'[line {line}]: Error: Unterminated multiline comment')
+					self.had_error = True
+					break
+				line += text.count('\n')
+
+			elif c.isalpha() or c == '_':
+				yield Token(TokenType.IDENTIFIER, text, None, line)
+
+			# any other character is skipped
+
+		self.line = line
+		_eof = Token(TokenType.EOF, "", None, self.line)
+		yield _eof
@@ -3,6 +3,8 @@ import os
 from typing import List
 
 from scanner import Token, TokenType
+from operators import binary_operator, unary_operator
+from instance import PropertyCache
 
 class ExprVisitor:
 	def visit_assign_expr(self, assign):
@@ -38,6 +40,18 @@ class ExprVisitor:
 	def visit_class_prop_set_expr(self, set):
 		pass
 
+	def visit_this_expr(self, this):
+		pass
+
+	def visit_index_get_expr(self, get):
+		pass
+
+	def visit_index_set_expr(self, set):
+		pass
+
+	def visit_map_expr(self, map):
+		pass
+
 
 # Expressions in program
 class Expr:
@@ -49,6 +63,9 @@ class AssignExpr(Expr):
 	def __init__(self, name: Token, value: Expr):
 		self.name = name
 		self.value = value
+		# filled in by Resolver, depth None means a global
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor: ExprVisitor):
 		return visitor.visit_assign_expr(self)
@@ -59,6 +76,8 @@ class BinaryExpr(Expr):
 		self.right_expr = expr_right
 		self.operator = operator
 		self.left_expr = expr_left
+		# handler for the operator, see operators.py
+		self.operate = binary_operator(operator.token_type)
 
 	def accept(self, visitor):
 		return visitor.visit_binary_expr(self)
@@ -68,6 +87,7 @@ class UnaryExpr(Expr):
 	def __init__(self, operator: Token, right: Expr):
 		self.operator = operator
 		self.right = right
+		self.operate = unary_operator(operator.token_type)
 
 	def accept(self, visitor: ExprVisitor):
 		return  visitor.visit_unary_expr(self)
@@ -92,6 +112,9 @@ class GroupingExpr(Expr):
 class VariableExpr(Expr):
 	def __init__(self, name: Token):
 		self.name = name
+		# filled in by Resolver, depth None means a global
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor):
 		return visitor.visit_variable_expr(self)
@@ -127,9 +150,11 @@ class FunctionCallExpr(Expr):
 
 
 class AnonFunctionExpr(Expr):
-	def __init__(self, params, body):
+	def __init__(self, params, body, line=None):
 		self.parameters = params
 		self.body = body
+		self.line = line
+		self.frame_size = 0
 
 	def accept(self, visitor: ExprVisitor):
 		return visitor.visit_anon_func_expr(self)
@@ -139,9 +164,10 @@ class ClassPropertyGetExpr(Expr):
 	def __init__(self, obj, name):
 		self.obj = obj
 		self.name = name
+		self.cache = PropertyCache(name.lexeme)
 
 	def accept(self, visitor: ExprVisitor):
-		visitor.visit_class_prop_get_expr(self)
+		return visitor.visit_class_prop_get_expr(self)
 
 
 class ClassPropertySetExpr(Expr):
@@ -149,10 +175,55 @@ class ClassPropertySetExpr(Expr):
 		self.obj = obj
 		self.name = name
 		self.value = value
+		self.cache = PropertyCache(name.lexeme)
+
+	def accept(self, visitor: ExprVisitor):
+		return visitor.visit_class_prop_set_expr(self)
+
+
+class ThisExpr(Expr):
+	def __init__(self, keyword: Token):
+		# named like VariableExpr's, `this` is looked up like a variable
+		self.name = keyword
+		# filled in by Resolver, always a local of the method's frame or above
+		self.depth = None
+		self.slot = None
+
+	def accept(self, visitor: ExprVisitor):
+		return visitor.visit_this_expr(self)
+
+
+class IndexGetExpr(Expr):
+	def __init__(self, obj, bracket: Token, index):
+		self.obj = obj
+		# the '[', for the line of errors
+		self.bracket = bracket
+		self.index = index
+
+	def accept(self, visitor: ExprVisitor):
+		return visitor.visit_index_get_expr(self)
+
+
+class IndexSetExpr(Expr):
+	def __init__(self, obj, bracket: Token, index, value):
+		self.obj = obj
+		self.bracket = bracket
+		self.index = index
+		self.value = value
+
+	def accept(self, visitor: ExprVisitor):
+		return visitor.visit_index_set_expr(self)
+
+
+class MapExpr(Expr):
+	def __init__(self, brace: Token, keys, values):
+		self.brace = brace
+		self.keys = keys
+		self.values = values
 
 	def accept(self, visitor: ExprVisitor):
-		visitor.visit_class_prop_set_expr(self)
-		
+		return visitor.visit_map_expr(self)
+
 
 # Statements in program
 class StmtVisitor:
@@ -185,6 +256,9 @@ class StmtVisitor:
 
 
 class Stmt:
+	# line of the statement's first token, set by the parser
+	line = None
+
 	def accept(self, visitor: StmtVisitor):
 		pass
 
@@ -194,7 +268,7 @@ class PrintStmt(Stmt):
 		self.expr = expr
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_print_stmt(self)
+		return visitor.visit_print_stmt(self)
 
 
 class ExprStmt(Stmt):
@@ -202,24 +276,30 @@ class ExprStmt(Stmt):
 		self.expr = expr
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_expr_stmt(self)
+		return visitor.visit_expr_stmt(self)
 
 
 class VarDeclareStmt(Stmt):
 	def __init__(self, name: str, init: Expr):
 		self.name = name
 		self.init = init
+		self.slot = None
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_var_declare_stmt(self)
+		return visitor.visit_var_declare_stmt(self)
 
 
 class BlockStmt(Stmt):
 	def __init__(self, stmts: List[Stmt]):
 		self.statements = stmts
+		# filled in by Resolver, a frame_size of 0 means no scope of its own
+		self.frame_size = 0
+		self.captured = False
+		# released frames, reused by later runs of an uncaptured block
+		self.frame_pool: List[object] = list()
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_block_stmt(self)
+		return visitor.visit_block_stmt(self)
 
 
 class IfStmt(Stmt):
@@ -229,7 +309,7 @@ class IfStmt(Stmt):
 		self.if_false = if_false
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_if_stmt(self)
+		return visitor.visit_if_stmt(self)
 
 
 class WhileStmt(Stmt):
@@ -238,7 +318,7 @@ class WhileStmt(Stmt):
 		self.body = body
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_while_stmt(self)
+		return visitor.visit_while_stmt(self)
 
 
 class FunctionDeclStmt(Stmt):
@@ -246,34 +326,67 @@ class FunctionDeclStmt(Stmt):
 		self.name = name
 		self.parameters = params
 		self.body = body
+		self.slot = None
+		self.frame_size = 0
+		# line of the declaration, anonymous functions have no name token to take it from
+		self.line = name.line if name is not None else None
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_func_decl_stmt(self)
+		return visitor.visit_func_decl_stmt(self)
 
 
 class ClassDeclStmt(Stmt):
 	def __init__(self, name, funcs):
 		self.name = name
 		self.funcs = funcs
+		self.slot = None
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_class_decl_stmt(self)
+		return visitor.visit_class_decl_stmt(self)
 
 
 class ReturnStmt(Stmt):
 	def __init__(self, keyword, value):
 		self.keyword = keyword
 		self.value = value
+		# `return f(...);` inside a function, set by the resolver
+		self.tail_call = False
 
 	def accept(self, visitor: StmtVisitor):
-		visitor.visit_return_stmt(self)
+		return visitor.visit_return_stmt(self)
+
+
+def branch_declarations(stmt):
+	'''
+	Names an unbraced if/while body declares, which belong to the scope
+	around it, looking through the unbraced ifs and whiles nested in it.
+	'''
+	if isinstance(stmt, VarDeclareStmt):
+		return [stmt.name]
+	if isinstance(stmt, (FunctionDeclStmt, ClassDeclStmt)):
+		return [stmt.name.lexeme]
+	if isinstance(stmt, IfStmt):
+		names = branch_declarations(stmt.if_true)
+		if stmt.if_false is not None:
+			names += branch_declarations(stmt.if_false)
+		return names
+	if isinstance(stmt, WhileStmt):
+		return branch_declarations(stmt.body)
+	return []
 
 
 # For debugging purpose only
-class ASTPrinter(ExprVisitor):
+class ASTPrinter(ExprVisitor, StmtVisitor):
 	def printer(self, expr: Expr):
 		return expr.accept(self)
 
+	def print_stmts(self, stmts: List[Stmt], indent=0):
+		lines = list()
+		for stmt in stmts:
+			out = stmt.accept(self)
+			lines.extend("\t" * indent + line for line in out.split("\n"))
+		return "\n".join(lines)
+
 	def visit_unary_expr(self, unary):
 		return self.parenthesize(unary.operator.lexeme, unary.right)
 
@@ -281,6 +394,8 @@ class ASTPrinter(ExprVisitor):
 		return self.parenthesize(binary.operator.lexeme, binary.left_expr, binary.right_expr)
 
 	def visit_literal_expr(self, literal):
+		if isinstance(literal.value, str):
+			return f'"{literal.value}"'
 		return str(literal.value)
 
 	def visit_logical_expr(self, logical):
@@ -290,7 +405,78 @@ class ASTPrinter(ExprVisitor):
 		return self.parenthesize("g", group.expr)
 
 	def visit_assign_expr(self, assign):
-		return self.parenthesize("var", assign.value)
+		return self.parenthesize(f"= {assign.name.lexeme}", assign.value)
+
+	def visit_variable_expr(self, var):
+		return var.name.lexeme
+
+	def visit_func_call_expr(self, func):
+		return self.parenthesize("call", func.callee, *func.arguments)
+
+	def visit_anon_func_expr(self, anon):
+		return self.function("fun", anon.parameters, anon.body)
+
+	def visit_class_prop_get_expr(self, get):
+		return self.parenthesize(f". {get.name.lexeme}", get.obj)
+
+	def visit_class_prop_set_expr(self, set):
+		return self.parenthesize(f".= {set.name.lexeme}", set.obj, set.value)
+
+	def visit_this_expr(self, this):
+		return "this"
+
+	def visit_index_get_expr(self, get):
+		return self.parenthesize("[]", get.obj, get.index)
+
+	def visit_index_set_expr(self, set):
+		return self.parenthesize("[]=", set.obj, set.index, set.value)
+
+	def visit_map_expr(self, map):
+		entries = [expr for entry in zip(map.keys, map.values) for expr in entry]
+		return self.parenthesize("map", *entries)
+
+	def visit_print_stmt(self, printt):
+		return self.parenthesize("print", printt.expr)
+
+	def visit_expr_stmt(self, expr_stmt):
+		return expr_stmt.expr.accept(self)
+
+	def visit_var_declare_stmt(self, var_decl):
+		if var_decl.init is None:
+			return f"( var {var_decl.name} )"
+		return self.parenthesize(f"var {var_decl.name}", var_decl.init)
+
+	def visit_block_stmt(self, block):
+		return self.block("block", block.statements)
+
+	def visit_if_stmt(self, if_stmt):
+		output = self.block(f"if {if_stmt.condition.accept(self)}", [if_stmt.if_true])
+		if if_stmt.if_false is not None:
+			output += "\n" + self.block("else", [if_stmt.if_false])
+		return output
+
+	def visit_while_stmt(self, while_stmt):
+		return self.block(f"while {while_stmt.condition.accept(self)}", [while_stmt.body])
+
+	def visit_func_decl_stmt(self, func_decl):
+		return self.function(f"fun {func_decl.name.lexeme}", func_decl.parameters, func_decl.body)
+
+	def visit_return_stmt(self, ret):
+		if ret.value is None:
+			return "( return )"
+		return self.parenthesize("return tail" if ret.tail_call else "return", ret.value)
+
+	def visit_class_decl_stmt(self, cls):
+		return self.block(f"class {cls.name.lexeme}", cls.funcs)
+
+	def function(self, name, params, body):
+		return self.block(f"{name}({', '.join(param.lexeme for param in params)})", body)
+
+	def block(self, name, stmts):
+		body = self.print_stmts(stmts, 1)
+		if not body:
+			return f"( {name} )"
+		return f"( {name}\n{body}\n)"
 
 	def parenthesize(self, name, *exprs):
 		output = f"("
@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# the interpreter's modules sit in the repository root, next to plox.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
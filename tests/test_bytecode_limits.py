@@ -0,0 +1,57 @@
+'''
+Runs generated scripts going past the bytecode's fixed size operands. The
+vm engine stops them with a CompileError before running anything, the
+tree engine runs them.
+'''
+import pytest
+
+from test_engines import run_plox
+
+
+# about 79 KB of bytecode, more than a jump can span
+INCREMENTS = ("x = x" + " + 1" * 64 + ";\n") * 300
+
+
+def many_locals():
+	declarations = "".join(f"\tvar v{i} = {i};\n" for i in range(300))
+	return "fun f() {\n" + declarations + "\treturn v299;\n}\nprint(f());\n", "299"
+
+
+def many_constants():
+	sums = "".join("total = total + " + " + ".join(f"{i + j}.5" for j in range(128)) + ";\n" for i in range(0, 1 << 16, 128))
+	return "var total = 0;\n" + sums + "print(total);\n", "2147483648.0"
+
+
+def long_jump():
+	return "var x = 0;\nif (x == 1) {\n" + INCREMENTS + "}\nprint(x);\n", "0"
+
+
+def long_loop():
+	return "var x = 0;\nwhile (x < 1) {\n" + INCREMENTS + "}\nprint(x);\n", "19200"
+
+
+def many_arguments():
+	return "fun f(a) { return a; }\nprint(f(" + ", ".join(["1"] * 300) + "));\n", "Expected 1 arguments but got 300"
+
+
+LIMITS = (
+	(many_locals, "Too many local variables in function"),
+	(many_constants, "Too many constants in one function"),
+	(long_jump, "Too much code to jump over"),
+	(long_loop, "Loop body too large"),
+	(many_arguments, "Can't have more than 255 arguments"),
+)
+
+
+@pytest.mark.parametrize("make_program, error", LIMITS, ids=[make.__name__ for make, _ in LIMITS])
+def test_compile_error(make_program, error, tmp_path):
+	program, tree_output = make_program()
+	script = tmp_path / "script.plox"
+	script.write_text(program, encoding="utf-8")
+
+	for options in (["--engine", "vm"], ["--disassemble"]):
+		result = run_plox("--no-cache", *options, str(script))
+		assert (result.stdout, result.stderr, result.returncode) == (f"CompileError: {error}\n", "", 12)
+
+	result = run_plox("--no-cache", "--engine", "tree", str(script))
+	assert result.stdout == tree_output + "\n"
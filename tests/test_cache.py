@@ -0,0 +1,77 @@
+'''
+Runs scripts with the parse cache on, checking an edited script is parsed
+again and entries anyone else could have written are never loaded.
+'''
+import os
+import pickle
+import pytest
+
+from test_engines import ENGINES, run_plox
+
+
+class Loud:
+	'''Prints "loaded" when unpickled, standing in for a planted entry.'''
+	def __reduce__(self):
+		return print, ("loaded",)
+
+
+def cache_entry(cache_dir):
+	entries = list(cache_dir.rglob("*.pickle"))
+	assert len(entries) == 1
+	return entries[0]
+
+
+def write_script(tmp_path, text):
+	path = tmp_path / "script.plox"
+	path.write_text(text, encoding="utf-8")
+	return str(path)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_edited_script_is_parsed_again(engine, tmp_path):
+	cache_dir = str(tmp_path / "cache")
+	script = write_script(tmp_path, 'print("one");\n')
+
+	assert run_plox("--engine", engine, "--cache-dir", cache_dir, script).stdout == "one\n"
+	cache_entry(tmp_path / "cache")
+	assert run_plox("--engine", engine, "--cache-dir", cache_dir, script).stdout == "one\n"
+
+	write_script(tmp_path, 'print("two");\n')
+	assert run_plox("--engine", engine, "--cache-dir", cache_dir, script).stdout == "two\n"
+
+
+def test_corrupt_entry_is_rewritten(tmp_path):
+	cache_dir = str(tmp_path / "cache")
+	script = write_script(tmp_path, 'print("one");\n')
+	run_plox("--cache-dir", cache_dir, script)
+
+	entry = cache_entry(tmp_path / "cache")
+	with open(entry, "rb") as f:
+		header = f.readline()
+	with open(entry, "wb") as f:
+		f.write(header + b"not a pickle")
+
+	result = run_plox("--cache-dir", cache_dir, script)
+	assert (result.stdout, result.returncode) == ("one\n", 0)
+	with open(entry, "rb") as f:
+		assert f.read() != header + b"not a pickle"
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file owners to check")
+def test_untrusted_entry_is_not_loaded(tmp_path):
+	cache_dir = str(tmp_path / "cache")
+	script = write_script(tmp_path, 'print("one");\n')
+	run_plox("--cache-dir", cache_dir, script)
+
+	entry = cache_entry(tmp_path / "cache")
+	with open(entry, "rb") as f:
+		header = f.readline()
+	with open(entry, "wb") as f:
+		f.write(header + pickle.dumps(Loud()))
+
+	# a directory anyone can write to, the entry might not be ours
+	os.chmod(os.path.dirname(entry), 0o777)
+	assert run_plox("--cache-dir", cache_dir, script).stdout == "one\n"
+
+	os.chmod(os.path.dirname(entry), 0o755)
+	assert run_plox("--cache-dir", cache_dir, script).stdout == "loaded\none\n"
@@ -0,0 +1,105 @@
+'''
+Runs every program in tests/programs/ on each engine, with and without -O,
+and compares what it prints, its errors when there's a .err file, and its
+exit status with the expected ones.
+'''
+import os
+import re
+import sys
+import select
+import subprocess
+import pytest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PLOX = os.path.join(os.path.dirname(TESTS_DIR), "plox.py")
+PROGRAM_DIR = os.path.join(TESTS_DIR, "programs")
+ENGINES = ("tree", "closure", "vm")
+
+# first line of a program expected to stop with an error, e.g. `// exit 12`
+EXIT_STATUS = re.compile(r"//\s*exit (\d+)")
+# a line naming a Python module the program is skipped without, e.g. `// needs numpy`
+NEEDS = re.compile(r"^//\s*needs (\w+)", re.MULTILINE)
+
+
+def find_programs():
+	return sorted(name for name, ext in map(os.path.splitext, os.listdir(PROGRAM_DIR)) if ext == ".plox")
+
+
+def run_plox(*args, cwd=None):
+	return subprocess.run([sys.executable, PLOX, *args], capture_output=True, text=True, cwd=cwd, timeout=120)
+
+
+def read(name, ext):
+	path = os.path.join(PROGRAM_DIR, name + ext)
+	if not os.path.exists(path):
+		return None
+	with open(path, encoding="utf-8") as f:
+		return f.read()
+
+
+def expected(name):
+	match = EXIT_STATUS.match(read(name, ".plox"))
+	return read(name, ".out"), read(name, ".err"), int(match.group(1)) if match else 0
+
+
+@pytest.mark.parametrize("optimize", (False, True), ids=("plain", "O"))
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", find_programs())
+def test_program(name, engine, optimize, tmp_path):
+	for module in NEEDS.findall(read(name, ".plox")):
+		pytest.importorskip(module)
+
+	options = ["--no-cache", "--engine", engine] + (["-O"] if optimize else [])
+	# programs writing files write them to a directory of their own
+	result = run_plox(*options, os.path.join(PROGRAM_DIR, name + ".plox"), cwd=tmp_path)
+
+	output, errors, status = expected(name)
+	assert result.stdout == output
+	if errors is not None:
+		assert result.stderr == errors
+	assert result.returncode == status
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_unbuffered_output(engine, tmp_path):
+	result = run_plox("--no-cache", "--unbuffered", "--engine", engine, os.path.join(PROGRAM_DIR, "output_error.plox"), cwd=tmp_path)
+
+	output, errors, status = expected("output_error")
+	assert (result.stdout, result.stderr, result.returncode) == (output, errors, status)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="select() only takes sockets on Windows")
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_is_flushed_before_read_line(engine, tmp_path):
+	script = tmp_path / "ask.plox"
+	script.write_text('print("Name?");\nvar name = read_line();\nprint("Hi " + name);\n', encoding="utf-8")
+
+	command = [sys.executable, PLOX, "--no-cache", "--engine", engine, str(script)]
+	with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) as process:
+		# the question has to arrive while the script waits for the answer
+		ready, _, _ = select.select([process.stdout], [], [], 60)
+		assert ready
+		assert process.stdout.readline() == "Name?\n"
+		output, _ = process.communicate("Ada\n", timeout=60)
+
+	assert output == "Hi Ada\n"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_terminal_output_is_line_buffered(engine, tmp_path):
+	pty = pytest.importorskip("pty")
+	script = tmp_path / "progress.plox"
+	script.write_text('print("started");\nsleep(600);\n', encoding="utf-8")
+
+	controller, terminal = pty.openpty()
+	command = [sys.executable, PLOX, "--no-cache", "--engine", engine, str(script)]
+	with subprocess.Popen(command, stdout=terminal) as process:
+		os.close(terminal)
+		try:
+			ready, _, _ = select.select([controller], [], [], 60)
+			assert ready
+			assert os.read(controller, 100).startswith(b"started")
+		finally:
+			process.kill()
+			os.close(controller)
@@ -0,0 +1,40 @@
+'''
+Calls natives with the wrong number of arguments on every engine, directly,
+through a variable and through the natives taking the engine.
+'''
+import pytest
+
+from test_engines import ENGINES, run_plox
+
+
+ARITY_ERRORS = (
+	("print(sqrt(1, 2));", "Expected 1 arguments but got 2"),
+	("print(len());", "Expected 1 arguments but got 0"),
+	("print(clock(1));", "Expected 0 arguments but got 1"),
+	("var f = upper;\nprint(f());", "Expected 1 arguments but got 0"),
+	("print(wait());", "Expected 1 arguments but got 0"),
+	("print(set_timeout(nil));", "Expected 2 arguments but got 1"),
+	("print(cancel(1, 2));", "Expected 1 arguments but got 2"),
+	("var root = memoize(sqrt, nil);\nprint(root());", "Expected 1 arguments but got 0"),
+	# a script's own function with a native's name has its own arity
+	("fun len(a, b) { return a; }\nprint(len(1));", "Expected 2 arguments but got 1"),
+)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("program, error", ARITY_ERRORS, ids=range(len(ARITY_ERRORS)))
+def test_arity(program, error, engine, tmp_path):
+	script = tmp_path / "script.plox"
+	script.write_text(program + "\n", encoding="utf-8")
+
+	result = run_plox("--no-cache", "--engine", engine, str(script))
+	assert (result.stdout, result.returncode) == (error + "\n", 10)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_spawn_without_a_function(engine, tmp_path):
+	script = tmp_path / "script.plox"
+	script.write_text("print(spawn());\n", encoding="utf-8")
+
+	result = run_plox("--no-cache", "--engine", engine, str(script))
+	assert (result.stderr, result.returncode) == ("TypeError: spawn(): expected a function, got NoneType\n", 12)
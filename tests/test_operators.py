@@ -0,0 +1,40 @@
+'''
+Runs scripts whose operators get operands of the wrong types on every
+engine and checks they all stop with the same error.
+'''
+import pytest
+
+from test_engines import ENGINES, run_plox
+
+
+ERRORS = (
+	('print(1 + "a");', "TypeError: unsupported operand type(s) for +: int and str"),
+	('print("a" + 1.5);', "TypeError: unsupported operand type(s) for +: str and float"),
+	("print(nil + 1);", "TypeError: unsupported operand type(s) for +: NoneType and int"),
+	('print(1 - "a");', "TypeError: unsupported operand type(s) for -: int and str"),
+	('print("a" * 1.5);', "TypeError: unsupported operand type(s) for *: str and float"),
+	('print("a" * "b");', "TypeError: unsupported operand type(s) for *: str and str"),
+	("print(1 / 0);", "DivisionByZeroError: division by zero"),
+	("print(1.5 / 0.0);", "DivisionByZeroError: division by zero"),
+	("print(1 & 1.5);", "TypeError: unsupported operand type(s) for &: int and float"),
+	('print(1 < "a");', "TypeError: unsupported operand type(s) for <: int and str"),
+	('print("a" >= 1);', "TypeError: unsupported operand type(s) for >=: str and int"),
+	('print("a" < "b");', "TypeError: unsupported operand type(s) for <: str and str"),
+	("print(nil < nil);", "TypeError: unsupported operand type(s) for <: NoneType and NoneType"),
+	("print(1 == true);", "TypeError: unsupported operand type(s) for ==: int and bool"),
+	("print(1 != nil);", "TypeError: unsupported operand type(s) for !=: int and NoneType"),
+	('print(-"a");', "TypeError: unsupported operand type(s) for -"),
+	# the fast path has run with numbers before the strings come along
+	('var total = 0;\nvar i = 0;\nwhile (i < 3) {\n\tvar step = 1;\n\tif (i == 2) step = "1";\n\ttotal = total + step;\n\ti = i + 1;\n}',
+		"TypeError: unsupported operand type(s) for +: int and str"),
+)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("program, error", ERRORS, ids=range(len(ERRORS)))
+def test_operand_types(program, error, engine, tmp_path):
+	script = tmp_path / "script.plox"
+	script.write_text(program + "\n", encoding="utf-8")
+
+	result = run_plox("--no-cache", "--engine", engine, str(script))
+	assert (result.stdout, result.stderr, result.returncode) == ("", error + "\n", 12)
@@ -0,0 +1,96 @@
+'''
+Checks the syntax tree -O leaves, through `--dump-ast`. That the optimized
+programs still print the same is up to the programs test_engines.py runs.
+'''
+import textwrap
+import pytest
+
+from test_engines import run_plox
+
+
+def dump(tmp_path, program):
+	script = tmp_path / "script.plox"
+	script.write_text(textwrap.dedent(program).replace("    ", "\t"), encoding="utf-8")
+	result = run_plox("--no-cache", "-O", "--dump-ast", str(script))
+	assert result.returncode == 0, result.stderr
+	return result.stdout
+
+
+def expected(tree):
+	return textwrap.dedent(tree).lstrip("\n").replace("    ", "\t")
+
+
+def test_constant_folding(tmp_path):
+	assert dump(tmp_path, '''
+		print(2 * (3 + 4) - -1);
+		print((1 | 6) == 7 and 1.5 < 2);
+		print("con" + "cat");
+		print(1 / 0);
+		print(1 + "a");
+	''') == expected('''
+		( 15 print )
+		( True print )
+		( "concat" print )
+		( ( 1 0 / ) print )
+		( ( 1 "a" + ) print )
+	''')
+
+
+def test_propagation_into_loops(tmp_path):
+	assert dump(tmp_path, '''
+		var step = 2;
+		fun sum(n) {
+		    var scale = step * 5;
+		    var total = 0;
+		    var i = 0;
+		    while (i < n) {
+		        total = total + scale * 2;
+		        i = i + 1;
+		    }
+		    return total;
+		}
+		var changed = 1;
+		changed = changed + 1;
+		print(sum(changed));
+	''') == expected('''
+		( 2 var step )
+		( fun sum(n)
+		    ( 10 var scale )
+		    ( 0 var total )
+		    ( 0 var i )
+		    ( while ( i n < )
+		        ( block
+		            ( ( total 20 + ) = total )
+		            ( ( i 1 + ) = i )
+		        )
+		    )
+		    ( total return )
+		)
+		( 1 var changed )
+		( ( changed 1 + ) = changed )
+		( ( sum changed call ) print )
+	''')
+
+
+def test_dead_code(tmp_path):
+	assert dump(tmp_path, '''
+		fun f(x) {
+		    if (false) print("never");
+		    while (false) print("never");
+		    if (true) print("always"); else print("never");
+		    return x;
+		    print("after return");
+		    var after = 1;
+		    fun hoisted() { return 1; }
+		}
+		print(f(1));
+	''') == expected('''
+		( fun f(x)
+		    ( "always" print )
+		    ( x return )
+		    ( fun hoisted()
+		        ( 1 return )
+		    )
+		)
+		( ( f 1 call ) print )
+	''')
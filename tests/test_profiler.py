@@ -0,0 +1,126 @@
+'''
+Runs scripts with `--profile` on the engines that support it and reads
+back the report or the pstats file it writes.
+'''
+import re
+import pstats
+import pytest
+
+from test_engines import run_plox
+
+
+PROFILED_ENGINES = ("tree", "closure")
+
+PROGRAM = '''
+class Box {
+	fun init(value) { this.value = value; }
+}
+fun fib(n) {
+	if (n < 2) return n;
+	return fib(n - 1) + fib(n - 2);
+}
+fun run() {
+	var box = Box(3);
+	print(fib(15));
+	print(sqrt(16));
+}
+run();
+'''
+
+# a line of the report, ncalls (total/primitive when they differ) and the function
+REPORT_ROW = re.compile(r"^\s*(\d+(?:/\d+)?)(?:\s+[\d.]+){4}\s+(.+)$", re.MULTILINE)
+
+
+def write_script(tmp_path, text):
+	path = tmp_path / "script.plox"
+	path.write_text(text, encoding="utf-8")
+	return str(path)
+
+
+def profile(tmp_path, engine, text, *options):
+	'''
+	Runs `text` with its stats written to a pstats file, returns them keyed
+	by function name.
+	'''
+	output = str(tmp_path / "profile.out")
+	result = run_plox("--no-cache", "--engine", engine, "--profile-output", output, *options, write_script(tmp_path, text))
+	assert result.returncode == 0, result.stderr
+	return {name: stats for (file, line, name), stats in pstats.Stats(output).stats.items()}
+
+
+def report(tmp_path, engine, *options):
+	'''
+	Runs PROGRAM with --profile, returns the rows of the report as
+	(function, ncalls) pairs in the order they're printed.
+	'''
+	write_script(tmp_path, PROGRAM)
+	result = run_plox("--no-cache", "--engine", engine, "--profile", *options, "script.plox", cwd=tmp_path)
+	assert (result.stdout, result.returncode) == ("610\n4.0\n", 0)
+	return [(function, calls) for calls, function in REPORT_ROW.findall(result.stderr)]
+
+
+@pytest.mark.parametrize("engine", PROFILED_ENGINES)
+def test_report(engine, tmp_path):
+	rows = dict(report(tmp_path, engine))
+	assert rows == {
+		"script.plox:5(fib)": "1973/1",
+		"script.plox:9(run)": "1",
+		"script.plox:3(init)": "1",
+		"script.plox:0(<class Box>)": "1",
+		"{native sqrt}": "1",
+	}
+
+
+@pytest.mark.parametrize("engine", PROFILED_ENGINES)
+def test_report_sort(engine, tmp_path):
+	assert report(tmp_path, engine, "--profile-sort", "calls")[0] == ("script.plox:5(fib)", "1973/1")
+	# run includes everything else
+	assert report(tmp_path, engine, "--profile-sort", "cumtime")[0] == ("script.plox:9(run)", "1")
+
+
+def test_unknown_sort_key(tmp_path):
+	result = run_plox("--no-cache", "--profile", "--profile-sort", "slowest", write_script(tmp_path, PROGRAM))
+	assert result.returncode == 2
+	assert "--profile-sort must be one of tottime, cumtime, calls, name" in result.stderr
+
+
+@pytest.mark.parametrize("engine", PROFILED_ENGINES)
+def test_pstats_output(engine, tmp_path):
+	output = str(tmp_path / "profile.out")
+	script = write_script(tmp_path, PROGRAM)
+	result = run_plox("--no-cache", "--engine", engine, "--profile-output", output, script)
+	# the data goes to the file, not to a report
+	assert (result.stdout, result.stderr, result.returncode) == ("610\n4.0\n", "", 0)
+
+	stats = pstats.Stats(output).stats
+	primitive, total, own_time, cumulative, callers = stats[(script, 5, "fib")]
+	assert (primitive, total) == (1, 1973)
+	assert set(callers) == {(script, 5, "fib"), (script, 9, "run")}
+	assert cumulative >= own_time
+	assert stats[("~", 0, "<native sqrt>")][:2] == (1, 1)
+	assert set(stats[(script, 0, "<class Box>")][4]) == {(script, 9, "run")}
+
+
+@pytest.mark.parametrize("engine", PROFILED_ENGINES)
+def test_tail_calls_get_their_own_entry(engine, tmp_path):
+	stats = profile(tmp_path, engine, '''
+fun work(n) {
+	var i = 0;
+	while (i < n) i = i + 1;
+	return i;
+}
+fun main() { return work(20000); }
+fun count(n) {
+	if (n == 0) return 0;
+	return count(n - 1);
+}
+print(main());
+print(count(5));
+''')
+
+	main_calls, _, main_time, _, _ = stats["main"]
+	work_calls, _, work_time, _, _ = stats["work"]
+	assert (main_calls, work_calls) == (1, 1)
+	# the loop runs in work, which main's call was replaced by
+	assert work_time > main_time
+	assert stats["count"][1] == 6
@@ -0,0 +1,84 @@
+'''
+Scans sources with Scanner.iter_tokens() and checks the tokens, their
+lines and the errors it reports.
+'''
+from scanner import Scanner, TokenType
+
+from test_engines import run_plox
+
+
+def tokens(source):
+	return [(token.token_type, token.lexeme, token.line) for token in Scanner(source).iter_tokens()]
+
+
+def test_tokens_and_lines():
+	assert tokens('var x = 1.5;\n// note\nprint(x >= 2);') == [
+		(TokenType.VAR, "var", 1),
+		(TokenType.IDENTIFIER, "x", 1),
+		(TokenType.EQUAL, "=", 1),
+		(TokenType.NUMBER, "1.5", 1),
+		(TokenType.SEMICOLON, ";", 1),
+		(TokenType.PRINT, "print", 3),
+		(TokenType.LEFT_PAREN, "(", 3),
+		(TokenType.IDENTIFIER, "x", 3),
+		(TokenType.GREATER_EQUAL, ">=", 3),
+		(TokenType.NUMBER, "2", 3),
+		(TokenType.RIGHT_PAREN, ")", 3),
+		(TokenType.SEMICOLON, ";", 3),
+		(TokenType.EOF, "", 3),
+	]
+
+
+def test_literals():
+	scanned = list(Scanner('12 3.25 "text"').iter_tokens())
+	assert [token.literal for token in scanned] == [12, 3.25, "text", None]
+
+
+def test_lines_after_multiline_strings_and_comments():
+	source = 'var s = "one\ntwo\nthree";\n/* a\ncomment */ print(s);\nx'
+	assert [(lexeme, line) for _, lexeme, line in tokens(source)] == [
+		("var", 1), ("s", 1), ("=", 1),
+		# a string spanning lines gets the line it ends on
+		('"one\ntwo\nthree"', 3), (";", 3),
+		("print", 5), ("(", 5), ("s", 5), (")", 5), (";", 5),
+		("x", 6), ("", 6),
+	]
+
+
+def test_tokens_come_one_at_a_time():
+	scanner = Scanner('print(1); "never closed')
+	first = next(scanner.iter_tokens())
+	assert first.token_type == TokenType.PRINT
+	# the bad string further on hasn't been seen yet
+	assert not scanner.had_error
+
+
+def test_unterminated_string(capsys):
+	scanner = Scanner('print(1);\nprint("abc\n\nmore);\n')
+	scanned = list(scanner.iter_tokens())
+
+	assert scanner.had_error
+	assert capsys.readouterr().out == "[line 5]: Error: Unterminated string\n"
+	assert [token.lexeme for token in scanned] == ["print", "(", "1", ")", ";", "print", "(", ""]
+	assert scanned[-1].token_type == TokenType.EOF
+
+
+def test_unterminated_comment(capsys):
+	scanner = Scanner("print(1);\n/* never\nclosed")
+	scanned = list(scanner.iter_tokens())
+
+	assert scanner.had_error
+	assert capsys.readouterr().out == "[line 3]: Error: Unterminated multiline comment\n"
+	assert scanned[-1].token_type == TokenType.EOF
+
+
+def test_unknown_characters_are_skipped():
+	assert [lexeme for _, lexeme, _ in tokens("1 @ 2 $ # `")] == ["1", "2", ""]
+
+
+def test_parse_errors_report_lines_after_multiline_strings(tmp_path):
+	script = tmp_path / "script.plox"
+	script.write_text('var s = "a\nb";\nprint(s);\nprint(s;\nprint(1);\n', encoding="utf-8")
+
+	result = run_plox("--no-cache", str(script))
+	assert (result.stdout, result.returncode) == ("[line 4] Expected ')' after expression\n", 12)
@@ -0,0 +1,150 @@
+'''
+NumPy backed vectors, made with the `vec`, `vec_of` and `vec_range` natives.
+NumPy is only imported once a script uses one of them.
+'''
+import array
+import operator
+import errors
+from errors import ErrorType
+
+
+np = None
+
+
+def load_numpy():
+	global np
+	if np is None:
+		try:
+			import numpy
+		except ImportError:
+			errors.runtime_error(ErrorType.PloxImportError, "vectors need NumPy, install it with 'pip install numpy'")
+		numpy.seterr(all="ignore")
+		np = numpy
+	return np
+
+
+class PloxVec:
+	__slots__ = ("data",)
+
+	def __init__(self, data):
+		# a one dimensional numpy.ndarray
+		self.data = data
+
+
+	def __len__(self):
+		return len(self.data)
+
+
+	def __bool__(self):
+		# `if (a == b)` would otherwise be true for any non-empty vecs
+		errors.runtime_error(ErrorType.PloxTypeError, "a vec has no truth value, comparisons are elementwise: use all() or any()")
+
+
+	def __reduce__(self):
+		# a vec sent to another process loads NumPy there too
+		return (wrap, (self.data,))
+
+
+	def __str__(self):
+		return "vec" + np.array2string(self.data, separator=", ")
+
+
+	# == and != of two vecs compare elementwise, like the other operators
+	def __eq__(self, other):
+		return operate("==", operator.eq, self, other)
+
+
+	def __ne__(self, other):
+		return operate("!=", operator.ne, self, other)
+
+
+def wrap(data):
+	load_numpy()
+	return PloxVec(data)
+
+
+def expect_vec(value):
+	if type(value) is not PloxVec:
+		raise TypeError(f"expected a vec, got {type(value).__name__}")
+	return value.data
+
+
+def unwrap(value):
+	if type(value) is PloxVec:
+		return value.data
+	if type(value) is int or type(value) is float:
+		return value
+	raise TypeError
+
+
+def operate(symbol, compute, left, right):
+	'''
+	Applies a binary operator elementwise, one of the operands being a
+	PloxVec.
+	'''
+	try:
+		result = compute(unwrap(left), unwrap(right))
+	except TypeError:
+		# a non-numeric operand, or an operator the dtype lacks like & on floats
+		errors.unsupported_operands_error(symbol, left, right)
+	except ValueError:
+		errors.runtime_error(ErrorType.PloxTypeError, f"{symbol} needs vecs of the same length, got {len(left)} and {len(right)}")
+	return PloxVec(result) if type(result) is np.ndarray else result
+
+
+def operate_unary(symbol, compute, value):
+	try:
+		return PloxVec(compute(value.data))
+	except TypeError:
+		errors.runtime_error(ErrorType.PloxTypeError, f"unsupported operand type(s) for {symbol}")
+
+
+def scalar(value):
+	# numpy scalars to the plain Python numbers Plox works with
+	return value.item() if isinstance(value, np.generic) else value
+
+
+def zeros(size):
+	if type(size) is not int or size < 0:
+		raise ValueError(f"size must be a non-negative integer, got {size}")
+	return PloxVec(load_numpy().zeros(size))
+
+
+def vec_of(arr):
+	import arrays
+
+	# one copy of the array's buffer, in C
+	return PloxVec(load_numpy().array(arrays.expect_array(arr).items))
+
+
+def vec_range(start, end):
+	return PloxVec(load_numpy().arange(start, end))
+
+
+def to_array(vec):
+	import arrays
+
+	data = expect_vec(vec)
+	typecode = "d" if data.dtype.kind == "f" else "q"
+	items = array.array(typecode)
+	items.frombytes(data.astype(typecode).tobytes())
+	return arrays.PloxArray(items)
+
+
+def mean(vec):
+	data = expect_vec(vec)
+	if len(data) == 0:
+		raise ValueError("mean of an empty vec")
+	return scalar(data.mean())
+
+
+def all_of(vec):
+	return bool(expect_vec(vec).all())
+
+
+def any_of(vec):
+	return bool(expect_vec(vec).any())
+
+
+def dot(left, right):
+	return scalar(load_numpy().dot(expect_vec(left), expect_vec(right)))
@@ -0,0 +1,651 @@
+import sys
+import errors
+from bytecode import OpCode, BytecodeFunction
+from bytecode_compiler import BytecodeCompiler, CompileError
+import operators
+from callable import PloxCallable, PloxClass
+from globals import Builtins, NativeFunction, NATIVE_ERRORS
+from output import Output
+from events import running
+from instance import PloxInstance
+from arrays import PloxArray, INDEX_ERRORS, get_index, set_index
+from maps import PloxMap, make_map
+from typing import List
+
+
+# plain ints, so the dispatch loop compares ints instead of enum members
+CONSTANT = OpCode.CONSTANT.value
+NIL = OpCode.NIL.value
+TRUE = OpCode.TRUE.value
+FALSE = OpCode.FALSE.value
+POP = OpCode.POP.value
+GET_LOCAL = OpCode.GET_LOCAL.value
+SET_LOCAL = OpCode.SET_LOCAL.value
+GET_GLOBAL = OpCode.GET_GLOBAL.value
+DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+SET_GLOBAL = OpCode.SET_GLOBAL.value
+GET_UPVALUE = OpCode.GET_UPVALUE.value
+SET_UPVALUE = OpCode.SET_UPVALUE.value
+GET_PROPERTY = OpCode.GET_PROPERTY.value
+SET_PROPERTY = OpCode.SET_PROPERTY.value
+EQUAL = OpCode.EQUAL.value
+NOT_EQUAL = OpCode.NOT_EQUAL.value
+GREATER = OpCode.GREATER.value
+GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+LESS = OpCode.LESS.value
+LESS_EQUAL = OpCode.LESS_EQUAL.value
+ADD = OpCode.ADD.value
+SUBTRACT = OpCode.SUBTRACT.value
+MULTIPLY = OpCode.MULTIPLY.value
+DIVIDE = OpCode.DIVIDE.value
+BIT_AND = OpCode.BIT_AND.value
+BIT_OR = OpCode.BIT_OR.value
+BIT_XOR = OpCode.BIT_XOR.value
+SHIFT_LEFT = OpCode.SHIFT_LEFT.value
+SHIFT_RIGHT = OpCode.SHIFT_RIGHT.value
+NOT = OpCode.NOT.value
+NEGATE = OpCode.NEGATE.value
+BIT_NEGATE = OpCode.BIT_NEGATE.value
+OR = OpCode.OR.value
+AND = OpCode.AND.value
+PRINT = OpCode.PRINT.value
+JUMP = OpCode.JUMP.value
+JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+LOOP = OpCode.LOOP.value
+CALL = OpCode.CALL.value
+CLOSURE = OpCode.CLOSURE.value
+CLOSE_UPVALUE = OpCode.CLOSE_UPVALUE.value
+RETURN = OpCode.RETURN.value
+CLASS = OpCode.CLASS.value
+TAIL_CALL = OpCode.TAIL_CALL.value
+METHOD = OpCode.METHOD.value
+GET_INDEX = OpCode.GET_INDEX.value
+SET_INDEX = OpCode.SET_INDEX.value
+BUILD_MAP = OpCode.BUILD_MAP.value
+
+BITWISE_OPERATORS = {
+	BIT_AND: operators.bit_and,
+	BIT_OR: operators.bit_or,
+	BIT_XOR: operators.bit_xor,
+	SHIFT_LEFT: operators.shift_left,
+	SHIFT_RIGHT: operators.shift_right,
+}
+
+
+class Upvalue:
+	'''
+	Variable captured by a closure. While the variable is still on the
+	stack, `index` points at its slot, once closed the value moves here.
+	'''
+	__slots__ = ("index", "value")
+
+	def __init__(self, index):
+		self.index = index
+		self.value = None
+
+
+class BytecodeClosure(PloxCallable):
+	'''
+	The VM calls closures itself, call() is for Python code calling one,
+	like a memoized function does.
+	'''
+	def __init__(self, function: BytecodeFunction, upvalues: List[Upvalue]):
+		self.function = function
+		self.upvalues = upvalues
+
+
+	def call(self, vm, args):
+		return vm.call_closure(self, self, args)
+
+
+	def arity(self):
+		return self.function.arity
+
+
+	def bind(self, instance):
+		return BoundMethod(instance, self)
+
+
+	def __str__(self):
+		return str(self.function)
+
+
+class BoundMethod(PloxCallable):
+	'''
+	Method read from an instance, calling it puts the instance in slot 0.
+	'''
+	__slots__ = ("receiver", "method")
+
+	def __init__(self, receiver, method):
+		self.receiver = receiver
+		self.method = method
+
+
+	def call(self, vm, args):
+		return vm.call_closure(self.method, self.receiver, args)
+
+
+	def arity(self):
+		return self.method.arity()
+
+
+	def __str__(self):
+		return str(self.method)
+
+
+class CallFrame:
+	__slots__ = ("closure", "ip", "base")
+
+	def __init__(self, closure, ip, base):
+		self.closure = closure
+		self.ip = ip
+		self.base = base
+
+
+class VM:
+	'''
+	Stack based virtual machine running the output of BytecodeCompiler.
+	'''
+	# frames are the VM's own, the limit only stops runaway recursion
+	MAX_FRAMES = 100000
+
+	def __init__(self, buffered=True):
+		self.globals = dict()
+		# natives are added to globals the first time they're looked up
+		self.builtins = Builtins()
+		# stands in for sys.stdout while interpret() runs
+		self.output = Output(buffered)
+
+		self.stack: List[object] = list()
+		self.frames: List[CallFrame] = list()
+		self.open_upvalues = dict()
+		# event loop of the callback natives, made when a script first uses one
+		self.events = None
+
+
+	def interpret(self, stmts):
+		try:
+			script = BytecodeCompiler().compile(stmts)
+		except CompileError as e:
+			print(f"CompileError: {e}")
+			sys.exit(12)
+
+		with self.output, running(self):
+			self.run_script(script)
+
+
+	def run_script(self, script: BytecodeFunction):
+		closure = BytecodeClosure(script, [])
+		self.stack.append(closure)
+		self.frames.append(CallFrame(closure, 0, len(self.stack) - 1))
+		self.run()
+
+
+	def call_closure(self, closure, receiver, args):
+		'''
+		Runs a call of `closure` from Python and returns its result, with
+		`receiver` in the callee's slot. run() returns once that call has.
+		'''
+		function = closure.function
+		if len(args) != function.arity:
+			print(f'Expected {function.arity} arguments but got {len(args)}')
+			sys.exit(10)
+
+		stack = self.stack
+		depth = len(self.frames)
+		self.frames.append(CallFrame(closure, 0, len(stack)))
+		stack.append(receiver)
+		stack.extend(args)
+		return self.run(depth)
+
+
+	def run(self, depth=0):
+		'''
+		Runs frames until the one above `depth` frames returns, and returns
+		its result.
+		'''
+		stack = self.stack
+		push = stack.append
+		pop = stack.pop
+		frames = self.frames
+		globals_ = self.globals
+		write_line = self.output.write_line
+
+		frame = frames[-1]
+		closure = frame.closure
+		code = closure.function.chunk.code
+		constants = closure.function.chunk.constants
+		ip = frame.ip
+		base = frame.base
+
+		while True:
+			op = code[ip]
+			ip += 1
+
+			if op == GET_LOCAL:
+				push(stack[base + code[ip]])
+				ip += 1
+
+			elif op == CONSTANT:
+				push(constants[(code[ip] << 8) | code[ip + 1]])
+				ip += 2
+
+			elif op == SET_LOCAL:
+				stack[base + code[ip]] = stack[-1]
+				ip += 1
+
+			elif op == POP:
+				pop()
+
+			elif op == GET_GLOBAL:
+				name = constants[(code[ip] << 8) | code[ip + 1]]
+				ip += 2
+				try:
+					push(globals_[name])
+				except KeyError:
+					value = self.builtins.lookup(name)
+					if value is None:
+						print(f"Undefined identifier '{name}'")
+					else:
+						globals_[name] = value
+					push(value)
+
+			elif op == SET_GLOBAL:
+				name = constants[(code[ip] << 8) | code[ip + 1]]
+				ip += 2
+				if name in globals_ or self.builtins.lookup(name) is not None:
+					globals_[name] = stack[-1]
+				else:
+					print(f"Undefined identifier '{name}'")
+
+			elif op == GET_UPVALUE:
+				upvalue = closure.upvalues[code[ip]]
+				ip += 1
+				push(stack[upvalue.index] if upvalue.index >= 0 else upvalue.value)
+
+			elif op == SET_UPVALUE:
+				upvalue = closure.upvalues[code[ip]]
+				ip += 1
+				if upvalue.index >= 0:
+					stack[upvalue.index] = stack[-1]
+				else:
+					upvalue.value = stack[-1]
+
+			elif op == JUMP_IF_FALSE:
+				if not pop():
+					ip += (code[ip] << 8) | code[ip + 1]
+				ip += 2
+
+			elif op == LOOP:
+				ip -= (code[ip] << 8) | code[ip + 1]
+				ip += 2
+
+			elif op == JUMP:
+				ip += ((code[ip] << 8) | code[ip + 1]) + 2
+
+			elif op == ADD:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left + right
+				else:
+					stack[-1] = operators.add(left, right)
+
+			elif op == SUBTRACT:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left - right
+				else:
+					stack[-1] = operators.subtract(left, right)
+
+			elif op == LESS:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left < right
+				else:
+					stack[-1] = operators.less(left, right)
+
+			elif op == LESS_EQUAL:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left <= right
+				else:
+					stack[-1] = operators.less_equal(left, right)
+
+			elif op == GREATER:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left > right
+				else:
+					stack[-1] = operators.greater(left, right)
+
+			elif op == GREATER_EQUAL:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left >= right
+				else:
+					stack[-1] = operators.greater_equal(left, right)
+
+			elif op == MULTIPLY:
+				right = pop()
+				left = stack[-1]
+				kind = type(left)
+				if kind is type(right) and (kind is int or kind is float):
+					stack[-1] = left * right
+				else:
+					stack[-1] = operators.multiply(left, right)
+
+			elif op == DIVIDE:
+				right = pop()
+				stack[-1] = operators.divide(stack[-1], right)
+
+			elif op == EQUAL:
+				right = pop()
+				stack[-1] = operators.equal(stack[-1], right)
+
+			elif op == NOT_EQUAL:
+				right = pop()
+				stack[-1] = operators.not_equal(stack[-1], right)
+
+			elif op == CALL:
+				argc = code[ip]
+				call_ip = ip - 1
+				ip += 1
+				callee = stack[-1 - argc]
+
+				if type(callee) is BoundMethod:
+					stack[-1 - argc] = callee.receiver
+					callee = callee.method
+				elif type(callee) is PloxClass:
+					callee = self.instantiate(callee, argc)
+					if callee is None:
+						continue
+
+				if isinstance(callee, BytecodeClosure):
+					function = callee.function
+					if argc != function.arity:
+						print(f'Expected {function.arity} arguments but got {argc}')
+						sys.exit(10)
+
+					if len(frames) >= self.MAX_FRAMES:
+						errors.stack_overflow()
+					frame.ip = ip
+					frame = CallFrame(callee, 0, len(stack) - argc - 1)
+					frames.append(frame)
+					closure = callee
+					code = function.chunk.code
+					constants = function.chunk.constants
+					ip = 0
+					base = frame.base
+
+				elif type(callee) is NativeFunction and callee.argc == argc:
+					args = stack[len(stack) - argc:]
+					del stack[len(stack) - argc - 1:]
+					try:
+						push(callee.function(*args))
+					except NATIVE_ERRORS as e:
+						callee.fail(e)
+
+				elif isinstance(callee, PloxCallable):
+					args = stack[len(stack) - argc:]
+					del stack[len(stack) - argc - 1:]
+					push(callee.call(self, args))
+
+				else:
+					name = closure.function.chunk.call_names.get(call_ip, str(callee))
+					print(f'\'{name}\' is not a function')
+					sys.exit(13)
+
+			elif op == TAIL_CALL:
+				argc = code[ip]
+				call_ip = ip - 1
+				ip += 1
+				callee = stack[-1 - argc]
+
+				if type(callee) is BoundMethod:
+					stack[-1 - argc] = callee.receiver
+					callee = callee.method
+				elif type(callee) is PloxClass:
+					callee = self.instantiate(callee, argc)
+					if callee is None:
+						continue
+
+				if isinstance(callee, BytecodeClosure):
+					function = callee.function
+					if argc != function.arity:
+						print(f'Expected {function.arity} arguments but got {argc}')
+						sys.exit(10)
+
+					# the callee and its arguments take over the returning frame's slots
+					if self.open_upvalues:
+						self.close_upvalues(base)
+					stack[base:] = stack[len(stack) - argc - 1:]
+					frame = CallFrame(callee, 0, base)
+					frames[-1] = frame
+					closure = callee
+					code = function.chunk.code
+					constants = function.chunk.constants
+					ip = 0
+
+				elif type(callee) is NativeFunction and callee.argc == argc:
+					args = stack[len(stack) - argc:]
+					del stack[len(stack) - argc - 1:]
+					try:
+						push(callee.function(*args))
+					except NATIVE_ERRORS as e:
+						callee.fail(e)
+
+				elif isinstance(callee, PloxCallable):
+					args = stack[len(stack) - argc:]
+					del stack[len(stack) - argc - 1:]
+					push(callee.call(self, args))
+
+				else:
+					name = closure.function.chunk.call_names.get(call_ip, str(callee))
+					print(f'\'{name}\' is not a function')
+					sys.exit(13)
+
+			elif op == RETURN:
+				result = pop()
+				if self.open_upvalues:
+					self.close_upvalues(base)
+				del stack[base:]
+				frames.pop()
+
+				if len(frames) == depth:
+					return result
+
+				push(result)
+				frame = frames[-1]
+				closure = frame.closure
+				code = closure.function.chunk.code
+				constants = closure.function.chunk.constants
+				ip = frame.ip
+				base = frame.base
+
+			elif op == NIL:
+				push(None)
+
+			elif op == TRUE:
+				push(True)
+
+			elif op == FALSE:
+				push(False)
+
+			elif op == DEFINE_GLOBAL:
+				globals_[constants[(code[ip] << 8) | code[ip + 1]]] = pop()
+				ip += 2
+
+			elif op == PRINT:
+				write_line(self.stringify(pop()))
+
+			elif op == CLOSURE:
+				function = constants[(code[ip] << 8) | code[ip + 1]]
+				ip += 2
+				upvalues = list()
+				for _ in range(function.upvalue_count):
+					is_local = code[ip]
+					index = code[ip + 1]
+					ip += 2
+					if is_local:
+						upvalues.append(self.capture_upvalue(base + index))
+					else:
+						upvalues.append(closure.upvalues[index])
+				push(BytecodeClosure(function, upvalues))
+
+			elif op == CLOSE_UPVALUE:
+				self.close_upvalues(len(stack) - 1)
+				pop()
+
+			elif op == GET_PROPERTY:
+				cache = constants[(code[ip] << 8) | code[ip + 1]]
+				ip += 2
+				obj = stack[-1]
+				if not isinstance(obj, PloxInstance):
+					print("Only instances can have properties")
+					sys.exit(14)
+				if obj.shape is cache.shape:
+					stack[-1] = obj.values[cache.index]
+				else:
+					stack[-1] = cache.lookup(obj)
+
+			elif op == SET_PROPERTY:
+				cache = constants[(code[ip] << 8) | code[ip + 1]]
+				ip += 2
+				value = pop()
+				obj = stack[-1]
+				if not isinstance(obj, PloxInstance):
+					print("Only instances can have fields")
+					sys.exit(15)
+				if obj.shape is not cache.shape:
+					cache.store(obj, value)
+				elif cache.next_shape is None:
+					obj.values[cache.index] = value
+				else:
+					obj.shape = cache.next_shape
+					obj.values.append(value)
+				stack[-1] = value
+
+			elif op == GET_INDEX:
+				index = pop()
+				obj = stack[-1]
+				if type(obj) is PloxArray and type(index) is int:
+					try:
+						stack[-1] = obj.items[index]
+						continue
+					except INDEX_ERRORS:
+						pass
+				elif type(obj) is PloxMap and type(index) is not bool:
+					try:
+						stack[-1] = obj.entries[index]
+						continue
+					except (KeyError, TypeError):
+						pass
+				stack[-1] = get_index(obj, index)
+
+			elif op == SET_INDEX:
+				value = pop()
+				index = pop()
+				obj = stack[-1]
+				if type(obj) is PloxArray and type(index) is int:
+					try:
+						obj.items[index] = value
+						stack[-1] = value
+						continue
+					except INDEX_ERRORS:
+						pass
+				elif type(obj) is PloxMap and type(index) is not bool:
+					try:
+						obj.entries[index] = value
+						stack[-1] = value
+						continue
+					except TypeError:
+						pass
+				stack[-1] = set_index(obj, index, value)
+
+			elif op == BUILD_MAP:
+				count = 2 * ((code[ip] << 8) | code[ip + 1])
+				ip += 2
+				keys_and_values = stack[len(stack) - count:]
+				del stack[len(stack) - count:]
+				push(make_map(keys_and_values))
+
+			elif op == CLASS:
+				push(PloxClass(constants[(code[ip] << 8) | code[ip + 1]]))
+				ip += 2
+
+			elif op == METHOD:
+				method = pop()
+				stack[-1].methods[constants[(code[ip] << 8) | code[ip + 1]]] = method
+				ip += 2
+
+			elif op in BITWISE_OPERATORS:
+				right = pop()
+				stack[-1] = BITWISE_OPERATORS[op](stack[-1], right)
+
+			elif op == NEGATE:
+				stack[-1] = operators.negate(stack[-1])
+
+			elif op == BIT_NEGATE:
+				stack[-1] = operators.bit_negate(stack[-1])
+
+			elif op == NOT:
+				stack[-1] = operators.logical_not(stack[-1])
+
+			elif op == OR:
+				right = pop()
+				stack[-1] = stack[-1] or right
+
+			elif op == AND:
+				right = pop()
+				stack[-1] = stack[-1] and right
+
+			else:
+				raise RuntimeError(f"Unknown opcode {op}")
+
+
+	def capture_upvalue(self, index):
+		upvalue = self.open_upvalues.get(index)
+		if upvalue is None:
+			upvalue = Upvalue(index)
+			self.open_upvalues[index] = upvalue
+		return upvalue
+
+
+	def instantiate(self, klass, argc):
+		'''
+		Replaces the class being called on the stack with a new instance.
+		Returns the instance's init method, for the caller to call with the
+		arguments still on the stack, or None when the class has no init.
+		'''
+		self.stack[-1 - argc] = PloxInstance(klass)
+
+		init = klass.methods.get("init")
+		if init is None and argc != 0:
+			print(f'Expected 0 arguments but got {argc}')
+			sys.exit(10)
+		return init
+
+
+	def close_upvalues(self, last):
+		for index in [index for index in self.open_upvalues if index >= last]:
+			upvalue = self.open_upvalues.pop(index)
+			upvalue.value = self.stack[index]
+			upvalue.index = -1
+
+
+	def stringify(self, obj):
+		if obj is None:
+			return "nil"
+		return str(obj)